@@ -0,0 +1,214 @@
+# avatars.py
+#
+# Обработка аватаров в фоновом пуле потоков. save_profile только проверяет
+# сигнатуру файла и ставит задачу; запрос отвечает сразу, а профиль получает
+# новое фото, когда варианты готовы.
+#
+# С Pillow: картинка декодируется целиком (битые и «бомбы» отбрасываются),
+# поворачивается по EXIF, метаданные не переносятся, варианты thumb/medium
+# сохраняются в WebP. Без Pillow загрузка аватаров отключена (AvatarsUnavailable):
+# исходный файл с метаданными и в полном размере не публикуется.
+#
+# Имена файлов — по хэшу содержимого: uploads/avatars/<user_id>-<hash>-<variant>.<ext>,
+# такие URL можно кэшировать навсегда.
+
+import functools
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    print("⚠️ Pillow не установлен: загрузка аватаров отключена")
+
+PILLOW_AVAILABLE = Image is not None
+
+# Совпадает с проверкой на клиенте (js/app.js)
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", 5 * 1024 * 1024))
+AVATAR_MAX_PIXELS = int(os.getenv("AVATAR_MAX_PIXELS", 40_000_000))
+AVATAR_WORKERS = int(os.getenv("AVATAR_WORKERS", 2))
+AVATAR_QUALITY = int(os.getenv("AVATAR_QUALITY", 82))
+AVATAR_SUBDIR = "avatars"
+
+# Вариант -> максимальная сторона в пикселях
+AVATAR_VARIANTS = {"thumb": 192, "medium": 640}
+
+if Image is not None:
+    Image.MAX_IMAGE_PIXELS = AVATAR_MAX_PIXELS
+
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class AvatarsUnavailable(RuntimeError):
+    """Нет Pillow: без ресайза и очистки метаданных аватар не сохраняем"""
+
+
+def sniff_format(data: bytes):
+    """Формат по сигнатуре файла (а не по расширению или Content-Type). None, если не картинка"""
+    for signature, ext in _SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def render_variants(data: bytes):
+    """{variant: (bytes, ext)}. InvalidImage, если картинку не удаётся декодировать"""
+    ext = sniff_format(data)
+    if not ext:
+        raise InvalidImage("Unsupported image format")
+    if Image is None:
+        raise AvatarsUnavailable("Pillow is not installed")
+
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            probe.verify()
+        # После verify() объект непригоден — открываем заново; у GIF берётся первый кадр
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    except (Image.DecompressionBombError, OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(str(e))
+
+    variants = {}
+    for variant, size in AVATAR_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        # exif/icc не передаём — метаданные (в т.ч. GPS) в результат не попадают
+        resized.save(buffer, "WEBP", quality=AVATAR_QUALITY, method=4)
+        variants[variant] = (buffer.getvalue(), "webp")
+    return variants
+
+
+class AvatarPipeline:
+    """
+    submit(user_id, data) — быстрая проверка и постановка в очередь.
+    Когда варианты записаны на диск, вызывается on_ready(user_id, paths, is_current), где
+    paths — {variant: "uploads/avatars/..."}. on_ready проверяет is_current() в той же
+    транзакции, что и запись, и возвращает False, если фото не подставлено: пользователь
+    успел загрузить ещё одно, и результат старой задачи выбрасывается.
+    """
+
+    def __init__(self, upload_folder, on_ready, workers: int = AVATAR_WORKERS):
+        self._dir = os.path.join(upload_folder, AVATAR_SUBDIR)
+        os.makedirs(self._dir, exist_ok=True, mode=0o755)
+        self._on_ready = on_ready
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="avatar")
+        self._lock = threading.Lock()
+        self._latest = {}  # user_id -> номер последней задачи
+        self._seq = 0
+        self._pending = 0
+        self.processed = 0
+        self.failed = 0
+        self.superseded = 0
+        self.latency = db.LatencyStats()
+
+    def submit(self, user_id, data: bytes):
+        if not PILLOW_AVAILABLE:
+            raise AvatarsUnavailable("Pillow is not installed")
+        if len(data) > AVATAR_MAX_BYTES:
+            raise InvalidImage("File too large")
+        if not sniff_format(data):
+            raise InvalidImage("Unsupported image format")
+        with self._lock:
+            self._seq += 1
+            token = self._seq
+            self._latest[user_id] = token
+            self._pending += 1
+        return self._executor.submit(self._process, user_id, data, token, time.perf_counter())
+
+    def _process(self, user_id, data, token, started_at):
+        written = []
+        try:
+            with self._lock:
+                if self._latest.get(user_id) != token:
+                    self.superseded += 1
+                    return None
+            variants = render_variants(data)
+            paths = {}
+            for variant, (content, ext) in variants.items():
+                digest = hashlib.sha256(content).hexdigest()[:16]
+                filename = f"{user_id}-{digest}-{variant}.{ext}"
+                target = os.path.join(self._dir, filename)
+                if not os.path.exists(target):
+                    tmp = f"{target}.{token}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(content)
+                    os.replace(tmp, target)
+                    written.append(target)
+                paths[variant] = f"uploads/{AVATAR_SUBDIR}/{filename}"
+
+            # Замок на время записи в БД не держим: on_ready сам повторяет проверку
+            # в транзакции, так что более новая задача не может проскочить между ними.
+            # Файлы не удаляем: новая задача с тем же содержимым могла сослаться на них.
+            # После вызова on_ready не удаляем и при ошибке: db.write мог отвалиться по
+            # таймауту, а транзакция — всё равно закоммититься со ссылкой на эти файлы
+            written = []
+            if not self._on_ready(user_id, paths, functools.partial(self._is_latest, user_id, token)):
+                with self._lock:
+                    self.superseded += 1
+                return None
+            with self._lock:
+                if self._latest.get(user_id) == token:
+                    del self._latest[user_id]
+                self.processed += 1
+            return paths
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"❌ Ошибка обработки аватара {user_id}: {e}")
+            for path in written:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return None
+        finally:
+            self.latency.add(time.perf_counter() - started_at)
+            with self._lock:
+                self._pending -= 1
+
+    def _is_latest(self, user_id, token):
+        with self._lock:
+            return self._latest.get(user_id) == token
+
+    def remove_files(self, *paths):
+        """Удаляет старые варианты аватара (только из uploads/avatars)"""
+        prefix = f"uploads/{AVATAR_SUBDIR}/"
+        for path in paths:
+            if path and path.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self._dir, os.path.basename(path)))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pillow": PILLOW_AVAILABLE,
+                "pending": self._pending,
+                "processed": self.processed,
+                "failed": self.failed,
+                "superseded": self.superseded,
+                "latency": self.latency.stats(),
+            }
@@ -1,21 +1,22 @@
-import sqlite3
+import html
 import os
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from dotenv import load_dotenv
-import asyncio
-import threading
 import json
 from datetime import datetime
-import requests
+import broadcasts
+import db
+import digests
+import outbox
+import posts_search
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 BOT_USERNAME = os.getenv('BOT_USERNAME')
 BACKEND_URL = os.getenv('BACKEND_URL')
-DB_NAME = os.getenv('DB_NAME', 'database.db')
 ADMIN_USER_IDS = [int(x.strip()) for x in os.getenv('ADMIN_USER_IDS', '').split(',') if x.strip()]
 
 bot = None
@@ -31,18 +32,12 @@ def init_bot():
 
 # ============ HELPERS ============
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, timeout=10.0)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def get_user_profile(user_id: int):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
         return dict(row) if row else None
     except Exception as e:
         print(f"❌ Error in get_user_profile: {e}")
@@ -91,15 +86,14 @@ async def cmd_start(message: types.Message):
     elif args and args.startswith('p_'):
         try:
             post_id = int(args[2:])  # Пропустить "p_", взять ID
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT p.content, p.post_type, pr.first_name, pr.user_id
-                FROM posts p JOIN profiles pr ON p.user_id = pr.user_id
-                WHERE p.post_id = ?
-            """, (post_id,))
-            row = cursor.fetchone()
-            conn.close()
+            with db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT p.content, p.post_type, pr.first_name, pr.user_id
+                    FROM posts p JOIN profiles pr ON p.user_id = pr.user_id
+                    WHERE p.post_id = ?
+                """, (post_id,))
+                row = cursor.fetchone()
             
             if row:
                 content = row['content'][:250]
@@ -187,24 +181,21 @@ async def cmd_profile(message: types.Message):
 @dp.message(Command("notifications"))
 async def cmd_notifications(message: types.Message):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT type, message FROM notifications
-            WHERE user_id = ? AND is_read = 0
-            ORDER BY created_at DESC LIMIT 10
-        """, (message.from_user.id,))
-        notifs = cursor.fetchall()
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT type, message FROM notifications
+                WHERE user_id = ? AND is_read = 0
+                ORDER BY created_at DESC LIMIT 10
+            """, (message.from_user.id,))
+            notifs = cursor.fetchall()
         
         if notifs:
-            cursor.execute(
+            await db.execute_write_async(
                 "UPDATE notifications SET is_read = 1 WHERE user_id = ?",
                 (message.from_user.id,)
             )
-            conn.commit()
-        
-        conn.close()
-        
+
         if not notifs:
             await message.answer("🔔 Новых уведомлений нет")
             return
@@ -225,178 +216,119 @@ async def cmd_notifications(message: types.Message):
 
 # ============ NOTIFICATIONS ============
 
+def _url_keyboard(text: str, url: str):
+    """Inline-клавиатура с одной кнопкой-ссылкой (в JSON для outbox)"""
+    return {"inline_keyboard": [[{"text": text, "url": url}]]}
+
+def _post_keyboard(post_id: int):
+    return _url_keyboard(
+        "📖 Открыть пост",
+        f"https://t.me/{os.getenv('BOT_USERNAME')}/{os.getenv('APP_SLUG')}?startapp=p_{post_id}"
+    )
+
+def _preview(text: str, limit: int = 50):
+    return text[:limit] + "..." if len(text) > limit else text
+
+def record_new_follower(conn, user_id: int, follower_id: int, follower_name: str):
+    """Уведомление в ленте + сообщение (сразу или в дайджест, см. digests.py) одной транзакцией"""
+    conn.execute("""
+        INSERT INTO notifications (user_id, type, from_user_id, message)
+        VALUES (?, 'follow', ?, ?)
+    """, (user_id, follower_id, f"{follower_name} подписался на тебя"))
+    # Сообщение и summary дайджеста уходят с parse_mode HTML — имя экранируем
+    name = html.escape(follower_name)
+    digests.route(conn, "follow", user_id, {
+        "text": f"👤 {name} подписался на тебя",
+        "parse_mode": "HTML",
+        "reply_markup": _url_keyboard(
+            "👤 Открыть профиль",
+            f"https://t.me/{BOT_USERNAME}/app?startapp=user{follower_id}"
+        ),
+    }, name)
+
 def notify_new_follower(user_id: int, follower_id: int, follower_name: str):
     try:
-        # 1. Сохраняем в БД
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        msg = f"{follower_name} подписался на тебя"
-        cursor.execute("""
-            INSERT INTO notifications (user_id, type, from_user_id, message)
-            VALUES (?, 'follow', ?, ?)
-        """, (user_id, follower_id, msg))
-        conn.commit()
-        conn.close()
-        
-        # 2. Отправляем через Telegram API напрямую (синхронно)
-        def send_in_thread():
-            try:
-                import requests
-                
-                text = f"👤 {follower_name} подписался на тебя"
-                
-                # Формируем inline keyboard
-                inline_keyboard = {
-                    "inline_keyboard": [[{
-                        "text": "👤 Открыть профиль",
-                        "url": f"https://t.me/{BOT_USERNAME}/app?startapp=user{follower_id}"
-                    }]]
-                }
-                
-                # Отправляем через API
-                url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-                payload = {
-                    "chat_id": user_id,
-                    "text": text,
-                    "parse_mode": "HTML",
-                    "reply_markup": inline_keyboard
-                }
-                
-                response = requests.post(url, json=payload, timeout=10)
-                
-                if not response.ok:
-                    print(f"⚠️ Failed to send notification to {user_id}: {response.text}")
-                    
-            except Exception as e:
-                print(f"⚠️ Failed to send notification to {user_id}: {e}")
-        
-        # Запускаем в отдельном потоке
-        threading.Thread(target=send_in_thread, daemon=True).start()
-        
+        db.write(record_new_follower, user_id, follower_id, follower_name)
+        outbox.wake()
     except Exception as e:
         print(f"❌ Error in notify_new_follower: {e}")
 
-async def notify_followers_new_post(author_id: int, author_name: str, post_id: int, post_content: str):
-    """Уведомить подписчиков о новом посте"""
+def notify_followers_new_post(author_id: int, author_name: str, post_id: int, post_content: str):
+    """Уведомить подписчиков о новом посте: запрос создаёт рассылку, получателей ставит broadcasts.py"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Найти всех подписчиков автора
-        cursor.execute("""
-            SELECT follower_id FROM follows 
-            WHERE following_id = ?
-        """, (author_id,))
-        
-        followers = cursor.fetchall()
-        conn.close()
-        
-        if not followers:
+        with db.connection() as conn:
+            has_followers = conn.execute("""
+                SELECT 1 FROM follows 
+                WHERE following_id = ?
+                LIMIT 1
+            """, (author_id,)).fetchone()
+        
+        if not has_followers:
             return
         
-        # Текст уведомления
-        preview = post_content[:50] + "..." if len(post_content) > 50 else post_content
-        text = f"📝 <b>{author_name}</b> опубликовал пост:\n\n{preview}"
-        
-        # Deep link на пост
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(
-                text="📖 Открыть пост",
-                url=f"https://t.me/{os.getenv('BOT_USERNAME')}/{os.getenv('APP_SLUG')}?startapp=p_{post_id}"
-            )
-        ]])
-        
-        # Отправить всем подписчикам
-        for (follower_id,) in followers:
-            try:
-                await bot.send_message(
-                    chat_id=follower_id,
-                    text=text,
-                    parse_mode="HTML",
-                    reply_markup=keyboard
-                )
-            except Exception as e:
-                print(f"Failed to notify follower {follower_id}: {e}")
+        db.write(broadcasts.create_broadcast, "new_post", author_id, {
+            "text": f"📝 <b>{author_name}</b> опубликовал пост:\n\n{_preview(post_content)}",
+            "parse_mode": "HTML",
+            "reply_markup": _post_keyboard(post_id),
+        })
+        broadcasts.wake()
                 
     except Exception as e:
         print(f"Error in notify_followers_new_post: {e}")
 
 
-async def notify_skill_match(post_id: int, author_name: str, post_content: str, skill_tags: list):
+SKILL_MATCH_DAILY_LIMIT = 5
+
+def log_skill_match_notifications(conn, user_ids, date, post_id):
+    """Пишет поставленные в очередь уведомления одним executemany (в потоке-писателе)"""
+    conn.executemany("""
+        INSERT INTO notification_log (user_id, type, date, post_id)
+        VALUES (?, 'skill_match', ?, ?)
+    """, [(user_id, date, post_id) for user_id in user_ids])
+
+def enqueue_skill_match(conn, user_ids, date, post_id, payload, summary):
+    # Лимит считается по поставленным в очередь: лог и сообщения — одна транзакция
+    digests.route_many(conn, "skill_match", user_ids, payload, summary)
+    log_skill_match_notifications(conn, user_ids, date, post_id)
+
+def notify_skill_match(post_id: int, author_name: str, post_content: str, skill_tags: list):
     """Уведомить пользователей с подходящими скиллами (макс 5 в день)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Найти пользователей с подходящими скиллами
-        skill_tags_lower = [s.lower() for s in skill_tags]
-        
-        cursor.execute("SELECT user_id, skills FROM profiles WHERE skills IS NOT NULL")
-        all_profiles = cursor.fetchall()
-        
-        matched_users = []
-        for user_id, skills_json in all_profiles:
-            try:
-                user_skills = json.loads(skills_json) if skills_json else []
-                user_skills_lower = [s.lower() for s in user_skills]
-                
-                # Проверить есть ли пересечение
-                if any(skill in user_skills_lower for skill in skill_tags_lower):
-                    matched_users.append(user_id)
-            except:
-                continue
-        
-        if not matched_users:
-            conn.close()
+        skill_tags_lower = list(dict.fromkeys(
+            posts_search.normalize_skill(s) for s in skill_tags if str(s).strip()
+        ))
+        if not skill_tags_lower:
             return
-        
-        # Проверить лимит 5 постов в день
+
         today = datetime.now().date().isoformat()
+
+        # Получатели одним запросом: совпадение по индексу user_skills (миграция 8)
+        # и дневной лимит по idx_notif_user_date для каждого кандидата
+        with db.connection() as conn:
+            matched_users = [row[0] for row in conn.execute("""
+                SELECT m.user_id
+                FROM (
+                    SELECT DISTINCT us.user_id
+                    FROM json_each(?) AS tags
+                    CROSS JOIN user_skills us ON us.skill = tags.value
+                ) AS m
+                WHERE (
+                    SELECT COUNT(*) FROM notification_log
+                    WHERE user_id = m.user_id AND date = ? AND type = 'skill_match'
+                ) < ?
+            """, (json.dumps(skill_tags_lower), today, SKILL_MATCH_DAILY_LIMIT)).fetchall()]
         
-        for user_id in matched_users:
-            # Считаем сколько уведомлений сегодня
-            cursor.execute("""
-                SELECT COUNT(*) FROM notification_log 
-                WHERE user_id = ? AND date = ? AND type = 'skill_match'
-            """, (user_id, today))
-            
-            count = cursor.fetchone()[0]
-            
-            if count >= 5:
-                print(f"User {user_id} reached daily limit (5)")
-                continue
-            
-            # Отправить уведомление
-            preview = post_content[:50] + "..." if len(post_content) > 50 else post_content
-            skills_str = ", ".join(skill_tags[:3])  # Показать первые 3 скилла
-            text = f"🎯 Новый пост по вашим навыкам (<b>{skills_str}</b>):\n\n{preview}"
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(
-                    text="📖 Открыть пост",
-                    url=f"https://t.me/{os.getenv('BOT_USERNAME')}/{os.getenv('APP_SLUG')}?startapp=p_{post_id}"
-                )
-            ]])
-            
-            try:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text=text,
-                    parse_mode="HTML",
-                    reply_markup=keyboard
-                )
-                
-                # Логировать отправку
-                cursor.execute("""
-                    INSERT INTO notification_log (user_id, type, date, post_id)
-                    VALUES (?, 'skill_match', ?, ?)
-                """, (user_id, today, post_id))
-                conn.commit()
-                
-            except Exception as e:
-                print(f"Failed to notify user {user_id}: {e}")
-        
-        conn.close()
+        if not matched_users:
+            return
+
+        skills_str = html.escape(", ".join(skill_tags[:3]))  # Показать первые 3 скилла
+        preview = html.escape(_preview(post_content))
+        db.write(enqueue_skill_match, matched_users, today, post_id, {
+            "text": f"🎯 Новый пост по вашим навыкам (<b>{skills_str}</b>):\n\n{preview}",
+            "parse_mode": "HTML",
+            "reply_markup": _post_keyboard(post_id),
+        }, f"{html.escape(author_name)}: {preview}")
+        outbox.wake()
         
     except Exception as e:
         print(f"Error in notify_skill_match: {e}")
@@ -406,8 +338,6 @@ def notify_response_request(author_id: int, sender_id: int, sender_name: str,
                             post_preview: str, message: str, request_id: int):
     """Уведомляет автора о новом запросе на отклик"""
     try:
-        import requests
-        
         text = f"""💬 <b>Новый запрос на отклик</b>
 
 👤 {sender_name} хочет откликнуться на ваш пост:
@@ -423,45 +353,46 @@ def notify_response_request(author_id: int, sender_id: int, sender_name: str,
             ]]
         }
         
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": author_id,
+        outbox.send_later("response_request", author_id, {
             "text": text,
             "parse_mode": "HTML",
             "reply_markup": inline_keyboard
-        }
-        
-        response = requests.post(url, json=payload, timeout=5)
-        
-        if not response.ok:
-            print(f"⚠️ Failed to send response request notification: {response.text}")
+        })
             
     except Exception as e:
         print(f"❌ Error in notify_response_request: {e}")
 
 
 # ============ CALLBACK HANDLERS ============
+def accept_response_request(conn, request_id: int, from_user_id: int, payload: dict):
+    conn.execute("""
+        UPDATE response_requests 
+        SET status = 'accepted'
+        WHERE id = ?
+    """, (request_id,))
+    outbox.enqueue(conn, "request_accepted", from_user_id, payload)
+
 @dp.callback_query(F.data.startswith("accept_req:"))
 async def callback_accept_request(callback: types.CallbackQuery):
     """Обработка принятия запроса"""
     try:
         request_id = int(callback.data.split(":")[1])
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Получаем данные запроса
-        cursor.execute("""
-            SELECT from_user_id, to_user_id, post_id
-            FROM response_requests
-            WHERE id = ?
-        """, (request_id,))
-        
-        req = cursor.fetchone()
+        # Соединение не держим во время await: пул привязан к потоку, а не к корутине
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Получаем данные запроса
+            cursor.execute("""
+                SELECT from_user_id, to_user_id, post_id
+                FROM response_requests
+                WHERE id = ?
+            """, (request_id,))
+            
+            req = cursor.fetchone()
         
         if not req:
             await callback.answer("❌ Запрос не найден", show_alert=True)
-            conn.close()
             return
         
         from_user_id = req['from_user_id']
@@ -470,57 +401,36 @@ async def callback_accept_request(callback: types.CallbackQuery):
         # Проверяем, что это автор
         if callback.from_user.id != to_user_id:
             await callback.answer("❌ Это не ваш запрос", show_alert=True)
-            conn.close()
             return
         
-        # Обновляем статус
-        cursor.execute("""
-            UPDATE response_requests 
-            SET status = 'accepted'
-            WHERE id = ?
-        """, (request_id,))
-        
         # Получаем username автора
-        cursor.execute("SELECT telegram_username, first_name FROM profiles WHERE user_id = ?", (to_user_id,))
-        author = cursor.fetchone()
-        
-        conn.commit()
-        conn.close()
-        
-        # Редактируем сообщение
-        await callback.message.edit_text(
-            callback.message.text + "\n\n✅ <b>Запрос принят</b>",
-            parse_mode="HTML"
-        )
-        
-        # Уведомляем отправителя
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT telegram_username, first_name FROM profiles WHERE user_id = ?", (to_user_id,))
+            author = cursor.fetchone()
+
+        # Уведомление отправителю
         author_name = author['first_name'] if author else "Автор"
         author_username = author['telegram_username'] if author else None
         
         notify_text = f"✅ <b>{author_name}</b> принял ваш запрос!\n\nМожете написать ему:"
+        payload = {"parse_mode": "HTML"}
         
         if author_username:
-            notify_keyboard = {
-                "inline_keyboard": [[
-                    {"text": "💬 Написать в ЛС", "url": f"https://t.me/{author_username}"}
-                ]]
-            }
+            payload["reply_markup"] = _url_keyboard("💬 Написать в ЛС", f"https://t.me/{author_username}")
         else:
             notify_text += "\n\n⚠️ Автор не указал username"
-            notify_keyboard = None
+        payload["text"] = notify_text
         
-        # Отправляем уведомление
-        import requests
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": from_user_id,
-            "text": notify_text,
-            "parse_mode": "HTML"
-        }
-        if notify_keyboard:
-            payload["reply_markup"] = notify_keyboard
-        
-        requests.post(url, json=payload, timeout=5)
+        # Статус и уведомление — одной транзакцией
+        await db.write_async(accept_response_request, request_id, from_user_id, payload)
+        outbox.wake()
+
+        # Редактируем сообщение
+        await callback.message.edit_text(
+            callback.message.text + "\n\n✅ <b>Запрос принят</b>",
+            parse_mode="HTML"
+        )
         
         await callback.answer("✅ Запрос принят")
         
@@ -535,39 +445,34 @@ async def callback_reject_request(callback: types.CallbackQuery):
     try:
         request_id = int(callback.data.split(":")[1])
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Получаем данные запроса
-        cursor.execute("""
-            SELECT to_user_id
-            FROM response_requests
-            WHERE id = ?
-        """, (request_id,))
-        
-        req = cursor.fetchone()
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Получаем данные запроса
+            cursor.execute("""
+                SELECT to_user_id
+                FROM response_requests
+                WHERE id = ?
+            """, (request_id,))
+            
+            req = cursor.fetchone()
         
         if not req:
             await callback.answer("❌ Запрос не найден", show_alert=True)
-            conn.close()
             return
         
         # Проверяем, что это автор
         if callback.from_user.id != req['to_user_id']:
             await callback.answer("❌ Это не ваш запрос", show_alert=True)
-            conn.close()
             return
         
         # Обновляем статус
-        cursor.execute("""
+        await db.execute_write_async("""
             UPDATE response_requests 
             SET status = 'rejected'
             WHERE id = ?
         """, (request_id,))
-        
-        conn.commit()
-        conn.close()
-        
+
         # Редактируем сообщение
         await callback.message.edit_text(
             callback.message.text + "\n\n❌ <b>Запрос отклонён</b>",
@@ -0,0 +1,184 @@
+# broadcasts.py
+#
+# Рассылка нового поста подписчикам автора. /api/create-post только создаёт
+# строку broadcasts; Broadcaster ставит получателей в outbox порциями по
+# BROADCAST_CHUNK (priority 1). Порция и сдвиг cursor пишутся одной транзакцией,
+# поэтому после падения рассылка продолжается с того же места без дублей.
+#
+# Следующая порция ставится, когда от рассылки в очереди осталось меньше
+# BROADCAST_CHUNK сообщений: outbox не разрастается на всю аудиторию сразу.
+# Скорость отправки задаёт outbox (общий лимит бота и лимит на чат).
+#
+# Статусы: running (получатели ещё ставятся) -> enqueued (все в очереди) -> done.
+
+import json
+import os
+import threading
+import time
+
+import db
+import outbox
+
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", 500))
+BROADCAST_POLL_INTERVAL = float(os.getenv("BROADCAST_POLL_INTERVAL", 1.0))
+BROADCAST_STATS_LIMIT = 10
+
+_wakeup = threading.Event()
+
+
+def create_broadcast(conn, kind, author_id, payload):
+    """Новая рассылка подписчикам author_id (в потоке-писателе). payload — тело sendMessage без chat_id"""
+    return conn.execute("""
+        INSERT INTO broadcasts (kind, author_id, payload, created_at)
+        VALUES (?, ?, ?, ?)
+    """, (kind, author_id, json.dumps(payload, ensure_ascii=False), time.time())).lastrowid
+
+
+def wake():
+    """Вызывать после COMMIT транзакции с create_broadcast"""
+    _wakeup.set()
+
+
+def _queued(conn, broadcast_id):
+    return conn.execute("""
+        SELECT COUNT(*) FROM notification_outbox
+        WHERE broadcast_id = ? AND status IN ('pending', 'sending')
+    """, (broadcast_id,)).fetchone()[0]
+
+
+def _expand(conn, broadcast_id, limit):
+    """Следующая порция подписчиков -> outbox, cursor сдвигается в той же транзакции"""
+    row = conn.execute("""
+        SELECT kind, author_id, payload, cursor FROM broadcasts
+        WHERE id = ? AND status = 'running'
+    """, (broadcast_id,)).fetchone()
+    if row is None:
+        return 0
+    followers = [r[0] for r in conn.execute("""
+        SELECT follower_id FROM follows
+        WHERE following_id = ? AND follower_id > ?
+        ORDER BY follower_id
+        LIMIT ?
+    """, (row["author_id"], row["cursor"], limit))]
+    if followers:
+        outbox.enqueue_many(conn, row["kind"], followers, row["payload"],
+                            priority=outbox.PRIORITY_BROADCAST, broadcast_id=broadcast_id)
+    conn.execute("""
+        UPDATE broadcasts
+        SET cursor = ?, enqueued = enqueued + ?, status = ?
+        WHERE id = ?
+    """, (followers[-1] if followers else row["cursor"], len(followers),
+          "running" if len(followers) == limit else "enqueued", broadcast_id))
+    return len(followers)
+
+
+def _delivery_counts(conn, broadcast_id):
+    """{status: (число, время последней отправки)} по строкам outbox рассылки"""
+    return {
+        row["status"]: (row["n"], row["last_sent_at"])
+        for row in conn.execute("""
+            SELECT status, COUNT(*) AS n, MAX(sent_at) AS last_sent_at
+            FROM notification_outbox
+            WHERE broadcast_id = ?
+            GROUP BY status
+        """, (broadcast_id,))
+    }
+
+
+def _finish_if_drained(conn, broadcast_id):
+    """enqueued -> done, когда в очереди не осталось сообщений; итоги сохраняются в строке"""
+    if _queued(conn, broadcast_id):
+        return False
+    counts = _delivery_counts(conn, broadcast_id)
+    sent, last_sent_at = counts.get("sent", (0, None))
+    conn.execute("""
+        UPDATE broadcasts
+        SET status = 'done', sent = ?, dead = ?, finished_at = ?
+        WHERE id = ? AND status = 'enqueued'
+    """, (sent, counts.get("dead", (0, None))[0], last_sent_at or time.time(), broadcast_id))
+    return True
+
+
+def _throughput(sent, started_at, until):
+    elapsed = max(0.0, (until or time.time()) - started_at)
+    return round(elapsed, 1), round(sent / elapsed, 2) if elapsed and sent else 0.0
+
+
+class Broadcaster:
+    """start() — поток, который двигает активные рассылки; stats() — прогресс и скорость"""
+
+    def __init__(self, chunk: int = BROADCAST_CHUNK, poll_interval: float = BROADCAST_POLL_INTERVAL):
+        self._chunk = chunk
+        self._poll_interval = poll_interval
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="broadcaster", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        _wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            _wakeup.clear()
+            try:
+                self.step()
+            except Exception as e:
+                print(f"❌ Broadcaster: {e}")
+            _wakeup.wait(self._poll_interval)
+
+    def step(self):
+        """Один проход по активным рассылкам"""
+        with db.read_connection() as conn:
+            active = [
+                (row["id"], row["status"], _queued(conn, row["id"]))
+                for row in conn.execute("""
+                    SELECT id, status FROM broadcasts
+                    WHERE status IN ('running', 'enqueued')
+                """).fetchall()
+            ]
+        for broadcast_id, status, queued in active:
+            if status == "running":
+                if queued < self._chunk and db.write(_expand, broadcast_id, self._chunk):
+                    outbox.wake()
+            elif not queued and db.write(_finish_if_drained, broadcast_id):
+                print(f"📣 Рассылка {broadcast_id} завершена")
+
+    def stats(self):
+        with db.read_connection() as conn:
+            rows = conn.execute("""
+                SELECT * FROM broadcasts WHERE status IN ('running', 'enqueued')
+            """).fetchall() + conn.execute("""
+                SELECT * FROM broadcasts WHERE status = 'done'
+                ORDER BY id DESC
+                LIMIT ?
+            """, (BROADCAST_STATS_LIMIT,)).fetchall()
+
+            broadcasts = []
+            for row in rows:
+                item = {
+                    "id": row["id"], "kind": row["kind"], "author_id": row["author_id"],
+                    "status": row["status"], "enqueued": row["enqueued"],
+                }
+                if row["status"] == "done":
+                    sent, dead, until = row["sent"], row["dead"], row["finished_at"]
+                    queued = 0
+                else:
+                    counts = _delivery_counts(conn, row["id"])
+                    sent = counts.get("sent", (0, None))[0]
+                    dead = counts.get("dead", (0, None))[0]
+                    queued = counts.get("pending", (0, None))[0] + counts.get("sending", (0, None))[0]
+                    until = None
+                elapsed, rate = _throughput(sent, row["created_at"], until)
+                item.update(sent=sent, dead=dead, queued=queued, elapsed_s=elapsed, per_second=rate)
+                broadcasts.append(item)
+
+        return {"running": self._thread is not None, "chunk": self._chunk, "broadcasts": broadcasts}
@@ -0,0 +1,248 @@
+# build_assets.py
+#
+# Сборка фронтенда в dist/ для продакшена:
+#   - css: @import'ы из style.css склеиваются в один файл;
+#   - js: ES-модули остаются отдельными файлами (их грузят по цепочке import и
+#     динамически через import()/loadScript), но пути импортов переписываются на
+#     имена с хэшем содержимого;
+#   - минификация (rjsmin / rcssmin, если установлены);
+#   - рядом с каждым файлом — .gz и .br (brotli, если установлен);
+#   - index.html ссылается на файлы с хэшем, manifest.json — исходное имя -> собранное.
+#
+# Файлы с хэшем в имени не меняются, server.py отдаёт их с immutable-кэшем.
+# Старые версии из dist/ не удаляются: открытые вкладки догружают свои модули.
+#
+#   python build_assets.py               # собрать в dist/
+#   python build_assets.py --out build   # в другую папку
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+    print("⚠️ rjsmin не установлен: JS собирается без минификации")
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+    print("⚠️ brotli не установлен: собираются только .gz")
+
+APP_ROOT = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_OUT_DIR = os.path.join(APP_ROOT, "dist")
+MANIFEST_NAME = "manifest.json"
+
+HASH_LENGTH = 10
+# Мелкие файлы не сжимаем: выигрыш меньше накладных расходов
+COMPRESS_MIN_SIZE = 512
+COMPRESS_EXTENSIONS = (".js", ".css", ".html", ".json", ".svg")
+
+# Кодировка Accept-Encoding -> суффикс предсжатого файла, в порядке предпочтения
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+_CSS_IMPORT_RE = re.compile(r"""@import\s+(?:url\(\s*)?(['"])([^'"]+)\1\s*\)?\s*;""")
+# import ... from './x.js', import './x.js', import('./x.js')
+_JS_IMPORT_RE = re.compile(r"""(\bfrom\s*|\bimport\s*\(?\s*)(['"])(\.{1,2}/[^'"]+)\2""")
+# loadScript('js/...') в app.js — путь от корня сайта
+_JS_LOAD_SCRIPT_RE = re.compile(r"""(\bloadScript\(\s*)(['"])(/?js/[^'"]+)\2""")
+_HTML_ASSET_RE = re.compile(r"""\b(href|src)=(['"])(/?(?:css|js)/[^'"?]+)(?:\?[^'"]*)?\2""")
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+
+
+def load_manifest(out_dir=DEFAULT_OUT_DIR):
+    """{исходный путь: путь с хэшем} из собранной папки; {}, если сборки нет"""
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _strip_query(specifier):
+    return specifier.split("?", 1)[0].split("#", 1)[0]
+
+
+def _hashed_name(relpath, content: bytes):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    stem, ext = posixpath.splitext(relpath)
+    return f"{stem}.{digest}{ext}"
+
+
+def _minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    # Без rcssmin — только комментарии и пустые строки
+    text = _CSS_COMMENT_RE.sub("", text)
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip()) + "\n"
+
+
+def _minify_js(text):
+    return rjsmin.jsmin(text) if rjsmin is not None else text
+
+
+def bundle_css(src_root, relpath, seen=None):
+    """Текст CSS-файла с рекурсивно подставленными локальными @import"""
+    seen = set() if seen is None else seen
+    if relpath in seen:
+        return ""
+    seen.add(relpath)
+    with open(os.path.join(src_root, relpath), encoding="utf-8") as f:
+        text = f.read()
+
+    def inline(match):
+        target = match.group(2)
+        if re.match(r"^(https?:)?//", target):
+            return match.group(0)
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(relpath), _strip_query(target)))
+        return f"/* {resolved} */\n" + bundle_css(src_root, resolved, seen)
+
+    return _CSS_IMPORT_RE.sub(inline, text)
+
+
+class AssetBuilder:
+    """Собирает src_root/{index.html, css, js, locales} в out_dir"""
+
+    def __init__(self, src_root=APP_ROOT, out_dir=DEFAULT_OUT_DIR):
+        self.src_root = src_root
+        self.out_dir = out_dir
+        self.manifest = {}
+        self.written = 0
+        self.raw_bytes = 0
+        self.gzip_bytes = 0
+        self.brotli_bytes = 0
+        self._js_building = set()
+
+    def build(self):
+        for relpath in self._walk("js", ".js"):
+            self.build_js(relpath)
+        with open(os.path.join(self.src_root, "index.html"), encoding="utf-8") as f:
+            html = f.read()
+        html = _HTML_ASSET_RE.sub(self._rewrite_html_ref, html)
+        for relpath in self._walk("locales", ".json"):
+            with open(os.path.join(self.src_root, relpath), "rb") as f:
+                self._emit(relpath, f.read())
+        # index.html и манифест — последними: до этого момента старая сборка целиком рабочая
+        self._emit("index.html", html.encode("utf-8"))
+        self._emit(MANIFEST_NAME, json.dumps(self.manifest, indent=2, sort_keys=True).encode("utf-8"),
+                   compress=False)
+        return self.manifest
+
+    def _walk(self, subdir, ext):
+        root = os.path.join(self.src_root, subdir)
+        for dirpath, _, filenames in sorted(os.walk(root)):
+            for filename in sorted(filenames):
+                if filename.endswith(ext):
+                    full = os.path.join(dirpath, filename)
+                    yield os.path.relpath(full, self.src_root).replace(os.sep, "/")
+
+    def build_css(self, relpath):
+        if relpath not in self.manifest:
+            content = _minify_css(bundle_css(self.src_root, relpath)).encode("utf-8")
+            self.manifest[relpath] = self._emit(_hashed_name(relpath, content), content)
+        return self.manifest[relpath]
+
+    def build_js(self, relpath):
+        """Собирает модуль после всех его зависимостей: хэш включает их имена с хэшем"""
+        if relpath in self.manifest:
+            return self.manifest[relpath]
+        if relpath in self._js_building:
+            raise ValueError(f"Циклический импорт через {relpath}: имена с хэшем не вычислить")
+        self._js_building.add(relpath)
+        with open(os.path.join(self.src_root, relpath), encoding="utf-8") as f:
+            text = f.read()
+        base_dir = posixpath.dirname(relpath)
+
+        def rewrite_relative(match):
+            prefix, quote, specifier = match.groups()
+            target = posixpath.normpath(posixpath.join(base_dir, _strip_query(specifier)))
+            if not os.path.isfile(os.path.join(self.src_root, target)):
+                print(f"⚠️ {relpath}: импорт {specifier} не найден, оставлен как есть")
+                return match.group(0)
+            hashed = posixpath.relpath(self.build_js(target), base_dir)
+            if not hashed.startswith("."):
+                hashed = "./" + hashed
+            return f"{prefix}{quote}{hashed}{quote}"
+
+        def rewrite_root(match):
+            prefix, quote, specifier = match.groups()
+            target = _strip_query(specifier).lstrip("/")
+            if not os.path.isfile(os.path.join(self.src_root, target)):
+                print(f"⚠️ {relpath}: скрипт {specifier} не найден, оставлен как есть")
+                return match.group(0)
+            leading = "/" if specifier.startswith("/") else ""
+            return f"{prefix}{quote}{leading}{self.build_js(target)}{quote}"
+
+        text = _JS_IMPORT_RE.sub(rewrite_relative, text)
+        text = _JS_LOAD_SCRIPT_RE.sub(rewrite_root, text)
+        content = _minify_js(text).encode("utf-8")
+        self._js_building.discard(relpath)
+        self.manifest[relpath] = self._emit(_hashed_name(relpath, content), content)
+        return self.manifest[relpath]
+
+    def _rewrite_html_ref(self, match):
+        attr, quote, path = match.groups()
+        relpath = path.lstrip("/")
+        if not os.path.isfile(os.path.join(self.src_root, relpath)):
+            return match.group(0)
+        hashed = self.build_css(relpath) if relpath.endswith(".css") else self.build_js(relpath)
+        leading = "/" if path.startswith("/") else ""
+        return f"{attr}={quote}{leading}{hashed}{quote}"
+
+    def _emit(self, relpath, content: bytes, compress=True):
+        target = os.path.join(self.out_dir, *relpath.split("/"))
+        self._write(target, content)
+        self.written += 1
+        self.raw_bytes += len(content)
+        if compress and relpath.endswith(COMPRESS_EXTENSIONS) and len(content) >= COMPRESS_MIN_SIZE:
+            # mtime=0 — одинаковый .gz при повторной сборке того же файла
+            gz = gzip.compress(content, compresslevel=9, mtime=0)
+            self._write(target + ".gz", gz)
+            self.gzip_bytes += len(gz)
+            if brotli is not None:
+                br = brotli.compress(content, quality=11)
+                self._write(target + ".br", br)
+                self.brotli_bytes += len(br)
+        return relpath
+
+    @staticmethod
+    def _write(path, content: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка фронтенда в dist/")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="папка сборки (по умолчанию dist/)")
+    args = parser.parse_args()
+
+    builder = AssetBuilder(APP_ROOT, os.path.abspath(args.out))
+    try:
+        manifest = builder.build()
+    except (OSError, ValueError) as e:
+        print(f"❌ Сборка не удалась: {e}")
+        return 1
+
+    print(f"✅ Собрано файлов: {builder.written} ({len(manifest)} с хэшем) -> {builder.out_dir}")
+    print(f"📊 Размер: {builder.raw_bytes} байт, gzip: {builder.gzip_bytes}"
+          + (f", brotli: {builder.brotli_bytes}" if brotli is not None else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
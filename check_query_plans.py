@@ -0,0 +1,326 @@
+# check_query_plans.py
+#
+# Проверка планов запросов: достаёт все SQL-выражения из server.py, outbox.py,
+# broadcasts.py, digests.py и bot_handlers.py (плюс динамические запросы из posts_search.py и profiles_search.py), прогоняет EXPLAIN QUERY PLAN на временной БД
+# (схема из migrations.py + сгенерированные данные + ANALYZE) и падает,
+# если запрос делает полный проход по таблице (SCAN) или сортирует
+# через временное B-дерево (USE TEMP B-TREE). SQL, собранный в рантайме
+# (f-строки), раскрывается подстановками из FSTRING_VALUES; запрос без
+# подстановок — тоже ошибка, а не пропуск.
+#
+#   python check_query_plans.py            # код выхода 1 при регрессии
+#   python check_query_plans.py --verbose  # печатать планы всех запросов
+
+import argparse
+import ast
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+
+import migrations
+import posts_search
+import profiles_search
+
+SOURCE_FILES = ["server.py", "bot_handlers.py", "outbox.py", "broadcasts.py", "digests.py"]
+
+# Вызовы, первым аргументом которых идёт SQL
+SQL_CALLS = {"execute", "executemany", "execute_write", "execute_write_async"}
+
+# Подстановки для SQL, собираемого в рантайме (f-строки, склейка строк): файл -> имя ->
+# варианты значения (список или функция от уже подставленных имён). Константы уровня
+# модуля (LIST_COLUMNS, PROFILE_COLUMNS, ...) берутся из самого файла. Запрос
+# проверяется со всеми комбинациями; если имя не описано — проверка падает.
+FSTRING_VALUES = {
+    "server.py": {
+        "table_name": ["work_experience", "education"],  # ALLOWED_TABLES
+        "columns": lambda ns: [ns["LIST_COLUMNS"][ns["table_name"]]],
+        "assignments": lambda ns: [", ".join(f"{column} = ?" for column in ns["columns"])],
+        # write_profile: одна изменившаяся колонка и все сразу
+        "changed": lambda ns: [ns["PROFILE_COLUMNS"][:1], ns["PROFILE_COLUMNS"]],
+        "scopes": [("profiles",), ("posts", "profiles")],
+        "ids": [[1, 2, 3]],
+        "updates": [{"follow_alerts": "auto", "skill_match_alerts": "off"}],
+    },
+    "digests.py": {
+        "kind": lambda ns: list(ns["PREFERENCE_COLUMNS"]),
+        "column": lambda ns: [ns["PREFERENCE_COLUMNS"][ns["kind"]]],
+    },
+}
+
+# Переменные с SQL от posts_search/profiles_search: проверяются через FEED_QUERY_CASES
+# и PROFILE_SEARCH_CASES
+BUILT_SQL_NAMES = {"sql"}
+
+# Осознанные полные проходы: (файл, функция) -> (какие шаги плана разрешены, причина).
+# Шаг сверяется вместе с путём от корня плана («CO-ROUTINE m > SCAN tags ...»),
+# поэтому шаблон с ^ разрешает шаг только на своём уровне. Остальные шаги плана
+# в той же функции проверяются как обычно.
+ALLOWLIST = {
+    ("server.py", "get_all_profiles"): (
+        re.compile(r"^SCAN p$"),
+        "каталог отдаёт все профили, кроме своего",
+    ),
+    ("bot_handlers.py", "notify_skill_match"): (
+        re.compile(r"^CO-ROUTINE m > (SCAN tags VIRTUAL TABLE\b|USE TEMP B-TREE FOR DISTINCT$)|^SCAN m$"),
+        "проход по тегам поста и по уже найденным получателям (склеены DISTINCT)",
+    ),
+    ("digests.py", "route_many"): (
+        re.compile(r"^LIST SUBQUERY \d+ > SCAN json_each\b"),
+        "проход по переданному списку получателей, профили — по первичному ключу",
+    ),
+    ("profiles_search.py", "profiles_browse"): (
+        re.compile(r"^SCAN p$"),
+        "каталог без фильтров идёт по user_id",
+    ),
+    ("profiles_search.py", "profiles_sync"): (
+        re.compile(r"^CORRELATED SCALAR SUBQUERY \d+ > SCAN json_each\b"),
+        "один профиль: разбор его JSON навыков",
+    ),
+}
+
+# Комбинации фильтров ленты, собираемые posts_search.build_feed_query
+FEED_QUERY_CASES = {
+    "feed": {},
+    "feed_page": {"after": ("2024-01-01 00:00:00", 100)},
+    "by_type": {"post_type": "looking"},
+    "by_type_page": {"post_type": "looking", "after": ("2024-01-01 00:00:00", 100)},
+    "by_experience": {"experience": "1-3"},
+    "by_skill": {"skills": ["python"]},
+    "by_skills": {"skills": ["python", "sql"], "post_type": "offering"},
+    "by_text": {"text": "backend developer"},
+    "by_everything": {"post_type": "looking", "skills": ["go"], "experience": "3-5",
+                      "text": "remote", "after": ("2024-01-01 00:00:00", 100)},
+}
+
+# Поиск людей: profiles_search.build_search_query(viewer_id=1, ...)
+PROFILE_SEARCH_CASES = {
+    "profiles_browse": {},
+    "profiles_browse_status": {"status": "hiring", "cursor": ("u", 100)},
+    "profiles_by_text": {"text": "dev acme"},
+    "profiles_by_skills": {"skills": ["python", "sql"], "status": "open_to_work", "cursor": ("o", 30)},
+}
+
+# SCAN по FTS5 с MATCH ("M" в строке индекса, "rM" — с ранжированием) — поиск
+# по полнотекстовому индексу, а не проход
+BAD_PLAN = re.compile(r"\bSCAN\b(?!.*VIRTUAL TABLE INDEX \d+:r?M)|USE TEMP B-TREE")
+
+
+class UnresolvedSQL(ValueError):
+    """SQL собирается в рантайме, а подстановок для него в FSTRING_VALUES нет"""
+
+
+def extract_statements(path):
+    """Возвращает [(line, function, sql)] для всех SQL-вызовов в файле"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    namespaces = _fstring_namespaces(tree, FSTRING_VALUES.get(os.path.basename(path), {}))
+    statements = []
+
+    def visit(node, func_name):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                visit(child, child.name)
+                continue
+            if isinstance(child, ast.Call) and child.args:
+                func = child.func
+                name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+                if name in SQL_CALLS:
+                    try:
+                        for sql in _literal_sql(child.args[0], namespaces):
+                            statements.append((child.lineno, func_name, sql))
+                    except UnresolvedSQL as e:
+                        raise UnresolvedSQL(f"{os.path.basename(path)}:{child.lineno} ({func_name}): {e}")
+            visit(child, func_name)
+
+    visit(tree, "<module>")
+    return statements
+
+
+def _fstring_namespaces(tree, values):
+    """Все комбинации подстановок для файла поверх его констант уровня модуля"""
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                constants[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                pass
+    namespaces = [constants]
+    for name, options in values.items():
+        namespaces = [
+            {**ns, name: value}
+            for ns in namespaces
+            for value in (options(ns) if callable(options) else options)
+        ]
+    return namespaces
+
+
+def _literal_sql(node, namespaces):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.Name) and node.id in BUILT_SQL_NAMES:
+        return []
+    if not isinstance(node, (ast.JoinedStr, ast.BinOp)):
+        raise UnresolvedSQL(f"SQL не литерал: {ast.unparse(node)}")
+    # f-строка или склейка: вычисляем с каждой комбинацией подстановок
+    code = compile(ast.Expression(node), "<sql>", "eval")
+    results = []
+    for ns in namespaces:
+        try:
+            sql = eval(code, {**ns, "__builtins__": {"len": len}})
+        except (NameError, KeyError) as e:
+            raise UnresolvedSQL(f"нет подстановки в FSTRING_VALUES: {e}")
+        if sql not in results:
+            results.append(sql)
+    return results
+
+
+def seed_database(path, users=2000, posts_per_user=5, follows_per_user=20):
+    """Схема через миграции + данные, похожие на боевые по пропорциям"""
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    rnd = random.Random(42)
+    skills = ["python", "js", "go", "design", "sql", "ml", "devops", "react"]
+
+    conn.executemany(
+        "INSERT INTO profiles (user_id, first_name, bio, skills, status) VALUES (?, ?, ?, ?, ?)",
+        [(u, f"User {u}", "bio", f'["{rnd.choice(skills)}", "{rnd.choice(skills)}"]',
+          rnd.choice(["networking", "open_to_work", "hiring"]))
+         for u in range(1, users + 1)]
+    )
+    conn.executemany(
+        "INSERT INTO work_experience (user_id, job_title, company, is_current) VALUES (?, ?, ?, ?)",
+        [(u, "Dev", "ACME", i == 0) for u in range(1, users + 1) for i in range(2)]
+    )
+    conn.executemany(
+        "INSERT INTO education (user_id, institution) VALUES (?, ?)",
+        [(u, "Uni") for u in range(1, users + 1)]
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO follows (follower_id, following_id) VALUES (?, ?)",
+        [(u, rnd.randint(1, users)) for u in range(1, users + 1) for _ in range(follows_per_user)]
+    )
+    words = ["backend", "frontend", "developer", "remote", "startup", "mentor", "design", "project", "team"]
+    conn.executemany(
+        "INSERT INTO posts (user_id, post_type, content, skill_tags, experience_years, created_at, is_deleted) "
+        "VALUES (?, ?, ?, ?, ?, datetime('now', ?), ?)",
+        [(u, rnd.choice(["looking", "offering", "showcase"]),
+          " ".join(rnd.choice(words) for _ in range(6)),
+          json.dumps(rnd.sample(skills, rnd.randint(1, 3))),
+          rnd.choice(["0-1", "1-3", "3-5", "5+"]),
+          f"-{rnd.randint(0, 100000)} minutes", int(rnd.random() < 0.05))
+         for u in range(1, users + 1) for _ in range(posts_per_user)]
+    )
+    for user_id, skills in conn.execute("SELECT user_id, skills FROM profiles").fetchall():
+        profiles_search.sync_user_skills(conn, user_id, skills)
+    for post_id, skill_tags in conn.execute("SELECT post_id, skill_tags FROM posts").fetchall():
+        posts_search.sync_post_skills(conn, post_id, skill_tags)
+    post_count = users * posts_per_user
+    conn.executemany(
+        "INSERT INTO response_requests (post_id, from_user_id, to_user_id, status) VALUES (?, ?, ?, ?)",
+        [(rnd.randint(1, post_count), rnd.randint(1, users), rnd.randint(1, users), "pending")
+         for _ in range(users * 2)]
+    )
+    conn.executemany(
+        "INSERT INTO notifications (user_id, type, message, is_read) VALUES (?, 'follow', 'msg', ?)",
+        [(rnd.randint(1, users), rnd.randint(0, 1)) for _ in range(users * 5)]
+    )
+    conn.executemany(
+        "INSERT INTO notification_log (user_id, type, date) VALUES (?, 'skill_match', date('now'))",
+        [(rnd.randint(1, users),) for _ in range(users)]
+    )
+    conn.execute(profiles_search.INDEX_DOCUMENTS_SQL)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    return conn
+
+
+def explain(conn, sql, params=None):
+    statement = sql.strip().rstrip(";")
+    if params is None:
+        params = [1] * statement.count("?")
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}", params).fetchall()
+    # [(путь от корня плана, шаг)]: путь нужен ALLOWLIST, проверяется сам шаг
+    paths = {}
+    steps = []
+    for node_id, parent, _, detail in rows:
+        paths[node_id] = f"{paths[parent]} > {detail}" if parent in paths else detail
+        steps.append((paths[node_id], detail))
+    return steps
+
+
+def collect_statements(base_dir):
+    """[(файл, строка, функция, sql, params)] — литералы из исходников + сгенерированные запросы"""
+    statements = []
+    for filename in SOURCE_FILES:
+        for line, func_name, sql in extract_statements(os.path.join(base_dir, filename)):
+            statements.append((filename, line, func_name, sql, None))
+    for case, kwargs in FEED_QUERY_CASES.items():
+        sql, params = posts_search.build_feed_query(**kwargs)
+        statements.append(("posts_search.py", 0, case, sql, params))
+    for case, kwargs in PROFILE_SEARCH_CASES.items():
+        sql, params, _ = profiles_search.build_search_query(1, **kwargs)
+        statements.append(("profiles_search.py", 0, case, sql, params))
+    statements.append(("profiles_search.py", 0, "profiles_sync",
+                       profiles_search.INDEX_DOCUMENTS_SQL + " WHERE p.user_id = ?", [1]))
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка планов SQL-запросов")
+    parser.add_argument("--verbose", action="store_true", help="печатать планы всех запросов")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    failures = 0
+    checked = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = seed_database(os.path.join(tmp, "plans.db"))
+
+        try:
+            statements = collect_statements(base_dir)
+        except UnresolvedSQL as e:
+            print(f"❌ {e}")
+            return 1
+
+        for filename, line, func_name, sql, params in statements:
+            location = f"{filename}:{line} ({func_name})" if line else f"{filename} ({func_name})"
+            if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+                continue
+            try:
+                plan = explain(conn, sql, params)
+            except sqlite3.Error as e:
+                print(f"❌ {location}: запрос не разбирается: {e}")
+                failures += 1
+                continue
+
+            checked += 1
+            bad = [path for path, step in plan if BAD_PLAN.search(step)]
+            allowed_steps, reason = ALLOWLIST.get((filename, func_name), (None, None))
+            unexpected = [path for path in bad if not (allowed_steps and allowed_steps.search(path))]
+            if unexpected:
+                failures += 1
+                print(f"❌ {location}")
+            elif args.verbose:
+                print(f"{'⚠️' if bad else '✅'} {location}" + (f" — разрешено: {reason}" if bad else ""))
+            else:
+                continue
+            print("   " + " ".join(sql.split()))
+            for path, step in plan:
+                print(f"     {'  ' * path.count(' > ')}{step}")
+
+        conn.close()
+
+    print(f"\n📊 Проверено запросов: {checked}, регрессий: {failures}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# compression.py
+#
+# Сжатие ответов API (gzip, brotli — если установлен) в after_request.
+# Сжимаются только ответы из списка типов (JSON по умолчанию) не меньше порога;
+# файлы (send_file / send_from_directory) идут как есть — статика
+# приходит уже предсжатой из build_assets.py.
+#
+# Сильный ETag после сжатия становится слабым: тело другое, а смысл тот же,
+# If-None-Match сравнивается слабо (etag_matches в server.py).
+
+import gzip
+import os
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+# Качество brotli на лету: 4–5 — почти как gzip -9 по размеру, но быстрее
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+COMPRESS_MIMETYPES = frozenset(
+    os.getenv("COMPRESS_MIMETYPES", "application/json,text/plain,text/html").split(",")
+)
+
+
+class ResponseCompressor:
+    """
+    init_app(app) — подключает сжатие ко всем ответам приложения.
+    stats() — по эндпоинтам: сколько ответов сжато, байт до/после, CPU на сжатие.
+    """
+
+    def __init__(self, min_size: int = COMPRESS_MIN_SIZE, level: int = COMPRESS_LEVEL,
+                 brotli_quality: int = COMPRESS_BROTLI_QUALITY, mimetypes=COMPRESS_MIMETYPES):
+        self._min_size = min_size
+        self._level = level
+        self._brotli_quality = brotli_quality
+        self._mimetypes = mimetypes
+        self._lock = threading.Lock()
+        self._endpoints = {}  # endpoint -> счётчики
+
+    def init_app(self, app):
+        from flask import request
+
+        @app.after_request
+        def compress_response(response):
+            return self.compress(request, response)
+
+    def _choose_encoding(self, request):
+        accept = request.accept_encodings
+        if brotli is not None and accept["br"]:
+            return "br"
+        if accept["gzip"]:
+            return "gzip"
+        return None
+
+    def compress(self, request, response):
+        if (request.method == "HEAD"
+                or response.direct_passthrough
+                or response.is_streamed
+                or response.status_code < 200
+                or response.status_code in (204, 206, 304)
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in self._mimetypes):
+            return response
+
+        body = response.get_data()
+        if len(body) < self._min_size:
+            return response
+        # Ответ зависит от Accept-Encoding, даже если именно этому клиенту он ушёл несжатым
+        response.vary.add("Accept-Encoding")
+        encoding = self._choose_encoding(request)
+        if encoding is None:
+            return response
+
+        started = time.thread_time()
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=self._brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=self._level)
+        cpu = time.thread_time() - started
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        self._record(request.endpoint or "<unknown>", encoding, len(body), len(compressed), cpu)
+        return response
+
+    def _record(self, endpoint, encoding, size_in, size_out, cpu):
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {
+                    "responses": 0, "gzip": 0, "br": 0,
+                    "bytes_in": 0, "bytes_out": 0, "cpu": 0.0,
+                }
+            entry["responses"] += 1
+            entry[encoding] += 1
+            entry["bytes_in"] += size_in
+            entry["bytes_out"] += size_out
+            entry["cpu"] += cpu
+
+    def stats(self):
+        with self._lock:
+            endpoints = {name: dict(entry) for name, entry in self._endpoints.items()}
+        for entry in endpoints.values():
+            entry["ratio"] = round(entry["bytes_out"] / entry["bytes_in"], 4) if entry["bytes_in"] else 0.0
+            entry["cpu_ms"] = round(entry.pop("cpu") * 1000, 2)
+        return {
+            "brotli": brotli is not None,
+            "min_size": self._min_size,
+            "level": self._level,
+            "endpoints": endpoints,
+        }
@@ -0,0 +1,440 @@
+# db.py
+#
+# Общий пул соединений SQLite для server.py и bot_handlers.py.
+# Соединения открываются и настраиваются (PRAGMA) один раз, затем выдаются
+# на время запроса через контекстный менеджер и всегда возвращаются в пул.
+#
+# Все записи идут через один поток-писатель (WriteQueue): операции из любых
+# потоков собираются в пачку и коммитятся одной транзакцией (group commit).
+# Чтения эндпоинтов идут через отдельную полосу только-для-чтения (ReadOnlyPool),
+# размер которой настраивается независимо.
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_NAME = os.getenv('DB_NAME', 'database.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+# Сколько ждать свободное соединение, прежде чем сдаться (сек)
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10.0))
+# Размер полосы только-для-чтения (mode=ro + query_only)
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 8))
+# Окно сбора пачки записей (мс) и её максимальный размер
+DB_WRITE_BATCH_WINDOW_MS = float(os.getenv('DB_WRITE_BATCH_WINDOW_MS', 3))
+DB_WRITE_BATCH_MAX = int(os.getenv('DB_WRITE_BATCH_MAX', 200))
+# Сколько вызывающий поток ждёт результата записи (сек)
+DB_WRITE_TIMEOUT = float(os.getenv('DB_WRITE_TIMEOUT', 10.0))
+
+
+class PoolTimeoutError(RuntimeError):
+    pass
+
+
+def _configure(conn):
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class LatencyStats:
+    """Счётчик задержек: число, среднее, максимум и перцентили по последним замерам"""
+
+    def __init__(self, window=1024):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def add(self, seconds):
+        with self._lock:
+            self._recent.append(seconds)
+            self._count += 1
+            self._total += seconds
+            self._max = max(self._max, seconds)
+
+    def stats(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total, max_seen = self._count, self._total, self._max
+
+        def pct(p):
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(len(recent) * p))] * 1000, 2)
+
+        return {
+            "count": count,
+            "avg_ms": round(total * 1000 / count, 2) if count else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "max_ms": round(max_seen * 1000, 2),
+        }
+
+
+class ConnectionPool:
+    """
+    Пул соединений с учётом потоков: повторный вход в connection() из того же
+    потока отдаёт уже выданное соединение, поэтому вложенные хелперы
+    не занимают второй слот и не могут заблокировать сами себя.
+    """
+
+    def __init__(self, db_name, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.db_name = db_name
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        # Статистика
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        # Сколько соединение было занято запросом (от acquire до release)
+        self.hold_latency = LatencyStats()
+
+    def _connect(self):
+        return _configure(sqlite3.connect(self.db_name, timeout=10.0, check_same_thread=False))
+
+    def acquire(self):
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            local.depth += 1
+            return local.conn
+
+        conn = None
+        wait_started = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                now = time.monotonic()
+                if wait_started is None:
+                    wait_started = now
+                    self._waits += 1
+                remaining = self.timeout - (now - wait_started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(f"No free DB connection after {self.timeout}s")
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._acquired += 1
+            if wait_started is not None:
+                waited = time.monotonic() - wait_started
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+        local.conn = conn
+        local.depth = 1
+        local.acquired_at = time.monotonic()
+        return conn
+
+    def release(self, conn):
+        local = self._local
+        if getattr(local, 'conn', None) is conn:
+            local.depth -= 1
+            if local.depth > 0:
+                return
+            local.conn = None
+            self.hold_latency.add(time.monotonic() - local.acquired_at)
+
+        broken = False
+        try:
+            # Незакоммиченное не должно утечь в следующий запрос
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            broken = True
+
+        with self._cond:
+            self._in_use -= 1
+            if broken:
+                self._created -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+        if broken:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_time_total_ms": round(self._wait_time_total * 1000, 2),
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 2),
+                "hold_latency": self.hold_latency.stats(),
+            }
+
+
+class ReadOnlyPool(ConnectionPool):
+    """
+    Полоса для чтения: соединения открываются с mode=ro и PRAGMA query_only,
+    поэтому в WAL они никогда не берут блокировку записи и не мешают писателю.
+    """
+
+    def _connect(self):
+        uri = Path(self.db_name).absolute().as_uri() + "?mode=ro"
+        try:
+            conn = sqlite3.connect(uri, uri=True, timeout=10.0, check_same_thread=False)
+        except sqlite3.OperationalError:
+            # Файла БД ещё нет — mode=ro его не создаст; query_only ниже всё равно запретит запись
+            conn = sqlite3.connect(self.db_name, timeout=10.0, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+
+WriteResult = namedtuple('WriteResult', ['lastrowid', 'rowcount'])
+
+
+class WriteQueue:
+    """
+    Единственный писатель в БД. submit(fn, *args) ставит операцию в очередь и
+    возвращает Future; поток-писатель вызывает fn(conn, *args) внутри общей
+    транзакции пачки. Каждая операция обёрнута в SAVEPOINT, так что ошибка
+    одной не откатывает соседей. Future получает результат только после COMMIT.
+
+    fn не должна сама вызывать commit/rollback.
+    """
+
+    def __init__(self, db_name, batch_window_ms=DB_WRITE_BATCH_WINDOW_MS, max_batch=DB_WRITE_BATCH_MAX):
+        self.db_name = db_name
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Статистика
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._ops = 0
+        self._op_errors = 0
+        self._commit_errors = 0
+        self._max_batch_seen = 0
+        self._commit_time_total = 0.0
+        # Задержка операции от submit() до COMMIT
+        self.op_latency = LatencyStats()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def submit(self, fn, *args):
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # Вложенная запись из самого писателя — выполняем сразу, иначе взаимоблокировка
+            future.set_result(fn(self._conn, *args))
+            return future
+        self._ensure_started()
+        self._queue.put((future, fn, args, time.monotonic()))
+        return future
+
+    def _connect(self):
+        conn = _configure(sqlite3.connect(self.db_name, timeout=10.0, check_same_thread=False))
+        # Транзакциями управляем сами (BEGIN IMMEDIATE / SAVEPOINT / COMMIT)
+        conn.isolation_level = None
+        return conn
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        self._conn = self._connect()
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._execute_batch(batch)
+            except Exception as e:
+                # Писатель не должен умирать: отдаём ошибку всем ожидающим этой пачки
+                print(f"❌ DB writer error: {e}")
+                if self._conn.in_transaction:
+                    try:
+                        self._conn.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+                for future, _, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _execute_batch(self, batch):
+        conn = self._conn
+        results = []
+        started = time.monotonic()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for future, _, _, _ in batch:
+                future.set_exception(e)
+            with self._stats_lock:
+                self._commit_errors += 1
+            return
+
+        op_errors = 0
+        for future, fn, args, _ in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute("SAVEPOINT write_op")
+            try:
+                result = fn(conn, *args)
+                conn.execute("RELEASE write_op")
+                results.append((future, result, None))
+            except BaseException as e:
+                conn.execute("ROLLBACK TO write_op")
+                conn.execute("RELEASE write_op")
+                results.append((future, None, e))
+                op_errors += 1
+
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            for future, _, _ in results:
+                future.set_exception(e)
+            with self._stats_lock:
+                self._commit_errors += 1
+            return
+
+        committed = time.monotonic()
+        elapsed = committed - started
+        for _, _, _, enqueued_at in batch:
+            self.op_latency.add(committed - enqueued_at)
+        with self._stats_lock:
+            self._batches += 1
+            self._ops += len(results)
+            self._op_errors += op_errors
+            self._max_batch_seen = max(self._max_batch_seen, len(results))
+            self._commit_time_total += elapsed
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "ops": self._ops,
+                "op_errors": self._op_errors,
+                "commit_errors": self._commit_errors,
+                "avg_batch_size": round(self._ops / self._batches, 2) if self._batches else 0.0,
+                "max_batch_size": self._max_batch_seen,
+                "avg_batch_time_ms": round(self._commit_time_total * 1000 / self._batches, 2) if self._batches else 0.0,
+                "op_latency": self.op_latency.stats(),
+            }
+
+
+def _execute(conn, sql, params):
+    cursor = conn.execute(sql, params)
+    return WriteResult(cursor.lastrowid, cursor.rowcount)
+
+
+pool = ConnectionPool(DB_NAME)
+read_pool = ReadOnlyPool(DB_NAME, size=DB_READ_POOL_SIZE)
+writer = WriteQueue(DB_NAME)
+
+
+def connection():
+    """with db.connection() as conn: ... — соединение из общего пула"""
+    return pool.connection()
+
+
+def read_connection():
+    """with db.read_connection() as conn: ... — соединение из полосы только-для-чтения"""
+    return read_pool.connection()
+
+
+def submit_write(fn, *args):
+    """Ставит fn(conn, *args) в очередь писателя, возвращает Future"""
+    return writer.submit(fn, *args)
+
+
+def write(fn, *args, timeout=DB_WRITE_TIMEOUT):
+    """Выполняет fn(conn, *args) в потоке-писателе и ждёт результат (после COMMIT)"""
+    return writer.submit(fn, *args).result(timeout)
+
+
+def execute_write(sql, params=(), timeout=DB_WRITE_TIMEOUT):
+    """Один INSERT/UPDATE/DELETE через писателя. Возвращает WriteResult(lastrowid, rowcount)"""
+    return write(_execute, sql, params, timeout=timeout)
+
+
+async def write_async(fn, *args):
+    """Вариант write() для корутин бота: не блокирует event loop"""
+    return await asyncio.wrap_future(writer.submit(fn, *args))
+
+
+async def execute_write_async(sql, params=()):
+    return await write_async(_execute, sql, params)
+
+
+def stats():
+    return {"pool": pool.stats(), "read_pool": read_pool.stats(), "writer": writer.stats()}
@@ -0,0 +1,239 @@
+# digests.py
+#
+# Дайджесты уведомлений: вместо сообщения на каждую подписку (или пост по
+# навыкам) получатель раз в DIGEST_WINDOW секунд получает одно сводное
+# («👥 12 новых подписчиков: ...»). Режим выбирает сам пользователь
+# (profiles.follow_alerts / skill_match_alerts):
+#   auto    — первое сообщение сразу, всё, что пришло следом в течение окна, —
+#             одним дайджестом в конце окна (по умолчанию для подписок);
+#   digest  — всегда дайджестом;
+#   instant — каждое сразу;
+#   off     — в Telegram не отправлять (в ленте уведомлений всё остаётся).
+#
+# route() вызывается в транзакции события (поток-писатель) и кладёт сообщение
+# в outbox или в буфер notification_digest. DigestScheduler отправляет
+# накопленное, когда подходит flush_at.
+
+import json
+import os
+import threading
+import time
+
+import db
+import outbox
+
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", 900))
+DIGEST_POLL_INTERVAL = float(os.getenv("DIGEST_POLL_INTERVAL", 15.0))
+DIGEST_BATCH = 200
+DIGEST_NAMES_SHOWN = 3
+
+DIGEST_MODES = ("auto", "digest", "instant", "off")
+# Вид уведомления -> колонка настройки в profiles
+PREFERENCE_COLUMNS = {"follow": "follow_alerts", "skill_match": "skill_match_alerts"}
+# Режим, если настройки нет или она неизвестна — как DEFAULT колонок в миграции 13
+DEFAULT_MODES = {"follow": "auto", "skill_match": "instant"}
+
+
+def _mode(kind, value):
+    return value if value in DIGEST_MODES else DEFAULT_MODES[kind]
+
+
+def _plural(n, one, few, many):
+    if n % 10 == 1 and n % 100 != 11:
+        return one
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return few
+    return many
+
+
+def _app_keyboard():
+    return {"inline_keyboard": [[{
+        "text": "📱 Открыть приложение",
+        "url": f"https://t.me/{os.getenv('BOT_USERNAME')}/{os.getenv('APP_SLUG', 'app')}",
+    }]]}
+
+
+def build_digest(kind, summaries):
+    """Сводное сообщение (тело sendMessage без chat_id) по накопленным summary (HTML, см. route)"""
+    n = len(summaries)
+    shown = summaries[:DIGEST_NAMES_SHOWN]
+    rest = n - len(shown)
+    if kind == "follow":
+        text = f"👥 {n} {_plural(n, 'новый подписчик', 'новых подписчика', 'новых подписчиков')}: " + ", ".join(shown)
+        if rest:
+            text += f" и ещё {rest}"
+    else:
+        text = f"🎯 {n} {_plural(n, 'новый пост', 'новых поста', 'новых постов')} по вашим навыкам:\n\n"
+        text += "\n".join(f"• {summary}" for summary in shown)
+        if rest:
+            text += f"\n\n…и ещё {rest}"
+    return {"text": text, "parse_mode": "HTML", "reply_markup": _app_keyboard()}
+
+
+def route(conn, kind, user_id, payload, summary, mode=None):
+    """
+    Сообщение получателю user_id по его настройке. Вызывать в потоке-писателе.
+    payload — одиночное сообщение (уходит как есть, если копить нечего),
+    summary — строка для дайджеста (имя подписчика, превью поста), уже экранированная
+    для parse_mode HTML: build_digest вставляет её как есть.
+    Возвращает 'sent', 'buffered' или 'off'.
+    """
+    if mode is None:
+        row = conn.execute(
+            f"SELECT {PREFERENCE_COLUMNS[kind]} FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        mode = _mode(kind, row[0] if row else None)
+    if mode == "off":
+        return "off"
+    if mode == "instant":
+        outbox.enqueue(conn, kind, user_id, payload)
+        return "sent"
+
+    now = time.time()
+    schedule = conn.execute(
+        "SELECT flush_at, last_sent_at FROM digest_schedule WHERE user_id = ? AND kind = ?",
+        (user_id, kind)
+    ).fetchone()
+    flush_at = schedule["flush_at"] if schedule else None
+    last_sent_at = (schedule["last_sent_at"] if schedule else None) or 0.0
+
+    if mode == "auto" and flush_at is None and last_sent_at <= now - DIGEST_WINDOW:
+        outbox.enqueue(conn, kind, user_id, payload)
+        conn.execute("""
+            INSERT INTO digest_schedule (user_id, kind, flush_at, last_sent_at) VALUES (?, ?, NULL, ?)
+            ON CONFLICT(user_id, kind) DO UPDATE SET flush_at = NULL, last_sent_at = excluded.last_sent_at
+        """, (user_id, kind, now))
+        return "sent"
+
+    conn.execute("""
+        INSERT INTO notification_digest (user_id, kind, summary, payload, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, kind, summary, json.dumps(payload, ensure_ascii=False), now))
+    if flush_at is None:
+        # auto: окно отсчитывается от последнего отправленного сообщения
+        flush_at = max(now, last_sent_at + DIGEST_WINDOW) if mode == "auto" else now + DIGEST_WINDOW
+        conn.execute("""
+            INSERT INTO digest_schedule (user_id, kind, flush_at, last_sent_at) VALUES (?, ?, ?, NULL)
+            ON CONFLICT(user_id, kind) DO UPDATE SET flush_at = excluded.flush_at
+        """, (user_id, kind, flush_at))
+    return "buffered"
+
+
+def route_many(conn, kind, user_ids, payload, summary):
+    """route() для списка получателей: настройки читаются одним запросом"""
+    column = PREFERENCE_COLUMNS[kind]
+    modes = dict(conn.execute(
+        f"SELECT user_id, {column} FROM profiles WHERE user_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(user_ids)),)
+    ).fetchall())
+    results = {}
+    for user_id in user_ids:
+        result = route(conn, kind, user_id, payload, summary, _mode(kind, modes.get(user_id)))
+        results[result] = results.get(result, 0) + 1
+    return results
+
+
+def _due(conn, now, limit):
+    return [tuple(row) for row in conn.execute("""
+        SELECT user_id, kind FROM digest_schedule
+        WHERE flush_at IS NOT NULL AND flush_at <= ?
+        LIMIT ?
+    """, (now, limit))]
+
+
+def _flush(conn, user_id, kind, now):
+    """Накопленное -> одно сообщение в outbox. Возвращает число свёрнутых уведомлений"""
+    items = conn.execute("""
+        SELECT summary, payload FROM notification_digest
+        WHERE user_id = ? AND kind = ?
+        ORDER BY id
+    """, (user_id, kind)).fetchall()
+    conn.execute("DELETE FROM notification_digest WHERE user_id = ? AND kind = ?", (user_id, kind))
+    conn.execute("""
+        UPDATE digest_schedule SET flush_at = NULL, last_sent_at = COALESCE(?, last_sent_at)
+        WHERE user_id = ? AND kind = ?
+    """, (now if items else None, user_id, kind))
+    if not items:
+        return 0
+    if len(items) == 1:
+        payload = json.loads(items[0]["payload"])
+    else:
+        payload = build_digest(kind, [item["summary"] for item in items])
+    outbox.enqueue(conn, f"{kind}_digest", user_id, payload)
+    return len(items)
+
+
+class DigestScheduler:
+    """start() — поток, который раз в poll_interval отправляет дайджесты с наступившим flush_at"""
+
+    def __init__(self, poll_interval: float = DIGEST_POLL_INTERVAL):
+        self._poll_interval = poll_interval
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.digests = 0
+        self.collapsed = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="digests", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.flush_due()
+            except Exception as e:
+                print(f"❌ Дайджесты: {e}")
+            self._stopping.wait(self._poll_interval)
+
+    def flush_due(self, now=None):
+        """Отправляет все дайджесты, срок которых наступил. Возвращает их число"""
+        now = now or time.time()
+        sent = 0
+        # Ошибка одного получателя не останавливает проход: его flush_at остаётся,
+        # дайджест уйдёт на следующем круге, а до конца этого прохода он пропускается
+        failed = set()
+        while True:
+            with db.read_connection() as conn:
+                due = [key for key in _due(conn, now, DIGEST_BATCH + len(failed)) if key not in failed]
+            for user_id, kind in due:
+                try:
+                    count = db.write(_flush, user_id, kind, now)
+                except Exception as e:
+                    failed.add((user_id, kind))
+                    print(f"❌ Дайджест {kind} для {user_id}: {e}")
+                    continue
+                if count:
+                    sent += 1
+                    with self._lock:
+                        self.digests += 1
+                        self.collapsed += count
+            if len(due) < DIGEST_BATCH:
+                break
+        if sent:
+            outbox.wake()
+        return sent
+
+    def stats(self):
+        with db.read_connection() as conn:
+            buffered = conn.execute(
+                "SELECT COUNT(*) FROM digest_schedule WHERE flush_at IS NOT NULL"
+            ).fetchone()[0]
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "window": DIGEST_WINDOW,
+                "pending_digests": buffered,
+                "digests": self.digests,
+                "collapsed": self.collapsed,
+                # Сколько сообщений не ушло благодаря дайджестам
+                "messages_saved": self.collapsed - self.digests,
+            }
@@ -2,9 +2,23 @@
 // ОБНОВЛЕНО: Добавлена функция handleResponse для "пробрасывания" ошибок валидации
 // ОБНОВЛЕНО (Glass): Добавлена функция saveGlassPreference
 // УДАЛЕНО: Функция updateOnlineStatus
+// ОБНОВЛЕНО (Session): initData обменивается на токен сессии (/api/auth),
+//   все запросы идут с заголовком Authorization вместо initData в теле
+// ОБНОВЛЕНО (ETag): ответы с ETag запоминаются, повторный запрос идёт с If-None-Match,
+//   и на 304 отдаётся сохранённое тело
 
 let CONFIG = {};
 
+// Токен сессии, выданный /api/auth
+let SESSION = { token: null, expiresAt: 0 };
+let sessionPromise = null;
+// Обновляем токен заранее, за минуту до истечения
+const SESSION_REFRESH_MARGIN_MS = 60 * 1000;
+
+// url + тело запроса -> { etag, text }; Map хранит порядок вставки, старые записи вытесняются
+const ETAG_CACHE = new Map();
+const ETAG_CACHE_MAX = 100;
+
 /**
  * Устанавливает конфигурацию, полученную из app.js
  */
@@ -37,6 +51,97 @@ async function handleResponse(response) {
 }
 
 
+/**
+ * Возвращает действующий токен сессии, при необходимости получая новый через /api/auth.
+ * Параллельные вызовы используют один и тот же запрос.
+ */
+export async function ensureSession(initData) {
+    if (SESSION.token && Date.now() < SESSION.expiresAt - SESSION_REFRESH_MARGIN_MS) {
+        return SESSION.token;
+    }
+    if (!initData) return null;
+    if (!sessionPromise) {
+        sessionPromise = (async () => {
+            const response = await fetch(`${CONFIG.backendUrl}/api/auth`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ initData: initData })
+            });
+            const data = await handleResponse(response);
+            // expires_in, а не expires_at: часы телефона могут расходиться с сервером
+            SESSION = { token: data.token, expiresAt: Date.now() + data.expires_in * 1000 };
+            return SESSION.token;
+        })().finally(() => { sessionPromise = null; });
+    }
+    return sessionPromise;
+}
+
+function clearSession() {
+    SESSION = { token: null, expiresAt: 0 };
+}
+
+/**
+ * POST JSON с авторизацией по токену сессии.
+ * Если токен получить не удалось или сервер его отверг (401 invalid_session) — повторяет
+ * запрос со старым initData в теле. Другие 403 — отказ по существу, их не повторяем.
+ * Возвращает сырой Response.
+ */
+export async function authorizedPost(url, initData, payload = {}, extraHeaders = {}) {
+    const token = await ensureSession(initData).catch(() => null);
+    if (token) {
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}`, ...extraHeaders },
+            body: JSON.stringify(payload)
+        });
+        if (response.status !== 401) return response;
+        clearSession();
+    }
+    return await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', ...extraHeaders },
+        body: JSON.stringify({ initData: initData, ...payload })
+    });
+}
+
+/**
+ * authorizedPost с условным запросом: если на этот же запрос уже был ответ с ETag,
+ * шлём If-None-Match, а 304 превращаем обратно в 200 с сохранённым телом.
+ * Снаружи выглядит как обычный Response, поэтому подходит и для api.js, и для postJSON.
+ */
+export async function conditionalPost(url, initData, payload = {}) {
+    const key = `${url}|${JSON.stringify(payload)}`;
+    const cached = ETAG_CACHE.get(key);
+    const response = await authorizedPost(url, initData, payload, cached ? { 'If-None-Match': cached.etag } : {});
+
+    if (response.status === 304 && cached) {
+        ETAG_CACHE.delete(key);
+        ETAG_CACHE.set(key, cached);
+        return new Response(cached.text, {
+            status: 200,
+            headers: { 'Content-Type': 'application/json', 'ETag': cached.etag }
+        });
+    }
+
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        const text = await response.clone().text();
+        ETAG_CACHE.delete(key);
+        ETAG_CACHE.set(key, { etag, text });
+        if (ETAG_CACHE.size > ETAG_CACHE_MAX) {
+            ETAG_CACHE.delete(ETAG_CACHE.keys().next().value);
+        }
+    } else {
+        ETAG_CACHE.delete(key);
+    }
+    return response;
+}
+
+async function postWithAuth(path, initData, payload = {}) {
+    const response = await conditionalPost(`${CONFIG.backendUrl}${path}`, initData, payload);
+    return await handleResponse(response);
+}
+
 /**
  * Загружает /config
  */
@@ -54,35 +159,29 @@ export async function loadConfig() {
  * Загружает профиль текущего пользователя
  */
 export async function loadProfileData(initData) {
-    const response = await fetch(`${CONFIG.backendUrl}/get-profile`, { 
-        method: 'POST', 
-        headers: { 'Content-Type': 'application/json' }, 
-        body: JSON.stringify({ initData: initData }) 
-    });
-    // Используем handleResponse, хотя здесь ошибок не ожидаем
-    return await handleResponse(response);
+    return await postWithAuth('/get-profile', initData);
 }
 
 /**
  * Загружает профиль конкретного пользователя по ID
  */
 export async function loadTargetUserProfile(initData, target_user_id) {
-    const response = await fetch(`${CONFIG.backendUrl}/get-user-by-id`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, target_user_id: target_user_id })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/get-user-by-id', initData, { target_user_id: target_user_id });
 }
 
 /**
  * Сохраняет (создает/обновляет) профиль пользователя
  */
 export async function saveProfileData(formData) {
+    // initData остаётся в formData как запасной вариант, токен идёт в заголовке
+    const token = await ensureSession(formData.get('initData')).catch(() => null);
     const response = await fetch(`${CONFIG.backendUrl}/save-profile`, { 
         method: 'POST', 
+        headers: token ? { 'Authorization': `Bearer ${token}` } : {},
         body: formData 
     });
+    // Токен отвергнут, initData тоже не подошла — следующий запрос получит новый токен
+    if (response.status === 401) clearSession();
     // handleResponse поймает ошибку 400 Validation Error
     return await handleResponse(response);
 }
@@ -91,12 +190,14 @@ export async function saveProfileData(formData) {
  * Загружает всех пользователей для ленты
  */
 export async function loadFeedData(initData) {
-    const response = await fetch(`${CONFIG.backendUrl}/get-all-profiles`, { 
-        method: 'POST', 
-        headers: { 'Content-Type': 'application/json' }, 
-        body: JSON.stringify({ initData: initData }) 
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/get-all-profiles', initData);
+}
+
+/**
+ * Поиск людей: { q, status, skills } + cursor из next_cursor прошлой страницы
+ */
+export async function searchProfiles(initData, cursor = null, filters = {}) {
+    return await postWithAuth('/api/search-profiles', initData, cursor ? { ...filters, cursor } : filters);
 }
 
 /**
@@ -109,218 +210,135 @@ export async function loadFeedData(initData) {
  * Сохраняет выбранный язык
  */
 export async function saveLanguagePreference(initData, lang) {
-    const response = await fetch(`${CONFIG.backendUrl}/save-language`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, lang: lang })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/save-language', initData, { lang: lang });
 }
 
 /**
  * Сохраняет выбранную тему (auto, light, dark)
  */
 export async function saveThemeSelection(initData, theme, lang) {
-    const response = await fetch(`${CONFIG.backendUrl}/save-theme`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, theme: theme, lang: lang })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/save-theme', initData, { theme: theme, lang: lang });
 }
 
 /**
  * Активирует 'custom' тему на сервере
  */
 export async function activateCustomTheme(initData, lang) {
-     const response = await fetch(`${CONFIG.backendUrl}/save-theme`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, theme: 'custom', lang: lang })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/save-theme', initData, { theme: 'custom', lang: lang });
 }
 
 /**
  * Сохраняет цвета кастомной темы
  */
 export async function saveCustomTheme(initData, colors, lang) {
-    const response = await fetch(`${CONFIG.backendUrl}/save-custom-theme`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, colors: colors, lang: lang })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/save-custom-theme', initData, { colors: colors, lang: lang });
 }
 
 /**
  * (НОВАЯ ФУНКЦИЯ) Сохраняет настройку "Стекла"
  */
 export async function saveGlassPreference(initData, isEnabled) {
-    const response = await fetch(`${CONFIG.backendUrl}/api/save-glass-preference`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, is_enabled: isEnabled })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/api/save-glass-preference', initData, { is_enabled: isEnabled });
+}
+
+/**
+ * Режимы уведомлений в Telegram: 'auto' | 'digest' | 'instant' | 'off'
+ * settings: { follow_alerts?, skill_match_alerts? }
+ */
+export async function saveNotificationSettings(initData, settings) {
+    return await postWithAuth('/api/save-notification-settings', initData, settings);
 }
 
 /**
  * Получает username пользователя по его TG ID
  */
 export async function getTelegramUserInfo(initData, target_user_id) {
-    const response = await fetch(`${CONFIG.backendUrl}/get-telegram-user-info`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, target_user_id: target_user_id })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/get-telegram-user-info', initData, { target_user_id: target_user_id });
 }
 
 /**
  * Подписаться на пользователя
  */
 export async function followUser(initData, target_user_id) {
-    const response = await fetch(`${CONFIG.backendUrl}/follow`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, target_user_id: target_user_id })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/follow', initData, { target_user_id: target_user_id });
 }
 
 /**
  * Отписаться от пользователя
  */
 export async function unfollowUser(initData, target_user_id) {
-    const response = await fetch(`${CONFIG.backendUrl}/unfollow`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, target_user_id: target_user_id })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/unfollow', initData, { target_user_id: target_user_id });
 }
 
 /**
  * Создает новый пост (запрос)
  */
 export async function createPost(postData) {
-    const response = await fetch(`${CONFIG.backendUrl}/api/create-post`, { 
-        method: 'POST', 
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(postData) 
-    });
-    return await handleResponse(response);
+    const { initData, ...payload } = postData;
+    return await postWithAuth('/api/create-post', initData, payload);
 }
 
 /**
- * Загружает ленту постов (запросов)
+ * Загружает ленту постов (запросов).
+ * cursor — next_cursor из предыдущего ответа (для следующей страницы),
+ * filters — { post_type, skills, experience, q } для серверного поиска
  */
-export async function loadPostsFeed(initData) {
-    const response = await fetch(`${CONFIG.backendUrl}/api/get-posts-feed`, { 
-        method: 'POST', 
-        headers: { 'Content-Type': 'application/json' }, 
-        body: JSON.stringify({ initData: initData }) 
-    });
-    return await handleResponse(response);
+export async function loadPostsFeed(initData, cursor = null, filters = {}) {
+    return await postWithAuth('/api/get-posts-feed', initData, cursor ? { ...filters, cursor: cursor } : filters);
 }
 
 /**
  * Загружает только посты текущего пользователя
  */
 export async function loadMyPosts(initData) {
-    const response = await fetch(`${CONFIG.backendUrl}/api/get-my-posts`, { 
-        method: 'POST', 
-        headers: { 'Content-Type': 'application/json' }, 
-        body: JSON.stringify({ initData: initData }) 
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/api/get-my-posts', initData);
 }
 
 /**
  * Удаляет пост
  */
 export async function deletePost(initData, post_id) {
-    const response = await fetch(`${CONFIG.backendUrl}/api/delete-post`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, post_id: post_id })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/api/delete-post', initData, { post_id: post_id });
 }
 
 /**
  * Обновляет пост
  */
 export async function updatePost(initData, post_id, postData) {
-    const response = await fetch(`${CONFIG.backendUrl}/api/update-post`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ 
-            initData: initData, 
-            post_id: post_id,
-            ...postData
-        })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/api/update-post', initData, { post_id: post_id, ...postData });
 }
 
 /**
  * Загружает один пост по ID (для Deep Links)
  */
 export async function getPostById(initData, post_id) {
-    const response = await fetch(`${CONFIG.backendUrl}/api/get-post-by-id`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ initData: initData, post_id: post_id })
-    });
-    return await handleResponse(response);
+    return await postWithAuth('/api/get-post-by-id', initData, { post_id: post_id });
 }
 
 /**
  * Проверяет возможность откликнуться на пост
  */
 export async function checkCanRespond(initData, post_id) {
-  const response = await fetch(`${CONFIG.backendUrl}/api/check-can-respond`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ initData: initData, post_id: post_id })
-  });
-  return await handleResponse(response);
+  return await postWithAuth('/api/check-can-respond', initData, { post_id: post_id });
 }
 
 /**
  * Отправляет запрос на отклик
  */
 export async function respondToPost(initData, post_id, message) {
-  const response = await fetch(`${CONFIG.backendUrl}/api/respond-post`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ initData: initData, post_id: post_id, message: message })
-  });
-  return await handleResponse(response);
+  return await postWithAuth('/api/respond-post', initData, { post_id: post_id, message: message });
 }
 
 /**
  * Сохраняет настройку "Закрыть прямые сообщения"
  */
 export async function saveDirectMessagesPrivacy(initData, isDisabled) {
-  const response = await fetch(`${CONFIG.backendUrl}/api/save-direct-messages-privacy`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ initData: initData, is_disabled: isDisabled })
-  });
-  return await handleResponse(response);
+  return await postWithAuth('/api/save-direct-messages-privacy', initData, { is_disabled: isDisabled });
 }
 
 /**
  * Сохраняет настройку "Требовать одобрение откликов"
  */
 export async function savePostsApprovalPrivacy(initData, isRequired) {
-  const response = await fetch(`${CONFIG.backendUrl}/api/save-posts-approval-privacy`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ initData: initData, is_required: isRequired })
-  });
-  return await handleResponse(response);
+  return await postWithAuth('/api/save-posts-approval-privacy', initData, { is_required: isRequired });
 }
\ No newline at end of file
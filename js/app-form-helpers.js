@@ -29,6 +29,8 @@ export function setupDynamicList(tg, t, addButton, container, template, maxItems
         const itemElement = newItemFragment.querySelector('.dynamic-item');
         
         if (data) {
+            // id строки в БД: по нему сервер понимает, что элемент изменён, а не добавлен заново
+            if (data.id) itemElement.dataset.id = data.id;
             if (template.id === 'link-template') { 
                 itemElement.querySelector('.link-input').value = data || ''; 
             } else if (template.id === 'experience-template') {
@@ -132,6 +134,7 @@ export function setupDynamicList(tg, t, addButton, container, template, maxItems
                     is_current: itemElement.querySelector('.experience-is-current').checked ? 1 : 0, 
                     description: itemElement.querySelector('.experience-description').value.trim() 
                 }; 
+                if (itemElement.dataset.id) itemData.id = Number(itemElement.dataset.id);
                 if (itemData.job_title || itemData.company) items.push(itemData); 
             } else if (template.id === 'education-template') { 
                 itemData = { 
@@ -142,6 +145,7 @@ export function setupDynamicList(tg, t, addButton, container, template, maxItems
                     end_date: itemElement.querySelector('.education-end-date').value.trim(), 
                     description: itemElement.querySelector('.education-description').value.trim() 
                 }; 
+                if (itemElement.dataset.id) itemData.id = Number(itemElement.dataset.id);
                 if (itemData.institution) items.push(itemData); 
             } 
         }); 
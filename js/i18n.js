@@ -12,10 +12,9 @@ export const supportedLangs = ['ru', 'en'];
  */
 export async function loadTranslations(lang) {
     try {
-        const cacheBuster = `?v=${new Date().getTime()}`;
-        // --- ИЗМЕНЕНИЕ ЗДЕСЬ ---
-        // Добавлен слэш в начало, чтобы путь был от корня сайта
-        const response = await fetch(`/locales/${lang}.json${cacheBuster}`);
+        // Путь от корня сайта. Без cache buster: сервер отдаёт переводы с
+        // Cache-Control: no-cache, браузер перепроверяет их по ETag (304)
+        const response = await fetch(`/locales/${lang}.json`);
         
         if (!response.ok) throw new Error(`Failed to load ${lang}.json`);
         translations = await response.json();
@@ -25,7 +25,8 @@ const quickFiltersHost = document.getElementById('feed-quick-filters');
 function App({ mountInto, overlayHost }) {
   const [cfg, setCfg] = useState(null);
   const [profiles, setProfiles] = useState([]);
-  const [filtered, setFiltered] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const isLoadingMoreRef = useRef(false);
   const [selected, setSelected] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
 
@@ -78,30 +79,72 @@ function App({ mountInto, overlayHost }) {
     return () => { cancelled = true; };
   }, []);
 
+  // Фильтры каталога уходят на сервер (/api/search-profiles): поиск идёт по всем профилям
+  const searchFilters = useMemo(() => {
+    const q = debouncedSearchQuery.trim();
+    const searchSkills = q.toLowerCase().split(',').map(s => s.trim()).filter(Boolean);
+    const selectedLower = selectedSkills.map(s => s.toLowerCase());
+    // Строка поиска совпадает с выбранными тегами → это не текстовый запрос
+    const queryIsSkills = searchSkills.length === selectedLower.length &&
+      searchSkills.every(s => selectedLower.includes(s));
+    return {
+      status: statusFilter || undefined,
+      skills: selectedSkills.length ? selectedSkills : undefined,
+      q: q && !queryIsSkills ? q : undefined
+    };
+  }, [debouncedSearchQuery, selectedSkills, statusFilter]);
+
+  // Номер последнего запроса: ответы на устаревшие фильтры отбрасываем
+  const requestSeqRef = useRef(0);
+
   // --- ЗАГРУЗКА ---
   useEffect(() => {
     if (!cfg || !cfg.backendUrl) return;
+    const seq = ++requestSeqRef.current;
     setIsLoading(true);
     const fetchProfiles = async () => {
       try {
-        const resp = await postJSON(`${cfg.backendUrl}/get-all-profiles`, { initData: tg?.initData });
+        const resp = await postJSON(`${cfg.backendUrl}/api/search-profiles`, { initData: tg?.initData, ...searchFilters });
+        if (seq !== requestSeqRef.current) return;
         if (resp?.ok) {
           const loadedProfiles = resp.profiles || [];
           setProfiles(loadedProfiles);
-          setFiltered(loadedProfiles);
+          setNextCursor(resp.next_cursor || null);
           
           ProfilesManager.loadMany(loadedProfiles);
         } else {
           setProfiles([]);
+          setNextCursor(null);
         }
       } catch (e) {
         console.error(e);
       } finally {
-        setIsLoading(false);
+        if (seq === requestSeqRef.current) setIsLoading(false);
       }
     };
     fetchProfiles();
-  }, [cfg]);
+  }, [cfg, searchFilters]);
+
+  // Бесконечная прокрутка: следующая страница по курсору
+  const loadMoreProfiles = useCallback(async () => {
+    if (!cfg?.backendUrl || !nextCursor || isLoadingMoreRef.current) return;
+    isLoadingMoreRef.current = true;
+    const seq = requestSeqRef.current;
+    try {
+      const resp = await postJSON(`${cfg.backendUrl}/api/search-profiles`, { initData: tg?.initData, ...searchFilters, cursor: nextCursor });
+      if (seq !== requestSeqRef.current) return;
+      if (resp?.ok) {
+        const page = resp.profiles || [];
+        setProfiles(prev => {
+          const seen = new Set(prev.map(p => p.user_id));
+          return [...prev, ...page.filter(p => !seen.has(p.user_id))];
+        });
+        setNextCursor(resp.next_cursor || null);
+        ProfilesManager.loadMany(page);
+      }
+    } catch (e) {}
+    finally { isLoadingMoreRef.current = false; }
+  }, [cfg, nextCursor, searchFilters]);
 
   // --- УМНЫЙ ПОИСК ---
   useEffect(() => {
@@ -175,65 +218,6 @@ function App({ mountInto, overlayHost }) {
   }, [selectedSkills, syncInputs, statusFilter]);
 
 
-  // --- ФИЛЬТРАЦИЯ ---
-  useEffect(() => {
-  const qLower = debouncedSearchQuery.trim().toLowerCase();
-  const hasSearch = !!qLower;
-  const hasSkills = selectedSkills.length > 0;
-  const hasStatus = !!statusFilter;
-
-  if (!hasSearch && !hasSkills && !hasStatus) {
-    setFiltered(profiles);
-    return;
-  }
-
-  const next = profiles.filter((p) => {
-    // 1) Фильтр по статусу профиля
-    if (hasStatus && p.status !== statusFilter) {
-      return false;
-    }
-
-    // 2) Навыки
-    let skillsArray = [];
-    try { skillsArray = JSON.parse(p.skills || '[]'); } catch (e) {}
-    if (!Array.isArray(skillsArray)) skillsArray = [];
-
-    if (hasSkills) {
-      const matchesSkills = selectedSkills.every((s) =>
-        skillsArray.some((userSkill) => userSkill.toLowerCase() === s.toLowerCase())
-      );
-      if (!matchesSkills) return false;
-    }
-
-    // 3) Поиск по тексту
-    if (hasSearch) {
-      const isSearchMatchingSkills =
-        hasSkills && selectedSkills.join(', ').toLowerCase() === qLower;
-      if (isSearchMatchingSkills) return true;
-
-      const fullName = `${p.first_name || ''} ${p.last_name || ''}`.toLowerCase();
-      const about = (p.bio || '').toLowerCase();
-      const skillsText = skillsArray.join(' ').toLowerCase();
-      const terms = qLower
-        .replace(/,/g, ' ')
-        .split(' ')
-        .map((s) => s.trim())
-        .filter(Boolean);
-
-      return terms.every(
-        (term) =>
-          fullName.includes(term) ||
-          about.includes(term) ||
-          skillsText.includes(term)
-      );
-    }
-
-    return true;
-  });
-
-  setFiltered(next);
-}, [profiles, debouncedSearchQuery, selectedSkills, statusFilter]);
-
   // ============= DEEP LINK =============
   useEffect(() => {
     const handleDeepLink = (event) => {
@@ -286,16 +270,16 @@ function App({ mountInto, overlayHost }) {
     syncInputs('');
     };
 
-  const filterKey = JSON.stringify({ s: debouncedSearchQuery, k: selectedSkills.length });
+  const filterKey = JSON.stringify({ s: debouncedSearchQuery, k: selectedSkills.length, st: statusFilter });
 
   return h('div', { style: { padding: '0 12px 12px', position: 'relative', minHeight: '200px' } },
     h(TopSpacer),
     h(AnimatePresence, { mode: 'wait' },
         (isLoading)
             ? h(motion.div, { key: 'skeleton', initial: { opacity: 0 }, animate: { opacity: 1 }, exit: { opacity: 0 }, style: { position: 'absolute', top: 0, left: '12px', width: 'calc(100% - 24px)', pointerEvents: 'none' } }, h(SkeletonList, null))
-            : h(FeedList, { key: `feed-list-${filterKey}`, profiles: filtered, onOpen: onOpen, containerRef: listContainerRef })
+            : h(FeedList, { key: `feed-list-${filterKey}`, profiles: profiles, hasMore: !!nextCursor, onLoadMore: loadMoreProfiles, onOpen: onOpen, containerRef: listContainerRef })
     ),
-    h(EmptyState, { text: t('feed_empty'), visible: !isLoading && filtered.length === 0, onReset: handleResetFilters }),
+    h(EmptyState, { text: t('feed_empty'), visible: !isLoading && profiles.length === 0, onReset: handleResetFilters }),
     h(Suspense, { fallback: h(ProfileFallback) },
         h(AnimatePresence, null, selected && h(ProfileSheet, { user: selected, onClose, }))
     ),
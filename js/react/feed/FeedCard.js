@@ -34,7 +34,9 @@ const FeedCard = memo(function FeedCard({ u, index, onOpen }) {
   const skillsContainerRef = useRef(null);
   const skillsOverflow = useTwoLineSkillsOverflow(skillsContainerRef, skills.length);
 
-  const avatar = u.photo_path ? `${window.__CONFIG?.backendUrl || location.origin}/${u.photo_path}` : 'https://t.me/i/userpic/320/null.jpg';
+  // В карточке — уменьшенный вариант, оригинал/medium — только в ProfileSheet
+  const avatarPath = u.photo_thumb_path || u.photo_path;
+  const avatar = avatarPath ? `${window.__CONFIG?.backendUrl || location.origin}/${avatarPath}` : 'https://t.me/i/userpic/320/null.jpg';
 
   const statusConf = STATUS_CONFIG[u.status] || null;
 
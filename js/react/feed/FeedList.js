@@ -6,23 +6,26 @@ import FeedCard from './FeedCard.js';
 const h = React.createElement;
 const BATCH_SIZE = 10;
 
-function FeedList({ profiles, onOpen, containerRef }) {
+function FeedList({ profiles, hasMore, onLoadMore, onOpen, containerRef }) {
   const [visibleCount, setVisibleCount] = useState(BATCH_SIZE);
   const sentinelRef = useRef(null);
 
   // Observer для подгрузки
   useEffect(() => {
-    if (visibleCount >= profiles.length) return;
+    const canRevealMore = visibleCount < profiles.length;
+    if (!canRevealMore && !hasMore) return;
     const observer = new IntersectionObserver((entries) => {
         if (entries[0].isIntersecting) {
-            setVisibleCount(prev => prev + BATCH_SIZE);
+            // Сначала показываем уже загруженное, потом просим следующую страницу
+            if (canRevealMore) setVisibleCount(prev => prev + BATCH_SIZE);
+            else if (onLoadMore) onLoadMore();
         }
     }, { root: null, rootMargin: '400px', threshold: 0.1 }); // Грузим заранее (400px)
 
     const sentinel = sentinelRef.current;
     if (sentinel) observer.observe(sentinel);
     return () => { if (sentinel) observer.unobserve(sentinel); };
-  }, [visibleCount, profiles.length]);
+  }, [visibleCount, profiles.length, hasMore, onLoadMore]);
 
   const visibleProfiles = profiles.slice(0, visibleCount);
 
@@ -49,7 +52,7 @@ function FeedList({ profiles, onOpen, containerRef }) {
     }),
 
     // Невидимый элемент-триггер внизу
-    visibleCount < profiles.length && h('div', {
+    (visibleCount < profiles.length || hasMore) && h('div', {
         ref: sentinelRef,
         style: { height: '20px', width: '100%', opacity: 0, pointerEvents: 'none' }
     })
@@ -65,7 +65,8 @@ const PostCard = memo(function PostCard({
 
   const author = post.author || { user_id: 'unknown', first_name: 'Unknown' };
   const { content = 'Нет описания', post_type = 'default', skill_tags = [], created_at } = post;
-  const avatar = author.photo_path ? `${window.__CONFIG?.backendUrl || location.origin}/${author.photo_path}` : 'https://t.me/i/userpic/320/null.jpg';
+  const avatarPath = author.photo_thumb_path || author.photo_path;
+  const avatar = avatarPath ? `${window.__CONFIG?.backendUrl || location.origin}/${avatarPath}` : 'https://t.me/i/userpic/320/null.jpg';
 
   // Динамические цвета типов
   const type_color = typeColors[post_type] || typeColors.default;
@@ -23,12 +23,15 @@ import PostContextMenu from './PostContextMenu.js';
 import EditPostScreen from './EditPostScreen.js';
 import PostDetailSheet from './PostDetailSheet.js';
 
-const RespondSheet = React.lazy(() => import('../react/shared/RespondSheet.js').then(m => ({ default: m.default })));
+const RespondSheet = React.lazy(() => import('../shared/RespondSheet.js').then(m => ({ default: m.default })));
 const quickFiltersHost = document.getElementById('posts-quick-filters');
 
 function App({ mountInto, overlayHost }) {
   const [cfg, setCfg] = useState(null);
   const [posts, setPosts] = useState([]);
+  // Курсор следующей страницы ленты (null — страниц больше нет)
+  const [nextCursor, setNextCursor] = useState(null);
+  const isLoadingMoreRef = useRef(false);
   
   const [profileToShow, setProfileToShow] = useState(null);
   const [postToShow, setPostToShow] = useState(null);
@@ -88,23 +91,66 @@ function App({ mountInto, overlayHost }) {
   }, []);
   
   // --- ЗАГРУЗКА ---
+  const withLayoutKeys = (rawPosts) => rawPosts.map((p, index) => {
+       const uniqueLayoutPrefix = `post-${p.post_id || 'no-id'}-author-${p.author?.user_id || 'unknown'}`;
+       return { ...p, post_id: p.post_id || `generated-${index}-${uniqueLayoutPrefix}`, uniqueLayoutPrefix: uniqueLayoutPrefix };
+  });
+
+  // Фильтры ленты уходят на сервер: поиск идёт по всем постам, а не по загруженной странице
+  const feedFilters = useMemo(() => {
+    const q = debouncedSearchQuery.trim();
+    const searchSkills = q.toLowerCase().split(',').map(s => s.trim()).filter(Boolean);
+    const selectedLower = selectedSkills.map(s => s.toLowerCase());
+    // Строка поиска совпадает с выбранными тегами → это не текстовый запрос
+    const queryIsSkills = searchSkills.length === selectedLower.length &&
+      searchSkills.every(s => selectedLower.includes(s));
+    return {
+      post_type: statusFilter || undefined,
+      skills: selectedSkills.length ? selectedSkills : undefined,
+      q: q && !queryIsSkills ? q : undefined
+    };
+  }, [debouncedSearchQuery, selectedSkills, statusFilter]);
+
+  // Номер последнего запроса: ответы на устаревшие фильтры отбрасываем
+  const requestSeqRef = useRef(0);
+
   const fetchPosts = useCallback(async () => {
     if (!cfg?.backendUrl) return; 
+    const seq = ++requestSeqRef.current;
     setIsLoading(true);
     try {
       const endpoint = showMyPostsOnly ? '/api/get-my-posts' : '/api/get-posts-feed';
-      const resp = await postJSON(`${cfg.backendUrl}${endpoint}`, { initData: tg?.initData });
+      const body = showMyPostsOnly ? { initData: tg?.initData } : { initData: tg?.initData, ...feedFilters };
+      const resp = await postJSON(`${cfg.backendUrl}${endpoint}`, body);
+      if (seq !== requestSeqRef.current) return;
       if (resp?.ok) {
-        const rawPosts = resp.posts || [];
-        const postsWithKeys = rawPosts.map((p, index) => {
-             const uniqueLayoutPrefix = `post-${p.post_id || 'no-id'}-author-${p.author?.user_id || 'unknown'}`;
-             return { ...p, post_id: p.post_id || `generated-${index}-${uniqueLayoutPrefix}`, uniqueLayoutPrefix: uniqueLayoutPrefix };
+        setPosts(withLayoutKeys(resp.posts || []));
+        setNextCursor(resp.next_cursor || null);
+      } else { setPosts([]); setNextCursor(null); }
+    } catch (e) {
+      if (seq === requestSeqRef.current) { setPosts([]); setNextCursor(null); }
+    }
+    finally { if (seq === requestSeqRef.current) setIsLoading(false); }
+  }, [cfg, showMyPostsOnly, feedFilters]);
+
+  // Бесконечная прокрутка: следующая страница ленты по курсору
+  const loadMorePosts = useCallback(async () => {
+    if (!cfg?.backendUrl || !nextCursor || showMyPostsOnly || isLoadingMoreRef.current) return;
+    isLoadingMoreRef.current = true;
+    const seq = requestSeqRef.current;
+    try {
+      const resp = await postJSON(`${cfg.backendUrl}/api/get-posts-feed`, { initData: tg?.initData, ...feedFilters, cursor: nextCursor });
+      if (seq !== requestSeqRef.current) return;
+      if (resp?.ok) {
+        setPosts(prev => {
+          const seen = new Set(prev.map(p => p.post_id));
+          return [...prev, ...withLayoutKeys(resp.posts || []).filter(p => !seen.has(p.post_id))];
         });
-        setPosts(postsWithKeys); 
-      } else { setPosts([]); }
-    } catch (e) { setPosts([]); }
-    finally { setIsLoading(false); }
-  }, [cfg, showMyPostsOnly]);
+        setNextCursor(resp.next_cursor || null);
+      }
+    } catch (e) {}
+    finally { isLoadingMoreRef.current = false; }
+  }, [cfg, nextCursor, showMyPostsOnly, feedFilters]);
 
   useEffect(() => {
     (async () => {
@@ -160,7 +206,7 @@ function App({ mountInto, overlayHost }) {
           if (!event.detail) return;
           if (typeof event.detail.showMyPostsOnly === 'boolean') {
               if (event.detail.showMyPostsOnly !== showMyPostsOnly) {
-                  setPosts([]); setShowMyPostsOnly(event.detail.showMyPostsOnly);
+                  setPosts([]); setNextCursor(null); setShowMyPostsOnly(event.detail.showMyPostsOnly);
               }
           }
           if (Array.isArray(event.detail.skills)) {
@@ -212,7 +258,9 @@ function App({ mountInto, overlayHost }) {
   const effectiveQuery = isMobile ? searchQuery : debouncedSearchQuery;
 
   // --- ФИЛЬТРАЦИЯ ---
+  // Лента фильтруется на сервере (feedFilters); на клиенте — только «Мои посты»
   const filtered = useMemo(() => {
+  if (!showMyPostsOnly) return posts;
   const qLower = effectiveQuery  // ← ИЗМЕНЕНО
     .toLowerCase()
     .trim();
@@ -272,7 +320,7 @@ function App({ mountInto, overlayHost }) {
     
     return true;
   });
-}, [posts, effectiveQuery, selectedSkills, statusFilter]);
+}, [posts, effectiveQuery, selectedSkills, statusFilter, showMyPostsOnly]);
 
   // --- УПРАВЛЕНИЕ ПОКАЗОМ EmptyState ---
   useEffect(() => {
@@ -655,6 +703,8 @@ function App({ mountInto, overlayHost }) {
       ? h(PostsList, {
           key: `list-${filterKey}`,
           posts: filtered,
+          hasMore: !!nextCursor,
+          onLoadMore: loadMorePosts,
           onOpenProfile: handleOpenProfile,
           onOpenPostSheet: handleOpenPostSheet,
           onOpenContextMenu: handleOpenContextMenu,
@@ -11,6 +11,8 @@ const BATCH_SIZE = 10;
 
 function PostsList({
   posts,
+  hasMore,
+  onLoadMore,
   // filterSignature, // Больше не нужен, так как мы используем key в родителе
   onOpenProfile,
   onOpenPostSheet,
@@ -34,11 +36,14 @@ function PostsList({
   // поэтому visibleCount и так сброшен.
 
   useEffect(() => {
-    if (visibleCount >= posts.length) return;
+    const canRevealMore = visibleCount < posts.length;
+    if (!canRevealMore && !hasMore) return;
 
     const observer = new IntersectionObserver((entries) => {
         if (entries[0].isIntersecting) {
-            setVisibleCount(prev => prev + BATCH_SIZE);
+            // Сначала показываем уже загруженное, потом просим следующую страницу
+            if (canRevealMore) setVisibleCount(prev => prev + BATCH_SIZE);
+            else if (onLoadMore) onLoadMore();
         }
     }, {
         root: null, 
@@ -52,7 +57,7 @@ function PostsList({
     return () => {
         if (sentinel) observer.unobserve(sentinel);
     };
-  }, [visibleCount, posts.length]);
+  }, [visibleCount, posts.length, hasMore, onLoadMore]);
 
   const visiblePosts = posts.slice(0, visibleCount);
 
@@ -105,7 +110,7 @@ function PostsList({
         });
     }),
     
-    visibleCount < posts.length && h('div', {
+    (visibleCount < posts.length || hasMore) && h('div', {
         ref: sentinelRef,
         style: { height: '20px', width: '100%', opacity: 0, pointerEvents: 'none' } 
     })
@@ -7,6 +7,7 @@
 
 import React, { useState, useEffect, useLayoutEffect, useRef } from 'https://cdn.jsdelivr.net/npm/react@18.2.0/+esm';
 import { useDragControls } from 'https://cdn.jsdelivr.net/npm/framer-motion@10.16.5/+esm';
+import { conditionalPost } from '../../api.js';
 
 const h = React.createElement;
 
@@ -157,11 +158,10 @@ export const t = (k, d = {}) => {
 };
 
 export async function postJSON(url, body) {
-    const res = await fetch(url, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(body)
-    });
+    // initData уходит только в /api/auth, дальше запросы идут с токеном сессии;
+    // повторные запросы — с If-None-Match (304 → сохранённое тело)
+    const { initData, ...payload } = body || {};
+    const res = await conditionalPost(url, initData, payload);
     if (!res.ok) {
         throw new Error(`HTTP error! status: ${res.status}`);
     }
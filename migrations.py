@@ -0,0 +1,619 @@
+# migrations.py
+#
+# Версионированные миграции схемы БД.
+# Применённые версии хранятся в таблице schema_migrations; каждая миграция —
+# упорядоченный список шагов, выполняемый в одной транзакции.
+# Шаг — либо SQL-строка, либо функция step(conn) -> SQL | None
+# (None значит «уже применено»), поэтому шаги идемпотентны и в dry-run
+# можно показать ровно тот SQL, который будет выполнен.
+
+import json
+import sqlite3
+
+
+def column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def add_column(table, column, definition):
+    """ALTER TABLE ... ADD COLUMN, только если колонки ещё нет"""
+    def step(conn):
+        if column_exists(conn, table, column):
+            return None
+        return f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+    return step
+
+
+def version_trigger(name, event, table, scopes):
+    """
+    Триггер, увеличивающий счётчики data_versions (см. миграцию 9).
+    scopes — SQL-выражения имени области, например "'posts:' || NEW.user_id".
+    """
+    bumps = "\n".join(
+        f"            INSERT INTO data_versions (scope, version) VALUES ({scope}, 1)\n"
+        f"            ON CONFLICT(scope) DO UPDATE SET version = version + 1;"
+        for scope in scopes
+    )
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS {name}
+        AFTER {event} ON {table}
+        BEGIN
+{bumps}
+        END
+    """
+
+
+def _table_exists(conn, table):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def _normalized_skills(raw):
+    """
+    Копия posts_search.parse_skills на момент миграций 6 и 8: навыки нормализуются
+    в Python (lower() SQLite не трогает кириллицу), а не триггерами с
+    пользовательской функцией — иначе любой писатель без неё (sqlite3 CLI,
+    скрипты обслуживания) падал бы.
+    """
+    try:
+        skills = json.loads(raw) if raw else []
+    except ValueError:
+        return []
+    if not isinstance(skills, list):
+        return []
+    return list(dict.fromkeys(
+        skill for skill in (str(value).strip().lower() for value in skills if isinstance(value, str)) if skill
+    ))
+
+
+def skills_backfill(table, id_column, skills_column, target):
+    """
+    Заполнение таблицы навыков target (skill, id) по JSON-навыкам строк table.
+    Пары считаются в Python и передаются в SQL одним JSON-литералом.
+    """
+    def step(conn):
+        if not _table_exists(conn, table):
+            return None
+        pairs = [
+            [skill, row_id]
+            for row_id, raw in conn.execute(f"SELECT {id_column}, {skills_column} FROM {table}")
+            for skill in _normalized_skills(raw)
+        ]
+        if not pairs:
+            return None
+        literal = json.dumps(pairs, ensure_ascii=False).replace("'", "''")
+        return (
+            f"INSERT OR IGNORE INTO {target} "
+            f"SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each('{literal}')"
+        )
+    return step
+
+
+# Профили, у которых сохранённые счётчики подписок расходятся с таблицей follows
+_FOLLOW_COUNTS_MISMATCH = '''
+    followers_count IS NOT (SELECT COUNT(*) FROM follows WHERE following_id = profiles.user_id)
+    OR following_count IS NOT (SELECT COUNT(*) FROM follows WHERE follower_id = profiles.user_id)
+'''
+
+RECONCILE_FOLLOW_COUNTS_SQL = '''
+    UPDATE profiles
+    SET followers_count = (SELECT COUNT(*) FROM follows WHERE following_id = profiles.user_id),
+        following_count = (SELECT COUNT(*) FROM follows WHERE follower_id = profiles.user_id)
+    WHERE ''' + _FOLLOW_COUNTS_MISMATCH
+
+
+# (version, name, steps)
+MIGRATIONS = [
+    (1, "baseline schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS profiles (
+            user_id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            bio TEXT,
+            link1 TEXT,
+            link2 TEXT,
+            link3 TEXT,
+            link4 TEXT,
+            link5 TEXT,
+            photo_path TEXT,
+            skills TEXT,
+            language_code TEXT DEFAULT 'ru',
+            theme TEXT DEFAULT 'auto',
+            custom_theme TEXT,
+            is_glass_enabled INTEGER DEFAULT 1,
+            is_direct_messages_disabled INTEGER DEFAULT 0,
+            is_posts_approval_required INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'networking',
+            followers_count INTEGER DEFAULT 0,
+            following_count INTEGER DEFAULT 0,
+            is_private INTEGER DEFAULT 0,
+            telegram_username TEXT,
+            last_active TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS work_experience (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            job_title TEXT,
+            company TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            is_current INTEGER DEFAULT 0,
+            description TEXT,
+            FOREIGN KEY (user_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS education (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            institution TEXT,
+            degree TEXT,
+            field_of_study TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            FOREIGN KEY (user_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS follows (
+            follower_id INTEGER NOT NULL,
+            following_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (follower_id, following_id),
+            FOREIGN KEY (follower_id) REFERENCES profiles(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (following_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS posts (
+            post_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            post_type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            full_description TEXT,
+            skill_tags TEXT,
+            experience_years TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            from_user_id INTEGER,
+            post_id INTEGER,
+            message TEXT,
+            is_read INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES profiles(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (from_user_id) REFERENCES profiles(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (post_id) REFERENCES posts(post_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS notification_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            date TEXT NOT NULL,
+            post_id INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_notif_user_date ON notification_log(user_id, date, type)",
+        '''
+        CREATE TABLE IF NOT EXISTS response_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL,
+            from_user_id INTEGER NOT NULL,
+            to_user_id INTEGER NOT NULL,
+            message TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (post_id) REFERENCES posts(post_id) ON DELETE CASCADE,
+            FOREIGN KEY (from_user_id) REFERENCES profiles(user_id) ON DELETE CASCADE,
+            FOREIGN KEY (to_user_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reporter_id INTEGER NOT NULL,
+            target_type TEXT NOT NULL,
+            target_id INTEGER NOT NULL,
+            reason TEXT,
+            status TEXT DEFAULT 'pending',
+            resolved_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            resolved_at TIMESTAMP,
+            FOREIGN KEY (reporter_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS bans (
+            user_id INTEGER PRIMARY KEY,
+            banned_by INTEGER NOT NULL,
+            reason TEXT,
+            ban_type TEXT DEFAULT 'shadow',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, is_read)",
+        "CREATE INDEX IF NOT EXISTS idx_response_requests_status ON response_requests(to_user_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_status ON reports(status)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_created ON posts(created_at DESC)",
+    ]),
+
+    # Базы, созданные по первому определению profiles, не имеют колонок приватности;
+    # is_deleted фильтруется лентой, но в схеме его не было.
+    (2, "missing columns", [
+        add_column("profiles", "is_direct_messages_disabled", "INTEGER DEFAULT 0"),
+        add_column("profiles", "is_posts_approval_required", "INTEGER DEFAULT 0"),
+        add_column("posts", "is_deleted", "INTEGER NOT NULL DEFAULT 0"),
+    ]),
+
+    # Индексы под запросы server.py и bot_handlers.py
+    (3, "hot query indexes", [
+        # Лента: WHERE is_deleted = 0 ORDER BY created_at DESC LIMIT N
+        "CREATE INDEX IF NOT EXISTS idx_posts_feed ON posts(is_deleted, created_at DESC)",
+        # Мои посты: WHERE user_id = ? ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_posts_user_created ON posts(user_id, created_at DESC)",
+        "DROP INDEX IF EXISTS idx_posts_created",
+        # Число подписчиков и рассылка подписчикам: WHERE following_id = ?
+        # (по follower_id уже работает PRIMARY KEY)
+        "CREATE INDEX IF NOT EXISTS idx_follows_following ON follows(following_id, follower_id)",
+        # Кулдаун отклика: WHERE post_id = ? AND from_user_id = ? ORDER BY created_at DESC LIMIT 1
+        "CREATE INDEX IF NOT EXISTS idx_response_requests_cooldown ON response_requests(post_id, from_user_id, created_at DESC, status)",
+        # /notifications: WHERE user_id = ? AND is_read = 0 ORDER BY created_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications(user_id, is_read, created_at DESC)",
+        "DROP INDEX IF EXISTS idx_notifications_user",
+        # Опыт и образование профиля: WHERE user_id = ? ORDER BY id DESC
+        "CREATE INDEX IF NOT EXISTS idx_work_experience_user ON work_experience(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_education_user ON education(user_id)",
+        "ANALYZE",
+    ]),
+
+    # Счётчики подписок ведёт сама БД: O(1) на чтение вместо COUNT(*) по follows
+    (4, "follow counter triggers", [
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_follows_insert_counts
+        AFTER INSERT ON follows
+        BEGIN
+            UPDATE profiles SET followers_count = followers_count + 1 WHERE user_id = NEW.following_id;
+            UPDATE profiles SET following_count = following_count + 1 WHERE user_id = NEW.follower_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_follows_delete_counts
+        AFTER DELETE ON follows
+        BEGIN
+            UPDATE profiles SET followers_count = followers_count - 1 WHERE user_id = OLD.following_id;
+            UPDATE profiles SET following_count = following_count - 1 WHERE user_id = OLD.follower_id;
+        END
+        ''',
+        RECONCILE_FOLLOW_COUNTS_SQL,
+    ]),
+
+    # Keyset-пагинация ленты: ORDER BY created_at DESC, post_id DESC
+    # обслуживается обратным проходом по индексу, без сортировки
+    (5, "feed keyset index", [
+        "CREATE INDEX IF NOT EXISTS idx_posts_feed_keyset ON posts(is_deleted, created_at, post_id)",
+        "DROP INDEX IF EXISTS idx_posts_feed",
+    ]),
+
+    # Серверный поиск по ленте (posts_search.py)
+    (6, "post search", [
+        # Навыки поста в нормализованном виде: поиск по навыку — это поиск по индексу
+        '''
+        CREATE TABLE IF NOT EXISTS post_skills (
+            skill TEXT NOT NULL,
+            post_id INTEGER NOT NULL,
+            PRIMARY KEY (skill, post_id),
+            FOREIGN KEY (post_id) REFERENCES posts(post_id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_post_skills_post ON post_skills(post_id)",
+        # Дальше таблицу ведёт приложение (posts_search.sync_post_skills) в транзакции записи поста
+        skills_backfill("posts", "post_id", "skill_tags", "post_skills"),
+        # Полнотекстовый индекс (external content: текст хранится только в posts)
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            content, full_description,
+            content='posts', content_rowid='post_id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_posts_fts_insert
+        AFTER INSERT ON posts
+        BEGIN
+            INSERT INTO posts_fts (rowid, content, full_description)
+            VALUES (NEW.post_id, NEW.content, NEW.full_description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_posts_fts_delete
+        AFTER DELETE ON posts
+        BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, full_description)
+            VALUES ('delete', OLD.post_id, OLD.content, OLD.full_description);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_posts_fts_update
+        AFTER UPDATE OF content, full_description ON posts
+        BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, content, full_description)
+            VALUES ('delete', OLD.post_id, OLD.content, OLD.full_description);
+            INSERT INTO posts_fts (rowid, content, full_description)
+            VALUES (NEW.post_id, NEW.content, NEW.full_description);
+        END
+        ''',
+        "INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')",
+        # Фильтры по типу и опыту с той же сортировкой, что и у ленты
+        "CREATE INDEX IF NOT EXISTS idx_posts_type_keyset ON posts(is_deleted, post_type, created_at, post_id)",
+        "CREATE INDEX IF NOT EXISTS idx_posts_experience_keyset ON posts(is_deleted, experience_years, created_at, post_id)",
+        "ANALYZE",
+    ]),
+
+    # Поиск людей (profiles_search.py): документ на пользователя, пересобирается при save_profile
+    (7, "profile search", [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS profiles_fts USING fts5(
+            first_name, bio, skills, job_title, company,
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        ''',
+        "DELETE FROM profiles_fts",
+        # Копия profiles_search.INDEX_DOCUMENTS_SQL на момент миграции: миграция не должна
+        # меняться вместе с кодом. Новый состав документа — новая миграция с перестройкой индекса
+        '''
+        INSERT INTO profiles_fts (rowid, first_name, bio, skills, job_title, company)
+        SELECT
+            p.user_id, p.first_name, p.bio,
+            (SELECT group_concat(value, ' ')
+             FROM json_each(CASE WHEN json_valid(p.skills) THEN p.skills ELSE '[]' END)),
+            we.job_title, we.company
+        FROM profiles p
+        LEFT JOIN work_experience we ON we.id = (
+            SELECT id FROM work_experience WHERE user_id = p.user_id
+            ORDER BY is_current DESC, id DESC LIMIT 1
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_profiles_status ON profiles(status)",
+    ]),
+
+    # Навыки пользователей в нормализованном виде (как post_skills): получатели
+    # notify_skill_match ищутся по индексу, а не перебором всех профилей
+    (8, "user skills", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_skills (
+            skill TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (skill, user_id),
+            FOREIGN KEY (user_id) REFERENCES profiles(user_id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_user_skills_user ON user_skills(user_id)",
+        # Дальше таблицу ведёт приложение (profiles_search.sync_user_skills) в транзакции записи профиля
+        skills_backfill("profiles", "user_id", "skills", "user_skills"),
+        "ANALYZE",
+    ]),
+
+    # Счётчики версий данных для ETag: ответ можно не пересобирать, если версии не менялись.
+    # Области: posts, posts:<user_id>, profiles (поля каталога и ленты),
+    # profile:<user_id> (всё, что отдаёт /get-user-by-id), follows:<follower_id>
+    (9, "data versions", [
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        version_trigger("trg_posts_version_insert", "INSERT", "posts", ["'posts'", "'posts:' || NEW.user_id"]),
+        version_trigger("trg_posts_version_update", "UPDATE", "posts", ["'posts'", "'posts:' || NEW.user_id"]),
+        version_trigger("trg_posts_version_delete", "DELETE", "posts", ["'posts'", "'posts:' || OLD.user_id"]),
+        version_trigger("trg_profiles_version_insert", "INSERT", "profiles", ["'profiles'", "'profile:' || NEW.user_id"]),
+        version_trigger("trg_profiles_version_update", "UPDATE", "profiles", ["'profile:' || NEW.user_id"]),
+        # Тема, приватность и прочие настройки не видны в каталоге и ленте — их не считаем
+        version_trigger(
+            "trg_profiles_version_update_public",
+            "UPDATE OF first_name, bio, photo_path, skills, language_code, status, followers_count, following_count",
+            "profiles", ["'profiles'"]
+        ),
+        version_trigger("trg_profiles_version_delete", "DELETE", "profiles", ["'profiles'", "'profile:' || OLD.user_id"]),
+        version_trigger("trg_work_experience_version_insert", "INSERT", "work_experience", ["'profiles'", "'profile:' || NEW.user_id"]),
+        version_trigger("trg_work_experience_version_update", "UPDATE", "work_experience", ["'profiles'", "'profile:' || NEW.user_id"]),
+        version_trigger("trg_work_experience_version_delete", "DELETE", "work_experience", ["'profiles'", "'profile:' || OLD.user_id"]),
+        version_trigger("trg_education_version_insert", "INSERT", "education", ["'profile:' || NEW.user_id"]),
+        version_trigger("trg_education_version_update", "UPDATE", "education", ["'profile:' || NEW.user_id"]),
+        version_trigger("trg_education_version_delete", "DELETE", "education", ["'profile:' || OLD.user_id"]),
+        version_trigger("trg_follows_version_insert", "INSERT", "follows", ["'follows:' || NEW.follower_id"]),
+        version_trigger("trg_follows_version_delete", "DELETE", "follows", ["'follows:' || OLD.follower_id"]),
+    ]),
+
+    # Уменьшенный аватар для карточек в ленте и каталоге (avatars.py)
+    (10, "avatar thumbnails", [
+        add_column("profiles", "photo_thumb_path", "TEXT"),
+    ]),
+
+    # Очередь исходящих сообщений бота (outbox.py): запрос только кладёт строку,
+    # отправляют воркеры. Время — unix timestamp (REAL).
+    (11, "notification outbox", [
+        '''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            method TEXT NOT NULL DEFAULT 'sendMessage',
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON notification_outbox(status, next_attempt_at)",
+    ]),
+
+    # Рассылки подписчикам (broadcasts.py): получатели ставятся в outbox порциями,
+    # cursor — последний поставленный follower_id (продолжение после перезапуска)
+    (12, "broadcasts", [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            author_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            cursor INTEGER NOT NULL DEFAULT 0,
+            enqueued INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            dead INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status)",
+        add_column("notification_outbox", "priority", "INTEGER NOT NULL DEFAULT 0"),
+        add_column("notification_outbox", "broadcast_id", "INTEGER"),
+        "DROP INDEX IF EXISTS idx_outbox_status_due",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(status, priority, next_attempt_at)",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_outbox_broadcast ON notification_outbox(broadcast_id, status)
+        WHERE broadcast_id IS NOT NULL
+        ''',
+    ]),
+
+    # Дайджесты (digests.py): уведомления копятся по получателю и виду,
+    # digest_schedule — когда отправить накопленное и когда ушло последнее сообщение.
+    # Режимы в profiles: auto / digest / instant / off
+    (13, "notification digests", [
+        add_column("profiles", "follow_alerts", "TEXT DEFAULT 'auto'"),
+        add_column("profiles", "skill_match_alerts", "TEXT DEFAULT 'instant'"),
+        '''
+        CREATE TABLE IF NOT EXISTS notification_digest (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_digest_user_kind ON notification_digest(user_id, kind)",
+        '''
+        CREATE TABLE IF NOT EXISTS digest_schedule (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            flush_at REAL,
+            last_sent_at REAL,
+            PRIMARY KEY (user_id, kind)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_digest_schedule_due ON digest_schedule(flush_at) WHERE flush_at IS NOT NULL",
+    ]),
+
+    # Последнее место работы (каталог, поиск людей): WHERE user_id = ?
+    # ORDER BY is_current DESC, id DESC LIMIT 1 — первая строка индекса, без сортировки.
+    # idx_work_experience_user остаётся для списка опыта (ORDER BY id DESC)
+    (14, "latest job index", [
+        "CREATE INDEX IF NOT EXISTS idx_work_experience_latest ON work_experience(user_id, is_current DESC, id DESC)",
+        "ANALYZE",
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def applied_versions(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ).fetchone()
+    if not exists:
+        return set()
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def _resolve(conn, step):
+    return step(conn) if callable(step) else step
+
+
+def reconcile_follow_counts(db_name, dry_run=False):
+    """
+    Сверяет profiles.followers_count/following_count с таблицей follows и
+    исправляет расхождения. Возвращает число исправленных (при dry_run — найденных) профилей.
+    """
+    conn = sqlite3.connect(db_name, timeout=30.0)
+    try:
+        if dry_run:
+            return conn.execute("SELECT COUNT(*) FROM profiles WHERE " + _FOLLOW_COUNTS_MISMATCH).fetchone()[0]
+        count = conn.execute(RECONCILE_FOLLOW_COUNTS_SQL).rowcount
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+
+def migrate(db_name, dry_run=False):
+    """
+    Применяет недостающие миграции по порядку. Возвращает список применённых
+    (или, при dry_run, ожидающих) версий. Каждая миграция — своя транзакция:
+    если шаг падает, версия не записывается и схема остаётся как была.
+    """
+    conn = sqlite3.connect(db_name, timeout=30.0)
+    conn.isolation_level = None
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        pending = pending_migrations(conn)
+        if not pending:
+            print("✅ Схема БД актуальна")
+            return []
+
+        for version, name, steps in pending:
+            print(f"🔧 Миграция {version}: {name}{' (dry-run)' if dry_run else ''}")
+            if dry_run:
+                for step in steps:
+                    sql = _resolve(conn, step)
+                    print(f"   {' '.join(sql.split())};" if sql else "   -- уже применено")
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _ensure_version_table(conn)
+                for step in steps:
+                    sql = _resolve(conn, step)
+                    if sql:
+                        conn.execute(sql)
+                conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print(f" ✅ Миграция {version} применена")
+
+        return [m[0] for m in pending]
+    finally:
+        conn.close()
@@ -0,0 +1,352 @@
+# outbox.py
+#
+# Надёжная очередь сообщений бота (таблица notification_outbox, миграция 11).
+# notify_* только кладут строки в очередь — в той же транзакции, что и само
+# событие, — и запрос не ждёт Telegram. OutboxWorker забирает готовые к отправке
+# строки и отправляет их пулом потоков:
+#   - успех — status = 'sent' (через OUTBOX_RETENTION_DAYS строка удаляется);
+#   - 429 / 5xx / сетевая ошибка — повтор с экспоненциальной задержкой
+#     (или через retry_after из ответа Telegram);
+#   - прочие 4xx (бот заблокирован, чат не найден) и исчерпанные попытки — 'dead'.
+#
+# Лимиты Telegram: общий token bucket на бота (OUTBOX_RATE сообщений в секунду,
+# после 429 — пауза на retry_after для всех потоков) и не чаще одного сообщения
+# в OUTBOX_PER_CHAT_INTERVAL секунд в один чат (такое сообщение откладывается,
+# попытка не тратится). Строки с меньшим priority уходят первыми: рассылки
+# (broadcasts.py, priority 1) не задерживают личные уведомления.
+#
+# Отправитель — один процесс (как и поток-писатель БД). Строки, которые были
+# в работе при падении, после перезапуска отправляются заново: доставка
+# «хотя бы один раз».
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+import db
+import telegram_client
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 8))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 2.0))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", 5.0))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", 3600.0))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+OUTBOX_RATE = float(os.getenv("OUTBOX_RATE", 30))
+OUTBOX_BURST = int(os.getenv("OUTBOX_BURST", 10))
+OUTBOX_PER_CHAT_INTERVAL = float(os.getenv("OUTBOX_PER_CHAT_INTERVAL", 1.0))
+
+PRIORITY_DIRECT = 0
+PRIORITY_BROADCAST = 1
+
+# Будит диспетчер сразу после постановки в очередь (иначе — раз в OUTBOX_POLL_INTERVAL)
+_wakeup = threading.Event()
+
+
+# ============ ПОСТАНОВКА В ОЧЕРЕДЬ (в потоке-писателе) ============
+
+def enqueue_many(conn, kind, chat_ids, payload, method="sendMessage",
+                 priority=PRIORITY_DIRECT, broadcast_id=None):
+    """Одно и то же сообщение нескольким получателям. payload — тело запроса Bot API без chat_id"""
+    now = time.time()
+    body = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    conn.executemany("""
+        INSERT INTO notification_outbox
+            (kind, chat_id, method, payload, priority, broadcast_id, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(kind, chat_id, method, body, priority, broadcast_id, now, now) for chat_id in chat_ids])
+
+
+def enqueue(conn, kind, chat_id, payload, method="sendMessage"):
+    enqueue_many(conn, kind, [chat_id], payload, method)
+
+
+def wake():
+    """Вызывать после COMMIT транзакции, поставившей сообщения"""
+    _wakeup.set()
+
+
+def send_later(kind, chat_id, payload, method="sendMessage"):
+    """Отдельная транзакция только с сообщением (когда события в БД нет)"""
+    db.write(enqueue, kind, chat_id, payload, method)
+    wake()
+
+
+# ============ ОТПРАВКА ============
+
+def _claim_due(conn, limit, now):
+    rows = conn.execute("""
+        SELECT id, kind, chat_id, method, payload, attempts
+        FROM notification_outbox
+        WHERE status = 'pending' AND next_attempt_at <= ?
+        ORDER BY priority, next_attempt_at
+        LIMIT ?
+    """, (now, limit)).fetchall()
+    conn.executemany(
+        "UPDATE notification_outbox SET status = 'sending' WHERE id = ?",
+        [(row["id"],) for row in rows]
+    )
+    return [dict(row) for row in rows]
+
+
+def _release_claimed(conn):
+    """После перезапуска: то, что было в работе, — снова в очередь"""
+    return conn.execute(
+        "UPDATE notification_outbox SET status = 'pending' WHERE status = 'sending'"
+    ).rowcount
+
+
+def _mark_sent(conn, message_id, now):
+    # next_attempt_at = время отправки: по нему старые строки чистятся через индекс
+    conn.execute("""
+        UPDATE notification_outbox
+        SET status = 'sent', attempts = attempts + 1, sent_at = ?, next_attempt_at = ?, last_error = NULL
+        WHERE id = ?
+    """, (now, now, message_id))
+
+
+def _mark_failed(conn, message_id, status, next_attempt_at, error):
+    conn.execute("""
+        UPDATE notification_outbox
+        SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+        WHERE id = ?
+    """, (status, next_attempt_at, error, message_id))
+
+
+def _defer(conn, message_id, next_attempt_at):
+    """Обратно в очередь без траты попытки (лимит на чат)"""
+    conn.execute(
+        "UPDATE notification_outbox SET status = 'pending', next_attempt_at = ? WHERE id = ?",
+        (next_attempt_at, message_id)
+    )
+
+
+def _prune_sent(conn, before):
+    return conn.execute(
+        "DELETE FROM notification_outbox WHERE status = 'sent' AND next_attempt_at < ?", (before,)
+    ).rowcount
+
+
+def backoff_delay(attempt, base=OUTBOX_BACKOFF_BASE, cap=OUTBOX_BACKOFF_MAX):
+    """Задержка перед повтором номер attempt (с 1): экспонента с джиттером"""
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
+
+
+class TokenBucket:
+    """
+    rate токенов в секунду, не больше burst подряд. acquire() блокирует поток до
+    появления токена; pause(seconds) — общая пауза (429 от Telegram).
+    """
+
+    def __init__(self, rate: float = OUTBOX_RATE, burst: int = OUTBOX_BURST):
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waited = 0.0
+        self.pauses = 0
+
+    def acquire(self):
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.waited += now - started
+                        return
+                    delay = (1 - self._tokens) / self._rate
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # После паузы — без накопленного запаса, иначе сразу снова 429
+            self._tokens = 0.0
+            self._updated = self._paused_until
+            self.pauses += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self._rate,
+                "burst": self._burst,
+                "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+                "pauses": self.pauses,
+                "waited_s": round(self.waited, 2),
+            }
+
+
+class OutboxWorker:
+    """
+    start() — поток-диспетчер + пул из workers потоков отправки.
+    client — telegram_client.TelegramClient; send(method, payload) можно подменить.
+    """
+
+    def __init__(self, client, workers: int = OUTBOX_WORKERS, send=None,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 rate: float = OUTBOX_RATE, per_chat_interval: float = OUTBOX_PER_CHAT_INTERVAL):
+        # Без повторов внутри вызова: повторы и 429 — забота очереди
+        self._send = send or (lambda method, payload: client.call(method, payload, retries=0))
+        self._bucket = TokenBucket(rate)
+        self._per_chat_interval = per_chat_interval
+        self._chat_next = {}  # chat_id -> monotonic-время, раньше которого в чат не пишем
+        self._workers = workers
+        self._max_attempts = max_attempts
+        self._poll_interval = poll_interval
+        self._executor = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+        self.deferred = 0
+        self.latency = db.LatencyStats()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        released = db.write(_release_claimed)
+        if released:
+            print(f"📮 Outbox: возвращено в очередь после перезапуска: {released}")
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="outbox")
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+        print(f"📮 Outbox запущен ({self._workers} потоков отправки)")
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        _wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._executor.shutdown(wait=True)
+            self._thread = None
+
+    def _run(self):
+        # В работе не больше двух сообщений на поток: остальное ждёт в БД, а не в памяти
+        capacity = self._workers * 2
+        in_flight = set()
+        while not self._stopping.is_set():
+            _wakeup.clear()
+            claimed = []
+            try:
+                if len(in_flight) < capacity:
+                    claimed = db.write(_claim_due, capacity - len(in_flight), time.time())
+                self._maybe_prune()
+            except Exception as e:
+                print(f"❌ Outbox: ошибка выборки очереди: {e}")
+
+            for message in claimed:
+                in_flight.add(self._executor.submit(self._deliver, message))
+
+            if in_flight:
+                if claimed and len(in_flight) < capacity:
+                    continue  # в очереди могут быть ещё готовые строки
+                _, in_flight = wait(in_flight, timeout=self._poll_interval, return_when=FIRST_COMPLETED)
+            else:
+                _wakeup.wait(self._poll_interval)
+
+    def _reserve_chat(self, chat_id):
+        """0, если в чат можно писать сейчас, иначе — через сколько секунд"""
+        now = time.monotonic()
+        with self._lock:
+            allowed_at = self._chat_next.get(chat_id, 0.0)
+            if allowed_at > now:
+                return allowed_at - now
+            self._chat_next[chat_id] = now + self._per_chat_interval
+            if len(self._chat_next) > 10000:
+                self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+            return 0.0
+
+    def _deliver(self, message):
+        wait_for = self._reserve_chat(message["chat_id"])
+        if wait_for:
+            try:
+                db.write(_defer, message["id"], time.time() + wait_for)
+                with self._lock:
+                    self.deferred += 1
+            except Exception as e:
+                print(f"❌ Outbox: не удалось отложить сообщение {message['id']}: {e}")
+            return
+
+        self._bucket.acquire()
+        started = time.perf_counter()
+        payload = {**json.loads(message["payload"]), "chat_id": message["chat_id"]}
+        try:
+            try:
+                self._send(message["method"], payload)
+            except telegram_client.TelegramError as e:
+                if e.status == 429 and e.retry_after:
+                    self._bucket.pause(e.retry_after)
+                self._failed(message, str(e), e.retryable, e.retry_after)
+            except requests.RequestException as e:
+                self._failed(message, f"network: {e}", True)
+            except Exception as e:
+                self._failed(message, f"{type(e).__name__}: {e}", False)
+            else:
+                db.write(_mark_sent, message["id"], time.time())
+                with self._lock:
+                    self.sent += 1
+        except Exception as e:
+            # Не записался статус — строка останется 'sending' до перезапуска
+            print(f"❌ Outbox: не удалось обновить сообщение {message['id']}: {e}")
+        finally:
+            self.latency.add(time.perf_counter() - started)
+
+    def _failed(self, message, error, retryable, retry_after=None):
+        attempt = message["attempts"] + 1
+        if retryable and attempt < self._max_attempts:
+            delay = retry_after if retry_after else backoff_delay(attempt)
+            db.write(_mark_failed, message["id"], "pending", time.time() + delay, error)
+            with self._lock:
+                self.retried += 1
+            return
+        db.write(_mark_failed, message["id"], "dead", time.time(), error)
+        with self._lock:
+            self.dead += 1
+        print(f"⚠️ Outbox: сообщение {message['id']} ({message['kind']}) для {message['chat_id']} не доставлено: {error}")
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        removed = db.write(_prune_sent, now - OUTBOX_RETENTION_DAYS * 86400)
+        if removed:
+            print(f"🧹 Outbox: удалено отправленных сообщений: {removed}")
+
+    def stats(self):
+        with db.read_connection() as conn:
+            queue = {
+                status: conn.execute(
+                    "SELECT COUNT(*) FROM notification_outbox WHERE status = ?", (status,)
+                ).fetchone()[0]
+                for status in ("pending", "sending", "dead")
+            }
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "workers": self._workers,
+                "queue": queue,
+                "sent": self.sent,
+                "retried": self.retried,
+                "dead": self.dead,
+                "deferred": self.deferred,
+                "rate_limit": self._bucket.stats(),
+                "latency": self.latency.stats(),
+            }
@@ -0,0 +1,134 @@
+# posts_search.py
+#
+# Запрос ленты постов с фильтрами (тип, навыки, опыт, текст) и keyset-пагинацией.
+# Вынесено из server.py без зависимостей от Flask, чтобы check_query_plans.py
+# мог проверить план каждой комбинации фильтров.
+#
+# Навыки ищутся по нормализованной таблице post_skills, текст — по FTS5-индексу
+# posts_fts (content + full_description). posts_fts ведут триггеры (миграция 6),
+# post_skills — sync_post_skills() в транзакции записи поста: навыки нормализуются
+# в Python, lower() SQLite кириллицу не трогает.
+
+import json
+import re
+
+POST_COLUMNS = '''
+        p.post_id, p.user_id, p.post_type, p.content, p.full_description, p.skill_tags, p.experience_years,
+        p.created_at,
+        pr.first_name as author_first_name,
+        pr.photo_path as author_photo_path,
+        pr.photo_thumb_path as author_photo_thumb_path
+'''
+
+# Ограничения, чтобы один запрос не превращался в десятки подзапросов
+MAX_SKILLS = 10
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_skill(skill):
+    return str(skill).strip().lower()
+
+
+def parse_skills(value):
+    """JSON-список навыков (строка из БД или список) -> нормализованные, без пустых и повторов"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    if not isinstance(value, list):
+        return []
+    return list(dict.fromkeys(
+        skill for skill in (normalize_skill(v) for v in value if isinstance(v, str)) if skill
+    ))
+
+
+def sync_post_skills(conn, post_id, skill_tags):
+    """Пересобирает post_skills поста. Вызывать внутри транзакции записи поста."""
+    conn.execute("DELETE FROM post_skills WHERE post_id = ?", (post_id,))
+    conn.executemany(
+        "INSERT INTO post_skills (skill, post_id) VALUES (?, ?)",
+        [(skill, post_id) for skill in parse_skills(skill_tags)]
+    )
+
+
+def build_fts_query(text):
+    """
+    Свободный текст -> выражение MATCH: каждое слово как префикс, все слова обязательны.
+    Спецсимволы FTS5 не пропускаем — берём только \\w+. None, если слов нет.
+    """
+    if not text:
+        return None
+    terms = _TERM_RE.findall(str(text).lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def build_feed_query(post_type=None, skills=None, experience=None, text=None, after=None, limit=20):
+    """
+    Возвращает (sql, params). after — (created_at, post_id) последнего поста
+    предыдущей страницы. Берётся limit + 1 строка, чтобы понять, есть ли продолжение.
+
+    Запрос «ведёт» самый избирательный источник, который уже отсортирован:
+    FTS-индекс (по rowid) для текста, post_skills (skill, post_id) для навыков,
+    иначе индексы posts (..., created_at, post_id). created_at проставляется
+    при вставке и не меняется, поэтому порядок post_id совпадает с порядком
+    (created_at, post_id) и сортировка результата не нужна.
+    """
+    skills = list(dict.fromkeys(
+        normalize_skill(s) for s in (skills or [])[:MAX_SKILLS] if str(s).strip()
+    ))
+    fts_query = build_fts_query(text)
+
+    where = ["p.is_deleted = 0"]
+    params = []
+
+    if fts_query:
+        source = "posts_fts f JOIN posts p ON p.post_id = f.rowid"
+        where.insert(0, "posts_fts MATCH ?")
+        params.append(fts_query)
+        order_by = "f.rowid DESC"
+        if after:
+            where.append("f.rowid < ?")
+            params.append(after[1])
+    elif skills:
+        source = "post_skills ps JOIN posts p ON p.post_id = ps.post_id"
+        where.insert(0, "ps.skill = ?")
+        params.append(skills.pop(0))
+        order_by = "ps.post_id DESC"
+        if after:
+            where.append("ps.post_id < ?")
+            params.append(after[1])
+    else:
+        source = "posts p"
+        order_by = "p.created_at DESC, p.post_id DESC"
+        if after:
+            where.append("(p.created_at, p.post_id) < (?, ?)")
+            params.extend(after)
+
+    if post_type:
+        where.append("p.post_type = ?")
+        params.append(post_type)
+
+    if experience:
+        where.append("p.experience_years = ?")
+        params.append(experience)
+
+    # Пост должен содержать ВСЕ выбранные навыки
+    for skill in skills:
+        where.append("EXISTS (SELECT 1 FROM post_skills WHERE skill = ? AND post_id = p.post_id)")
+        params.append(skill)
+
+    sql = (
+        f"SELECT {POST_COLUMNS}"
+        f"    FROM {source}\n"
+        f"    JOIN profiles pr ON p.user_id = pr.user_id\n"
+        f"    WHERE " + "\n      AND ".join(where) + "\n"
+        f"    ORDER BY {order_by}\n"
+        f"    LIMIT ?"
+    )
+    params.append(limit + 1)
+    return sql, params
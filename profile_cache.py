@@ -0,0 +1,111 @@
+# profile_cache.py
+#
+# Кэш собранных профилей (строка profiles + опыт + образование) для
+# /get-profile и /get-user-by-id. LRU по числу записей + TTL.
+# Поля, зависящие от зрителя (is_followed_by_viewer), в кэш не попадают.
+#
+# Инвалидация — явная, после COMMIT любой записи, меняющей профиль:
+# save_profile, настройки, статус, подписки (счётчики лежат в profiles).
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 5000))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 300))
+
+
+class ProfileCache:
+    """
+    get_or_load(user_id, loader) — профиль из кэша или loader(); None не кэшируется.
+    version — версия данных, прочитанная вызывающим (data_versions):
+    запись с другой версией считается промахом.
+    Если во время загрузки пришла инвалидация этого же user_id, результат отдаётся,
+    но не сохраняется: иначе читатель, начавший до записи, мог бы положить в кэш
+    старую версию. Инвалидации других пользователей загрузку не задевают.
+    """
+
+    def __init__(self, max_size: int = PROFILE_CACHE_SIZE, ttl: int = PROFILE_CACHE_TTL):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._cache = OrderedDict()  # user_id -> (profile, expires_at, version)
+        self._lock = threading.Lock()
+        # user_id -> [загрузок в работе, поколение]; поколение растёт при инвалидации,
+        # запись живёт, пока этот профиль кто-то загружает
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id, version=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None:
+                profile, expires_at, cached_version = entry
+                if expires_at > now and (version is None or version == cached_version):
+                    self._cache.move_to_end(user_id)
+                    self.hits += 1
+                    return dict(profile)
+                del self._cache[user_id]
+            self.misses += 1
+            return None
+
+    def get_or_load(self, user_id, loader, version=None):
+        profile = self.get(user_id, version)
+        if profile is not None:
+            return profile
+        with self._lock:
+            loading = self._loading.setdefault(user_id, [0, 0])
+            loading[0] += 1
+            generation = loading[1]
+        profile = None
+        try:
+            profile = loader()
+        finally:
+            # Снятие отметки о загрузке, сверка поколения и запись — под одной блокировкой:
+            # иначе invalidate() между ними не увидел бы загрузку и старый профиль попал бы в кэш
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[user_id]
+                if profile is not None and self._max_size > 0 and generation == loading[1]:
+                    self._cache[user_id] = (profile, time.monotonic() + self._ttl, version)
+                    self._cache.move_to_end(user_id)
+                    while len(self._cache) > self._max_size:
+                        self._cache.popitem(last=False)
+                        self.evictions += 1
+        if profile is None or self._max_size <= 0:
+            return profile
+        return dict(profile)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                loading = self._loading.get(user_id)
+                if loading is not None:
+                    loading[1] += 1
+                if self._cache.pop(user_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for loading in self._loading.values():
+                loading[1] += 1
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "max_size": self._max_size,
+                "ttl": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
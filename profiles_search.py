@@ -0,0 +1,147 @@
+# profiles_search.py
+#
+# Поиск людей для каталога (/api/search-profiles).
+# FTS5-таблица profiles_fts хранит по документу на пользователя (rowid = user_id):
+# имя, о себе, навыки и текущее место работы. Документ пересобирается
+# sync_profile() в той же транзакции, что и сохранение профиля.
+#
+# С текстом или навыками — ранжированная выдача bm25 (страницы по смещению),
+# без них — просмотр каталога по user_id (keyset).
+
+import base64
+import re
+
+import posts_search
+
+# Веса колонок bm25: first_name, bio, skills, job_title, company
+BM25_WEIGHTS = "bm25(10.0, 1.0, 5.0, 4.0, 2.0)"
+
+MAX_SKILLS = 10
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Документ поиска для профиля: навыки из JSON в строку, работа — текущая или последняя
+SEARCH_DOCUMENT_SQL = '''
+    SELECT
+        p.user_id, p.first_name, p.bio,
+        (SELECT group_concat(value, ' ')
+         FROM json_each(CASE WHEN json_valid(p.skills) THEN p.skills ELSE '[]' END)),
+        we.job_title, we.company
+    FROM profiles p
+    LEFT JOIN work_experience we ON we.id = (
+        SELECT id FROM work_experience WHERE user_id = p.user_id
+        ORDER BY is_current DESC, id DESC LIMIT 1
+    )
+'''
+
+# Заполнение индекса: целиком (миграция) или для одного профиля (+ WHERE p.user_id = ?)
+INDEX_DOCUMENTS_SQL = (
+    "INSERT INTO profiles_fts (rowid, first_name, bio, skills, job_title, company)"
+    + SEARCH_DOCUMENT_SQL
+)
+
+# Профиль попадает в каталог, только если он хоть чем-то заполнен (как в /get-all-profiles)
+_DIRECTORY_FILTER = '''p.user_id != ?
+      AND (p.bio IS NOT NULL AND p.bio != ''
+           OR p.photo_path IS NOT NULL
+           OR p.skills IS NOT NULL AND p.skills != '')'''
+
+
+def sync_profile(conn, user_id):
+    """Пересобирает документ поиска пользователя. Вызывать внутри транзакции записи профиля."""
+    conn.execute("DELETE FROM profiles_fts WHERE rowid = ?", (user_id,))
+    conn.execute(INDEX_DOCUMENTS_SQL + "    WHERE p.user_id = ?", (user_id,))
+
+
+def sync_user_skills(conn, user_id, skills):
+    """
+    Пересобирает user_skills (получатели notify_skill_match). Вызывать внутри транзакции
+    записи профиля; навыки нормализуются так же, как теги поста (posts_search.parse_skills).
+    """
+    conn.execute("DELETE FROM user_skills WHERE user_id = ?", (user_id,))
+    conn.executemany(
+        "INSERT INTO user_skills (skill, user_id) VALUES (?, ?)",
+        [(skill, user_id) for skill in posts_search.parse_skills(skills)]
+    )
+
+
+def build_match_query(text=None, skills=None):
+    """Слова текста — префиксы по всем колонкам, навыки — фразы в колонке skills. None, если пусто."""
+    parts = []
+    for skill in (skills or [])[:MAX_SKILLS]:
+        tokens = _TERM_RE.findall(str(skill).lower())
+        if tokens:
+            parts.append('skills : "' + " ".join(tokens) + '"')
+    for term in _TERM_RE.findall(str(text or "").lower())[:MAX_TERMS]:
+        parts.append(f'"{term}"*')
+    return " ".join(parts) or None
+
+
+def encode_cursor(kind, value):
+    return base64.urlsafe_b64encode(f"{kind}:{value}".encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает (kind, int); kind: 'o' — смещение в ранжированной выдаче, 'u' — последний user_id"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        kind, value = raw.split(":", 1)
+        if kind not in ("o", "u"):
+            raise ValueError
+        return kind, int(value)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def build_search_query(viewer_id, text=None, skills=None, status=None, cursor=None, limit=30):
+    """
+    Возвращает (sql, params, mode). mode == 'rank' — выдача по релевантности,
+    'browse' — весь каталог по user_id. Берётся limit + 1 строка, чтобы понять,
+    есть ли следующая страница. cursor — результат decode_cursor().
+    """
+    match = build_match_query(text, skills)
+    params = []
+
+    if match:
+        offset = cursor[1] if cursor and cursor[0] == "o" else 0
+        sql = f'''
+            SELECT
+                p.user_id, p.first_name, p.bio, p.photo_path, p.photo_thumb_path, p.skills, p.language_code, p.status,
+                f.job_title, f.company,
+                p.followers_count, p.following_count
+            FROM profiles_fts f
+            JOIN profiles p ON p.user_id = f.rowid
+            WHERE profiles_fts MATCH ? AND f.rank MATCH '{BM25_WEIGHTS}'
+              AND {_DIRECTORY_FILTER}
+        '''
+        params += [match, viewer_id]
+        if status:
+            sql += "      AND p.status = ?\n"
+            params.append(status)
+        sql += "            ORDER BY f.rank\n            LIMIT ? OFFSET ?"
+        params += [limit + 1, offset]
+        return sql, params, "rank"
+
+    sql = f'''
+        SELECT
+            p.user_id, p.first_name, p.bio, p.photo_path, p.photo_thumb_path, p.skills, p.language_code, p.status,
+            we.job_title, we.company,
+            p.followers_count, p.following_count
+        FROM profiles p
+        LEFT JOIN work_experience we ON we.id = (
+            SELECT id FROM work_experience WHERE user_id = p.user_id
+            ORDER BY is_current DESC, id DESC LIMIT 1
+        )
+        WHERE {_DIRECTORY_FILTER}
+    '''
+    params.append(viewer_id)
+    if status:
+        sql += "      AND p.status = ?\n"
+        params.append(status)
+    if cursor and cursor[0] == "u":
+        sql += "      AND p.user_id > ?\n"
+        params.append(cursor[1])
+    sql += "        ORDER BY p.user_id\n        LIMIT ?"
+    params.append(limit + 1)
+    return sql, params, "browse"
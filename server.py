@@ -1,43 +1,121 @@
 # server.py
 
-import sqlite3
+import base64
+import functools
 import hmac
 import hashlib
 import json
+import mimetypes
 import os
 from urllib.parse import unquote
-from werkzeug.utils import secure_filename
-import requests
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, abort, g
+from werkzeug.security import safe_join
 from flask_cors import CORS
 from dotenv import load_dotenv
 from datetime import datetime, timezone
 import threading
+import avatars
 import bot_handlers
+import broadcasts
+import build_assets
+import compression
+import db
+import digests
+import migrations
+import outbox
+import posts_search
+import profile_cache
+import profiles_search
+import telegram_client
+import telegram_users
+import tg_auth
 
 load_dotenv()
 
 # --- Пути и Конфигурация ---
 APP_ROOT = os.path.abspath(os.path.dirname(__file__))
 app = Flask(__name__)
-CORS(app)
+# ETag нужен клиенту для If-None-Match (см. js/api.js)
+CORS(app, expose_headers=["ETag"])
+# Сжатие JSON-ответов (gzip/brotli); статистика по эндпоинтам — в /internal/stats
+COMPRESSOR = compression.ResponseCompressor()
+COMPRESSOR.init_app(app)
 
 BOT, DP = bot_handlers.init_bot()
 
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER")
-DB_NAME = os.getenv("DB_NAME")
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True, mode=0o755)
 # SECURITY: Максимальный размер загружаемого файла (5MB)
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024
 
+# Раздача /uploads: "" — сам Flask (ETag, Last-Modified, Range),
+# "x-accel" — nginx по X-Accel-Redirect (internal location с alias на UPLOAD_FOLDER),
+# "x-sendfile" — Apache/lighttpd по X-Sendfile. Проверки и заголовки кэша — всегда здесь.
+UPLOADS_SENDFILE = os.getenv("UPLOADS_SENDFILE", "").lower()
+UPLOADS_ACCEL_PREFIX = os.getenv("UPLOADS_ACCEL_PREFIX", "/internal-uploads/")
+# Файлы с хэшем в имени (uploads/avatars) не меняются никогда, остальные — перепроверяются
+UPLOADS_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+UPLOADS_MAX_AGE = int(os.getenv("UPLOADS_MAX_AGE", 3600))
+app.config['USE_X_SENDFILE'] = UPLOADS_SENDFILE == "x-sendfile"
+
+# Фронтенд: если есть сборка build_assets.py (ASSETS_DIR/manifest.json) — отдаём её,
+# иначе исходники из корня проекта как есть
+ASSETS_DIR = os.getenv("ASSETS_DIR", build_assets.DEFAULT_OUT_DIR)
+ASSETS_MANIFEST = build_assets.load_manifest(ASSETS_DIR)
+STATIC_ROOT = ASSETS_DIR if ASSETS_MANIFEST else APP_ROOT
+HASHED_ASSETS = frozenset(ASSETS_MANIFEST.values())
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 BACKEND_URL = os.getenv("BACKEND_URL")
 APP_PORT = int(os.getenv("APP_PORT", 5000))
+# Токен для /internal/stats (если не задан — эндпоинт закрыт)
+STATS_TOKEN = os.getenv("STATS_TOKEN")
 
 if not BOT_TOKEN:
     raise ValueError("🔴 Не найден BOT_TOKEN в .env файле!")
 
+# Ключ WebAppData вычисляется один раз, проверенные initData кэшируются;
+# из каждой новой initData обновляется username (refresh_telegram_user)
+INIT_DATA_VERIFIER = tg_auth.InitDataVerifier(BOT_TOKEN, on_verified=lambda user: refresh_telegram_user(user))
+SESSION_TOKENS = tg_auth.SessionTokenSigner(BOT_TOKEN)
+
+# Собранные профили для /get-profile и /get-user-by-id; сбрасываются после каждой записи в профиль
+PROFILE_CACHE = profile_cache.ProfileCache()
+
+# Один клиент Bot API на процесс (пул keep-alive соединений, таймауты, повторы)
+TELEGRAM = telegram_client.TelegramClient(BOT_TOKEN)
+
+# Очередь сообщений бота: notify_* кладут в notification_outbox, отправляют воркеры
+OUTBOX = outbox.OutboxWorker(TELEGRAM)
+
+# username/first_name для /get-telegram-user-info: кэш -> profiles -> getChat
+TELEGRAM_USERS = telegram_users.ChatInfoCache()
+# getChat на потоке запроса: короткий таймаут и без повторов (неудача кэшируется)
+TELEGRAM_LOOKUP_TIMEOUT = (3.05, 5)
+# Рассылки подписчикам о новых постах (порциями в тот же outbox)
+BROADCASTER = broadcasts.Broadcaster()
+# Сводные уведомления о подписках / постах по навыкам (по настройкам пользователя)
+DIGESTS = digests.DigestScheduler()
+
+def start_background_workers():
+    """
+    Запуск фоновых отправщиков: OUTBOX, BROADCASTER, DIGESTS. ОБЯЗАТЕЛЬНО при любом
+    способе запуска — без них уведомления копятся в БД и не уходят. Импорт server.py
+    их не запускает: `python server.py` вызывает эту функцию сам, а под WSGI-сервером
+    (gunicorn и т.п.) рядом запускается отдельный процесс `python worker.py`.
+    Ровно один на базу: при старте OUTBOX возвращает в очередь «зависшие» в отправке
+    сообщения, второй экземпляр вернул бы чужие. Вызывать после миграций.
+    """
+    OUTBOX.start()
+    BROADCASTER.start()
+    DIGESTS.start()
+
+def stop_background_workers():
+    DIGESTS.stop()
+    BROADCASTER.stop()
+    OUTBOX.stop()
+
 TRANSLATIONS = {
     'ru': {
         'profile_updated': "✅ *Ваш профиль успешно обновлен!*\n\n",
@@ -78,34 +156,69 @@ VALIDATION_LIMITS = {
     'post_experience': 50 # Например "1-3 года"
 }
 
+# --- Лента постов ---
+FEED_PAGE_SIZE = int(os.getenv("FEED_PAGE_SIZE", 20))
+FEED_PAGE_SIZE_MAX = int(os.getenv("FEED_PAGE_SIZE_MAX", 50))
+PROFILE_SEARCH_PAGE_SIZE = int(os.getenv("PROFILE_SEARCH_PAGE_SIZE", 30))
+PROFILE_SEARCH_PAGE_SIZE_MAX = int(os.getenv("PROFILE_SEARCH_PAGE_SIZE_MAX", 100))
+
 def get_user_name_for_bot(user_id):
     """Helper для бота"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT first_name FROM profiles WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return row['first_name'] if row else 'Пользователь'
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT first_name FROM profiles WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+            return row['first_name'] if row else 'Пользователь'
     except:
         return 'Пользователь'
 
 # --- Маршруты для фронтенда ---
 @app.route('/')
 def serve_index():
-    return send_from_directory(APP_ROOT, 'index.html')
+    return send_static_asset('index.html')
 
 @app.route('/css/<path:filename>')
 def serve_css(filename):
-    return send_from_directory(os.path.join(APP_ROOT, 'css'), filename)
+    return send_static_asset(f'css/{filename}')
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
-    return send_from_directory(os.path.join(APP_ROOT, 'js'), filename)
+    return send_static_asset(f'js/{filename}')
 
 @app.route('/locales/<path:filename>')
 def serve_locales(filename):
-    return send_from_directory(os.path.join(APP_ROOT, 'locales'), filename)
+    return send_static_asset(f'locales/{filename}')
+
+def send_static_asset(relpath):
+    """
+    Файл фронтенда из STATIC_ROOT. Для сборки — предсжатый вариант (.br/.gz) по
+    Accept-Encoding, файлы с хэшем в имени — с immutable-кэшем, остальные
+    (index.html, переводы) — с перепроверкой по ETag.
+    """
+    path = safe_join(STATIC_ROOT, relpath)
+    if not path or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(relpath)[0] or 'application/octet-stream'
+
+    encoding, filename = None, relpath
+    if ASSETS_MANIFEST:
+        for name, suffix in build_assets.PRECOMPRESSED:
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                encoding, filename = name, relpath + suffix
+                break
+
+    response = send_from_directory(STATIC_ROOT, filename, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if ASSETS_MANIFEST:
+        response.vary.add('Accept-Encoding')
+
+    if relpath in HASHED_ASSETS:
+        response.headers['Cache-Control'] = f"public, max-age={UPLOADS_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = "no-cache"
+    return response
 
 # --- Маршруты API ---
 @app.route('/config')
@@ -118,24 +231,131 @@ def get_config():
     }
     return jsonify(config)
 
+@app.route('/internal/stats')
+def internal_stats():
+    """Статистика пулов и кэшей для мониторинга (заголовок X-Stats-Token)"""
+    if not STATS_TOKEN or not hmac.compare_digest(request.headers.get('X-Stats-Token', ''), STATS_TOKEN):
+        return jsonify({"ok": False, "error": "Forbidden"}), 403
+    return jsonify({
+        "ok": True,
+        "db": db.stats(),
+        "auth": INIT_DATA_VERIFIER.stats(),
+        "profile_cache": PROFILE_CACHE.stats(),
+        "avatars": AVATARS.stats(),
+        "compression": COMPRESSOR.stats(),
+        "telegram": TELEGRAM.stats(),
+        "telegram_users": TELEGRAM_USERS.stats(),
+        "outbox": OUTBOX.stats(),
+        "broadcasts": BROADCASTER.stats(),
+        "digests": DIGESTS.stats()
+    })
+
+@app.route("/api/auth", methods=["POST"])
+def auth_session():
+    """Обменивает initData на короткий токен сессии (Authorization: Bearer ...)"""
+    data = request.json or {}
+    user_id = validate_init_data(data.get("initData"))
+    if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
+    token, expires_at = SESSION_TOKENS.issue(user_id)
+    return jsonify({"ok": True, "token": token, "expires_at": expires_at, "expires_in": SESSION_TOKENS.ttl})
+
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    immutable = filename.startswith(f"{avatars.AVATAR_SUBDIR}/")
+
+    if UPLOADS_SENDFILE == "x-accel":
+        path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if not path or not os.path.isfile(path):
+            abort(404)
+        # Тело, Range и If-None-Match/If-Modified-Since обслуживает nginx
+        response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = UPLOADS_ACCEL_PREFIX + filename
+    else:
+        # ETag, Last-Modified, 304 и Range у send_from_directory и так включены по умолчанию;
+        # здесь добавляется только Cache-Control. При USE_X_SENDFILE тело отдаёт фронт-сервер
+        response = send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+
+    if immutable:
+        response.headers['Cache-Control'] = f"public, max-age={UPLOADS_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        response.headers['Cache-Control'] = f"public, max-age={UPLOADS_MAX_AGE}, must-revalidate"
+    return response
 
 # --- Функции ---
-def validate_init_data(init_data: str, bot_token: str):
+def validate_init_data(init_data: str):
+    return INIT_DATA_VERIFIER.get_user_id(init_data)
+
+def refresh_telegram_user(user):
+    """
+    Пользователь из свежей проверенной initData: его username кладётся в кэш
+    чатов и, если изменился, в profiles.telegram_username — без вызова getChat.
+    """
+    user_id = user.get("id")
+    if not user_id:
+        return
+    username = user.get("username")
+    TELEGRAM_USERS.prime(user_id, {"username": username, "first_name": user.get("first_name")})
+    with db.read_connection() as conn:
+        row = conn.execute("SELECT telegram_username FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+    if row is None or row['telegram_username'] == username:
+        return
+    # Запись не ждём: проверка авторизации не стоит в очереди писателя
+    future = db.submit_write(store_telegram_username, user_id, username)
+    future.add_done_callback(functools.partial(_telegram_username_stored, user_id))
+
+def store_telegram_username(conn, user_id, username):
+    cursor = conn.execute(
+        "UPDATE profiles SET telegram_username = ? WHERE user_id = ? AND telegram_username IS NOT ?",
+        (username, user_id, username)
+    )
+    return cursor.rowcount
+
+def _telegram_username_stored(user_id, future):
+    """Вызывается после COMMIT (в потоке-писателе)"""
     try:
-        parsed_data = dict(item.split("=") for item in init_data.split("&"))
-        received_hash = parsed_data.pop("hash")
-        user_data_json = unquote(parsed_data.get("user", "{}"))
-        user_data = json.loads(user_data_json)
-        user_id = user_data.get("id")
-        data_check_string = "\n".join(f"{key}={unquote(value)}" for key, value in sorted(parsed_data.items()))
-        secret_key = hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
-        calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-        if calculated_hash != received_hash: return None
-        return user_id
-    except Exception: return None
+        if future.result():
+            PROFILE_CACHE.invalidate(user_id)
+    except Exception as e:
+        print(f"❌ Ошибка обновления telegram_username {user_id}: {e}")
+
+def load_telegram_user(user_id):
+    """username из профиля (актуален после входа пользователя), иначе getChat"""
+    with db.read_connection() as conn:
+        row = conn.execute(
+            "SELECT telegram_username, first_name FROM profiles WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    if row and row['telegram_username']:
+        return {"username": row['telegram_username'], "first_name": row['first_name']}
+    chat = TELEGRAM.call("getChat", {"chat_id": user_id}, timeout=TELEGRAM_LOOKUP_TIMEOUT, retries=0) or {}
+    return {"username": chat.get("username"), "first_name": chat.get("first_name")}
+
+def authenticate_request(data=None):
+    """
+    user_id текущего запроса: сначала токен сессии из заголовка Authorization,
+    иначе (старые клиенты / истёкший токен) — initData из тела запроса.
+    """
+    token = tg_auth.extract_bearer(request.headers.get('Authorization'))
+    if token:
+        user_id = SESSION_TOKENS.verify(token)
+        if user_id:
+            return user_id
+    user_id = validate_init_data(data.get("initData")) if data is not None else None
+    if token and not user_id:
+        # Токен истёк или недействителен — ответ станет 401 (см. invalid_session_response)
+        g.invalid_session = True
+    return user_id
+
+@app.after_request
+def invalid_session_response(response):
+    """
+    Отказ из-за отвергнутого токена сессии (403 эндпоинта) -> 401 invalid_session.
+    Только на него клиент получает новый токен и повторяет запрос: остальные 403 —
+    это отказы по существу, и запрос уже выполнялся.
+    """
+    if response.status_code == 403 and g.get("invalid_session"):
+        response = jsonify({"ok": False, "error": "invalid_session"})
+        response.status_code = 401
+    return response
 
 def send_telegram_message(user_id, profile_data, photo_path, lang='ru'):
     t = TRANSLATIONS.get(lang, TRANSLATIONS['ru'])
@@ -150,13 +370,13 @@ def send_telegram_message(user_id, profile_data, photo_path, lang='ru'):
     caption = caption.strip()
     if photo_path:
         photo_url = f"{BACKEND_URL}/{photo_path}"
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
-        payload = {"chat_id": user_id, "photo": photo_url, "caption": caption, "parse_mode": "Markdown"}
+        method = "sendPhoto"
+        payload = {"photo": photo_url, "caption": caption, "parse_mode": "Markdown"}
     else:
-        url = f"https.api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-        payload = {"chat_id": user_id, "text": caption, "parse_mode": "Markdown", "disable_web_page_preview": True}
+        method = "sendMessage"
+        payload = {"text": caption, "parse_mode": "Markdown", "disable_web_page_preview": True}
     try:
-        requests.post(url, json=payload)
+        outbox.send_later("profile_updated", user_id, payload, method)
     except Exception as e:
         print(f"Ошибка отправки сообщения: {e}")
 
@@ -204,13 +424,6 @@ def validate_initdata(initdata: str, bottoken: str):
         return None
 
 # --- Вспомогательные функции для БД ---
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, timeout=10.0)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
-    conn.execute("PRAGMA journal_mode=WAL")
-    return conn
-
 ALLOWED_TABLES = ['work_experience', 'education']
 
 def fetch_list_from_db(conn, table_name, user_id):
@@ -221,39 +434,152 @@ def fetch_list_from_db(conn, table_name, user_id):
     items = [dict(row) for row in cursor.fetchall()]
     return items
 
+# Колонки, которые клиент может записать в списки профиля (остальные ключи игнорируются)
+LIST_COLUMNS = {
+    'work_experience': ('job_title', 'company', 'start_date', 'end_date', 'is_current', 'description'),
+    'education': ('institution', 'degree', 'field_of_study', 'start_date', 'end_date'),
+}
+
+# Колонки profiles, которые пишет save_profile; все они, кроме ссылок, входят в поиск людей
+PROFILE_COLUMNS = ('first_name', 'bio', 'link1', 'link2', 'link3', 'link4', 'link5', 'photo_path', 'skills', 'language_code')
+SEARCH_COLUMNS = {'first_name', 'bio', 'skills'}
+
+def _list_item_values(table_name, item):
+    values = []
+    for column in LIST_COLUMNS[table_name]:
+        value = item.get(column)
+        if column == 'is_current':
+            value = 1 if str(value).lower() in ('1', 'true') else 0
+        values.append(value)
+    return tuple(values)
+
 def save_list_to_db(conn, table_name, user_id, items_json, max_items):
+    """
+    Синхронизирует список (опыт/образование) с пришедшим из формы: сравнивает с тем,
+    что уже лежит в БД, и применяет только нужные INSERT/UPDATE/DELETE (executemany).
+    Элемент сопоставляется по id, а без id — с неизменённой строкой того же содержания.
+    Возвращает число изменённых строк.
+    """
     if table_name not in ALLOWED_TABLES:
         raise ValueError(f"[SECURITY] Invalid table name: {table_name}")
-    cursor = conn.cursor()
-    cursor.execute(f"DELETE FROM {table_name} WHERE user_id = ?", (user_id,))
     try:
         items = json.loads(items_json)
         if not isinstance(items, list):
             raise ValueError("Data is not a list")
-        items_to_save = items[:max_items]
-        if not items_to_save:
-             return
-        sample_item = items_to_save[0]
-        fields = [key for key in sample_item.keys() if key not in ('id', 'user_id')]
-        placeholders = ', '.join('?' * len(fields))
-        field_names = ', '.join(fields)
-        for item in items_to_save:
-            values = [item.get(field) for field in fields]
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"❌ Ошибка парсинга списка {table_name}: {e}")
+        return 0
+
+    columns = LIST_COLUMNS[table_name]
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id, {', '.join(columns)} FROM {table_name} WHERE user_id = ?", (user_id,))
+    stored = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+    incoming = [item for item in items[:max_items] if isinstance(item, dict)]
+    inserts, updates = [], []
+    unmatched = []
+
+    # Сначала — элементы с известным id
+    for item in incoming:
+        values = _list_item_values(table_name, item)
+        item_id = item.get('id')
+        if item_id in stored:
+            if stored.pop(item_id) != values:
+                updates.append((*values, item_id, user_id))
+        else:
+            unmatched.append(values)
+
+    # Затем без id: такая же строка уже есть — оставляем как есть
+    by_content = {}
+    for row_id, values in stored.items():
+        by_content.setdefault(values, []).append(row_id)
+    for values in unmatched:
+        same = by_content.get(values)
+        if same:
+            stored.pop(same.pop())
+        else:
+            inserts.append((user_id, *values))
+
+    deletes = [(row_id, user_id) for row_id in stored]
+
+    if deletes:
+        cursor.executemany(f"DELETE FROM {table_name} WHERE id = ? AND user_id = ?", deletes)
+    if updates:
+        assignments = ', '.join(f"{column} = ?" for column in columns)
+        cursor.executemany(f"UPDATE {table_name} SET {assignments} WHERE id = ? AND user_id = ?", updates)
+    if inserts:
+        cursor.executemany(
+            f"INSERT INTO {table_name} (user_id, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))})",
+            inserts
+        )
+    return len(deletes) + len(updates) + len(inserts)
+
+
+def write_profile(conn, user_id, profile_values, photo_path, experience_json, education_json):
+    """
+    Запись профиля (выполняется в потоке-писателе). Возвращает итоговый photo_path.
+    Пишутся только изменившиеся колонки и строки списков: сохранение без изменений
+    не трогает БД (и не сбрасывает версии данных/ETag).
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(PROFILE_COLUMNS)} FROM profiles WHERE user_id = ?", (user_id,))
+    current = cursor.fetchone()
+
+    if not photo_path and current:
+        photo_path = current['photo_path']
+
+    new_values = {**{column: profile_values.get(column) for column in PROFILE_COLUMNS}, 'photo_path': photo_path}
+    if current:
+        changed = [column for column in PROFILE_COLUMNS if current[column] != new_values[column]]
+        if changed:
             cursor.execute(
-                f"INSERT INTO {table_name} (user_id, {field_names}) VALUES (?, {placeholders})",
-                (user_id, *values)
+                f"UPDATE profiles SET {', '.join(f'{column} = ?' for column in changed)} WHERE user_id = ?",
+                (*(new_values[column] for column in changed), user_id)
             )
-    except (json.JSONDecodeError, ValueError, KeyError) as e:
-        print(f"❌ Ошибка парсинга или сохранения списка {table_name}: {e}")
+    else:
+        changed = list(PROFILE_COLUMNS)
+        cursor.execute(
+            f"INSERT INTO profiles ({', '.join(PROFILE_COLUMNS)}, user_id) VALUES ({', '.join('?' * len(PROFILE_COLUMNS))}, ?)",
+            (*(new_values[column] for column in PROFILE_COLUMNS), user_id)
+        )
 
+    jobs_changed = save_list_to_db(conn, 'work_experience', user_id, experience_json, VALIDATION_LIMITS['experience_count'])
+    save_list_to_db(conn, 'education', user_id, education_json, VALIDATION_LIMITS['education_count'])
+    # Документ поиска людей — в той же транзакции, и только если изменилось то, что в нём есть
+    if not current or jobs_changed or SEARCH_COLUMNS.intersection(changed):
+        profiles_search.sync_profile(conn, user_id)
+    if 'skills' in changed:
+        profiles_search.sync_user_skills(conn, user_id, new_values['skills'])
+    return photo_path
 
-def get_follow_counts(conn, user_id):
+def set_avatar(conn, user_id, photo_path, thumb_path, is_current):
+    """
+    Подставляет готовые варианты аватара (в потоке-писателе). Возвращает прежние пути
+    или None, если задача уже устарела (пользователь загрузил ещё одно фото)
+    """
+    if not is_current():
+        return None
     cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM follows WHERE following_id = ?", (user_id,))
-    followers_count = cursor.fetchone()[0]
-    cursor.execute("SELECT COUNT(*) FROM follows WHERE follower_id = ?", (user_id,))
-    following_count = cursor.fetchone()[0]
-    return followers_count, following_count
+    cursor.execute("SELECT photo_path, photo_thumb_path FROM profiles WHERE user_id = ?", (user_id,))
+    previous = cursor.fetchone()
+    cursor.execute(
+        "UPDATE profiles SET photo_path = ?, photo_thumb_path = ? WHERE user_id = ?",
+        (photo_path, thumb_path, user_id)
+    )
+    return tuple(previous) if previous else (None, None)
+
+def on_avatar_ready(user_id, paths, is_current):
+    """Колбэк AvatarPipeline: варианты записаны на диск — переключаем профиль на них"""
+    new_paths = (paths['medium'], paths['thumb'])
+    previous = db.write(set_avatar, user_id, *new_paths, is_current)
+    if previous is None:
+        return False
+    PROFILE_CACHE.invalidate(user_id)
+    AVATARS.remove_files(*(path for path in previous if path not in new_paths))
+    return True
+
+# Обработка аватаров в фоне: save_profile не ждёт ресайза
+AVATARS = avatars.AvatarPipeline(UPLOAD_FOLDER, on_avatar_ready)
 
 def check_is_followed(conn, viewer_id, target_user_id):
     if viewer_id == target_user_id:
@@ -265,65 +591,129 @@ def check_is_followed(conn, viewer_id, target_user_id):
     )
     return cursor.fetchone() is not None
 
+# --- ETag / 304 ---
+# ETag собирается из счётчиков data_versions (миграция 9) и параметров запроса.
+# Версии читаются ДО основного запроса: если запись проскочит между ними,
+# ответ окажется новее своего ETag и следующий запрос просто получит 200.
+
+def read_data_versions(conn, *scopes):
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT scope, version FROM data_versions WHERE scope IN ({','.join('?' * len(scopes))})",
+        scopes
+    )
+    versions = dict(cursor.fetchall())
+    return tuple(versions.get(scope, 0) for scope in scopes)
+
+def make_etag(*parts):
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+def etag_matches(etag):
+    # Слабое сравнение: после сжатия (compression.py) клиент присылает W/"..."
+    return request.if_none_match.contains_weak(etag)
+
+def with_etag(response, etag):
+    # private: ответ зависит от зрителя; no-cache: всегда перепроверять по ETag
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag):
+    return with_etag(app.response_class(status=304), etag)
+
+def as_user_id(value):
+    """user_id из JSON (число или строка) -> int, None если не число"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def load_profile_document(user_id, version=None):
+    """
+    Профиль с опытом и образованием (через PROFILE_CACHE). None, если профиля нет.
+    version — версии profile:<user_id>, если вызывающий их уже прочитал (для ETag)
+    """
+    if version is None:
+        with db.read_connection() as conn:
+            version = read_data_versions(conn, f"profile:{user_id}")
+
+    def load():
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,))
+            profile_row = cursor.fetchone()
+            if not profile_row:
+                return None
+            profile = dict(profile_row)
+            profile['experience'] = fetch_list_from_db(conn, 'work_experience', user_id)
+            profile['education'] = fetch_list_from_db(conn, 'education', user_id)
+            return profile
+    return PROFILE_CACHE.get_or_load(user_id, load, version)
+
 @app.route("/get-profile", methods=["POST"])
 def get_profile():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,))
-        profile_row = cursor.fetchone()
-        if profile_row:
-            profile = dict(profile_row)
-            profile['experience'] = fetch_list_from_db(conn, 'work_experience', user_id)
-            profile['education'] = fetch_list_from_db(conn, 'education', user_id)
-            followers_count, following_count = get_follow_counts(conn, user_id)
-            profile['followers_count'] = followers_count
-            profile['following_count'] = following_count
-            conn.close()
-            return jsonify({"ok": True, "profile": profile})
-        else:
-            conn.close()
-            return jsonify({"ok": True, "profile": {}})
+        profile = load_profile_document(user_id)
+        return jsonify({"ok": True, "profile": profile or {}})
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/get-user-by-id", methods=["POST"])
 def get_user_by_id():
     data = request.json
-    viewer_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    viewer_id = authenticate_request(data)
     if not viewer_id: return jsonify({"ok": False, "error": "Invalid viewer data"}), 403
     target_user_id = data.get("target_user_id")
     if not target_user_id: return jsonify({"ok": False, "error": "Target user ID not provided"}), 400
+    target_user_id = as_user_id(target_user_id)
+    if target_user_id is None: return jsonify({"ok": False, "error": "User not found"})
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM profiles WHERE user_id = ?", (target_user_id,))
-        profile_row = cursor.fetchone()
-        if profile_row:
-            profile = dict(profile_row)
-            profile['experience'] = fetch_list_from_db(conn, 'work_experience', target_user_id)
-            profile['education'] = fetch_list_from_db(conn, 'education', target_user_id)
-            followers_count, following_count = get_follow_counts(conn, target_user_id)
-            profile['followers_count'] = followers_count
-            profile['following_count'] = following_count
-            profile['is_followed_by_viewer'] = check_is_followed(conn, viewer_id, target_user_id)
-            conn.close()
-            return jsonify({"ok": True, "profile": profile})
-        else:
-            conn.close()
+        # Подписка зависит от зрителя — не кэшируется, один запрос по первичному ключу
+        with db.read_connection() as conn:
+            versions = read_data_versions(conn, f"profile:{target_user_id}")
+            is_followed = check_is_followed(conn, viewer_id, target_user_id)
+        etag = make_etag("user", target_user_id, versions, is_followed)
+        if etag_matches(etag):
+            return not_modified(etag)
+
+        # Версия та же, что в ETag: документ из кэша не может оказаться старше ETag
+        profile = load_profile_document(target_user_id, versions)
+        if not profile:
             return jsonify({"ok": False, "error": "User not found"})
+        profile['is_followed_by_viewer'] = is_followed
+        return with_etag(jsonify({"ok": True, "profile": profile}), etag)
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": "Server error"}), 500
 
+def format_db_timestamp(value):
+    """'YYYY-MM-DD HH:MM:SS[.fff]' из SQLite -> 'YYYY-MM-DDTHH:MM:SS.fffZ' (UTC)"""
+    if not value:
+        return value
+    value = value.replace(' ', 'T')
+    if '.' not in value:
+        value += '.000'
+    return value[:23].ljust(23, '0') + 'Z'
+
+def encode_feed_cursor(created_at, post_id):
+    raw = f"{created_at}|{post_id}".encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def decode_feed_cursor(cursor):
+    """Возвращает (created_at, post_id); ValueError при битом курсоре"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, post_id = raw.rsplit('|', 1)
+        return created_at, int(post_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
 @app.route("/api/get-post-by-id", methods=["POST"])
 def get_post_by_id():
     data = request.json
-    viewer_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    viewer_id = authenticate_request(data)
     if not viewer_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
     
     post_id = data.get("post_id")
@@ -335,67 +725,68 @@ def get_post_by_id():
         return jsonify({"ok": False, "error": "Invalid post_id format"}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # --- ОБНОВЛЕНО: Добавлено experience_years ---
-        cursor.execute('''
-            SELECT 
-                p.post_id, p.user_id, p.post_type, p.content, p.full_description, p.skill_tags, p.experience_years,
-                SUBSTR(STRFTIME('%Y-%m-%dT%H:%M:%f', p.created_at), 1, 23) || 'Z' as created_at,
-                pr.first_name as author_first_name,
-                pr.photo_path as author_photo_path
-            FROM posts p
-            JOIN profiles pr ON p.user_id = pr.user_id
-            WHERE p.post_id = ?
-        ''', (post_id_int,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
         
-        if not row:
-            return jsonify({"ok": False, "error": "Post not found"}), 404
+            # --- ОБНОВЛЕНО: Добавлено experience_years ---
+            cursor.execute('''
+                SELECT 
+                    p.post_id, p.user_id, p.post_type, p.content, p.full_description, p.skill_tags, p.experience_years,
+                    p.created_at,
+                    pr.first_name as author_first_name,
+                    pr.photo_path as author_photo_path,
+                    pr.photo_thumb_path as author_photo_thumb_path
+                FROM posts p
+                JOIN profiles pr ON p.user_id = pr.user_id
+                WHERE p.post_id = ?
+            ''', (post_id_int,))
+        
+            row = cursor.fetchone()
+        
+            if not row:
+                return jsonify({"ok": False, "error": "Post not found"}), 404
             
-        post = dict(row)
-        try:
-            post['skill_tags'] = json.loads(post['skill_tags'])
-        except:
-            post['skill_tags'] = []
+            post = dict(row)
+            try:
+                post['skill_tags'] = json.loads(post['skill_tags'])
+            except:
+                post['skill_tags'] = []
             
-        post['author'] = {
-            'user_id': post['user_id'],
-            'first_name': post.pop('author_first_name'),
-            'photo_path': post.pop('author_photo_path')
-        }
+            post['created_at'] = format_db_timestamp(post['created_at'])
+            post['author'] = {
+                'user_id': post['user_id'],
+                'first_name': post.pop('author_first_name'),
+                'photo_path': post.pop('author_photo_path'),
+                'photo_thumb_path': post.pop('author_photo_thumb_path')
+            }
         
-        return jsonify({"ok": True, "post": post})
+            return jsonify({"ok": True, "post": post})
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/save-profile", methods=["POST"])
 def save_profile():
-    init_data = request.form.get('initData')
-    user_id = validate_init_data(init_data, BOT_TOKEN)
+    user_id = authenticate_request(request.form)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
 
-    photo_path = None
+    # Фото только читается и проверяется по сигнатуре; ресайз и запись — в AvatarPipeline
+    photo_data = None
     if 'photo' in request.files:
         file = request.files['photo']
         if file and file.filename != '':
+            if not avatars.PILLOW_AVAILABLE:
+                return jsonify({"ok": False, "error": "Photo uploads are unavailable"}), 503
             if not file.content_type or not file.content_type.startswith('image/'):
                 return jsonify({"ok": False, "error": "validation", "details": {"key": "error_invalid_file_type", "message": "Only images allowed"}}), 400
             allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
             file_ext = os.path.splitext(file.filename)[1].lower()
             if file_ext not in allowed_extensions:
                 return jsonify({"ok": False, "error": "Invalid file extension"}), 400
-            filename = secure_filename(f"{user_id}.jpg")
-            try:
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                photo_path = f"uploads/{filename}"
-            except Exception as e:
-                 print(f"❌ Ошибка сохранения фото: {e}")
+            photo_data = file.read(avatars.AVATAR_MAX_BYTES + 1)
+            if len(photo_data) > avatars.AVATAR_MAX_BYTES:
+                return jsonify({"ok": False, "error": "validation", "details": {"key": "error_file_too_large", "limit": avatars.AVATAR_MAX_BYTES}}), 400
+            if not avatars.sniff_format(photo_data):
+                return jsonify({"ok": False, "error": "validation", "details": {"key": "error_invalid_file_type", "message": "Only images allowed"}}), 400
 
     try:
         first_name = request.form.get("first_name", "Пользователь")
@@ -421,186 +812,232 @@ def save_profile():
         if len(json.loads(education_json)) > VALIDATION_LIMITS['education_count']:
             return jsonify({"ok": False, "error": "validation", "details": {"key": "error_education_max_items", "limit": VALIDATION_LIMITS['education_count']}}), 400
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        if not photo_path:
-            cursor.execute("SELECT photo_path FROM profiles WHERE user_id = ?", (user_id,))
-            res = cursor.fetchone()
-            if res: photo_path = res[0]
-        
-        cursor.execute("BEGIN TRANSACTION")
-
-        cursor.execute("SELECT user_id FROM profiles WHERE user_id = ?", (user_id,))
-        exists = cursor.fetchone()
-        
-        profile_fields = (first_name, bio, links['link1'], links['link2'], links['link3'], links['link4'], links['link5'], photo_path, skills_json, lang, user_id)
-        if exists:
-            cursor.execute('''
-                UPDATE profiles
-                SET first_name = ?, bio = ?, link1 = ?, link2 = ?, link3 = ?, link4 = ?, link5 = ?, photo_path = ?, skills = ?, language_code = ?
-                WHERE user_id = ?
-            ''', profile_fields)
-        else:
-            cursor.execute('''
-                INSERT INTO profiles (first_name, bio, link1, link2, link3, link4, link5, photo_path, skills, language_code, user_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', profile_fields)
-
-        save_list_to_db(conn, 'work_experience', user_id, experience_json, VALIDATION_LIMITS['experience_count'])
-        save_list_to_db(conn, 'education', user_id, education_json, VALIDATION_LIMITS['education_count'])
+        profile_values = {
+            'first_name': first_name, 'bio': bio, **links,
+            'skills': skills_json, 'language_code': lang
+        }
+        photo_path = db.write(write_profile, user_id, profile_values, None, experience_json, education_json)
+        PROFILE_CACHE.invalidate(user_id)
 
-        conn.commit()
-        conn.close()
+        # Профиль уже сохранён (строка точно есть) — новое фото подставит воркер
+        photo_pending = False
+        if photo_data:
+            try:
+                AVATARS.submit(user_id, photo_data)
+                photo_pending = True
+            except avatars.InvalidImage as e:
+                print(f"❌ Ошибка сохранения фото: {e}")
 
+        # Пока новое фото обрабатывается, в профиле ещё старое — подтверждение шлём без него
         message_data = {"bio": bio, **links}
-        send_telegram_message(user_id, message_data, photo_path, lang)
+        send_telegram_message(user_id, message_data, None if photo_pending else photo_path, lang)
 
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "photo_pending": photo_pending})
 
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.rollback()
-            conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/save-language", methods=["POST"])
 def save_language():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
     lang = data.get("lang")
     if lang not in ['ru', 'en']: return jsonify({"ok": False, "error": "Invalid language code"}), 400
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE profiles SET language_code = ? WHERE user_id = ?", (lang, user_id))
-        conn.commit()
-        conn.close()
+        db.execute_write("UPDATE profiles SET language_code = ? WHERE user_id = ?", (lang, user_id))
+        PROFILE_CACHE.invalidate(user_id)
         return jsonify({"ok": True, "message": "Language saved"})
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/save-theme", methods=["POST"])
 def save_theme():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
     theme = data.get("theme")
     if theme not in ['auto', 'light', 'dark', 'custom']: return jsonify({"ok": False, "error": "Invalid theme value"}), 400
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE profiles SET theme = ? WHERE user_id = ?", (theme, user_id))
-        conn.commit()
-        conn.close()
+        db.execute_write("UPDATE profiles SET theme = ? WHERE user_id = ?", (theme, user_id))
+        PROFILE_CACHE.invalidate(user_id)
         return jsonify({"ok": True, "message": "Theme saved"})
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/save-custom-theme", methods=["POST"])
 def save_custom_theme():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
     colors = data.get("colors")
     if not colors: return jsonify({"ok": False, "error": "No colors provided"}), 400
     custom_theme_json = json.dumps(colors)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE profiles SET theme = 'custom', custom_theme = ? WHERE user_id = ?", (custom_theme_json, user_id))
-        conn.commit()
-        conn.close()
+        db.execute_write("UPDATE profiles SET theme = 'custom', custom_theme = ? WHERE user_id = ?", (custom_theme_json, user_id))
+        PROFILE_CACHE.invalidate(user_id)
         return jsonify({"ok": True, "message": "Custom theme saved"})
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/get-telegram-user-info", methods=["POST"])
 def get_telegram_user_info():
     data = request.json
-    viewer_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    viewer_id = authenticate_request(data)
     if not viewer_id: return jsonify({"ok": False, "error": "Invalid viewer data"}), 403
-    target_user_id = data.get("target_user_id")
+    target_user_id = as_user_id(data.get("target_user_id"))
     if not target_user_id: return jsonify({"ok": False, "error": "Target user ID not provided"}), 400
     try:
-        url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChat"
-        payload = {"chat_id": target_user_id}
-        response = requests.post(url, json=payload)
-        result = response.json()
-        if result.get("ok"):
-            chat_data = result.get("result", {})
-            return jsonify({
-                "ok": True,
-                "username": chat_data.get("username"),
-                "first_name": chat_data.get("first_name"),
-                "user_id": target_user_id
-            })
-        else:
-            return jsonify({ "ok": True, "username": None, "user_id": target_user_id })
+        info = TELEGRAM_USERS.get_or_load(target_user_id, lambda: load_telegram_user(target_user_id)) or {}
+        return jsonify({
+            "ok": True,
+            "username": info.get("username"),
+            "first_name": info.get("first_name"),
+            "user_id": target_user_id
+        })
     except Exception as e:
         return jsonify({"ok": True, "username": None, "user_id": target_user_id})
 
 @app.route("/get-all-profiles", methods=['POST'])
 def get_all_profiles():
-    init_data = request.json.get('initData')
-    user_id = validate_init_data(init_data, BOT_TOKEN)
+    user_id = authenticate_request(request.json)
     if not user_id:
         return jsonify(ok=False, error='Invalid data'), 403
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Запрос с JOIN для получения последней работы
-        cursor.execute('''
-            SELECT 
-                p.user_id, p.first_name, p.bio, p.photo_path, p.skills, p.language_code, p.status,
-                we.job_title, we.company
-            FROM profiles p
-            LEFT JOIN (
-                SELECT id, user_id, job_title, company
-                FROM (
-                    SELECT id, user_id, job_title, company,
-                           ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY is_current DESC, id DESC) as rn
-                    FROM work_experience
-                ) AS ranked_jobs
-                WHERE rn = 1
-            ) AS we ON p.user_id = we.user_id
-            WHERE p.user_id != ?
-              AND (p.bio IS NOT NULL AND p.bio != ''
-                   OR p.photo_path IS NOT NULL
-                   OR p.skills IS NOT NULL AND p.skills != '')
-        ''', (user_id,))
+        with db.read_connection() as conn:
+            etag = make_etag("directory", user_id, read_data_versions(conn, "profiles", f"follows:{user_id}"))
+            if etag_matches(etag):
+                return not_modified(etag)
+
+            cursor = conn.cursor()
         
+            # Запрос с JOIN для получения последней работы;
+            # счётчики подписок хранятся в profiles и поддерживаются триггерами
+            cursor.execute('''
+                SELECT 
+                    p.user_id, p.first_name, p.bio, p.photo_path, p.photo_thumb_path, p.skills, p.language_code, p.status,
+                    we.job_title, we.company,
+                    p.followers_count, p.following_count
+                FROM profiles p
+                LEFT JOIN work_experience we ON we.id = (
+                    SELECT id FROM work_experience WHERE user_id = p.user_id
+                    ORDER BY is_current DESC, id DESC LIMIT 1
+                )
+                WHERE p.user_id != ?
+                  AND (p.bio IS NOT NULL AND p.bio != ''
+                       OR p.photo_path IS NOT NULL
+                       OR p.skills IS NOT NULL AND p.skills != '')
+            ''', (user_id,))
+            rows = cursor.fetchall()
+
+            # На кого подписан сам зритель — одним запросом
+            cursor.execute("SELECT following_id FROM follows WHERE follower_id = ?", (user_id,))
+            followed_ids = {row[0] for row in cursor.fetchall()}
+        
+            profiles = []
+            for row in rows:
+                profile = dict(row)
+                profile['is_followed_by_viewer'] = profile['user_id'] in followed_ids
+                profiles.append(profile)
+        
+            return with_etag(jsonify(ok=True, profiles=profiles), etag)
+    except Exception as e:
+        return jsonify(ok=False, error=str(e)), 500
+
+@app.route("/api/search-profiles", methods=["POST"])
+def search_profiles():
+    data = request.json
+    user_id = authenticate_request(data)
+    if not user_id:
+        return jsonify({"ok": False, "error": "Invalid data"}), 403
+
+    try:
+        limit = min(max(int(data.get("limit") or PROFILE_SEARCH_PAGE_SIZE), 1), PROFILE_SEARCH_PAGE_SIZE_MAX)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid limit"}), 400
+
+    text_query = (data.get("q") or "").strip()[:200] or None
+    status = data.get("status") or None
+    skills = data.get("skills") or []
+    if not isinstance(skills, list):
+        return jsonify({"ok": False, "error": "Invalid skills"}), 400
+
+    cursor_value = data.get("cursor")
+    after = None
+    if cursor_value:
+        try:
+            after = profiles_search.decode_cursor(cursor_value)
+        except ValueError:
+            return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+
+    # С текстом/навыками — по релевантности (bm25), иначе — каталог по user_id (см. profiles_search.py)
+    sql, params, mode = profiles_search.build_search_query(
+        user_id, text=text_query, skills=skills, status=status, cursor=after, limit=limit
+    )
+
+    try:
+        with db.read_connection() as conn:
+            etag = make_etag("search", user_id, read_data_versions(conn, "profiles", f"follows:{user_id}"), sql, params)
+            if etag_matches(etag):
+                return not_modified(etag)
+
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+
+            # Подписки зрителя — только среди профилей этой страницы
+            followed_ids = set()
+            if rows:
+                ids = [row['user_id'] for row in rows]
+                cursor.execute(
+                    f"SELECT following_id FROM follows WHERE follower_id = ? AND following_id IN ({','.join('?' * len(ids))})",
+                    [user_id] + ids
+                )
+                followed_ids = {row[0] for row in cursor.fetchall()}
+
+        next_cursor = None
+        if has_more:
+            if mode == "rank":
+                offset = after[1] if after and after[0] == "o" else 0
+                next_cursor = profiles_search.encode_cursor("o", offset + limit)
+            else:
+                next_cursor = profiles_search.encode_cursor("u", rows[-1]['user_id'])
+
         profiles = []
-        for row in cursor.fetchall():
+        for row in rows:
             profile = dict(row)
-            
-            # ⭐ ДОБАВЛЯЕМ: Проверяем подписку для каждого профиля
-            profile['is_followed_by_viewer'] = check_is_followed(conn, user_id, profile['user_id'])
-            
-            # Добавляем счётчики подписок
-            followers_count, following_count = get_follow_counts(conn, profile['user_id'])
-            profile['followers_count'] = followers_count
-            profile['following_count'] = following_count
-            
+            profile['is_followed_by_viewer'] = profile['user_id'] in followed_ids
             profiles.append(profile)
-        
-        conn.close()
-        return jsonify(ok=True, profiles=profiles)
+
+        return with_etag(jsonify({"ok": True, "profiles": profiles, "next_cursor": next_cursor}), etag)
+
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
-        return jsonify(ok=False, error=str(e)), 500
+        print(f"❌ Error in search_profiles: {e}")
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+def insert_follow(conn, follower_id, following_id):
+    """Создаёт подписку (в потоке-писателе). False, если она уже есть"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT 1 FROM follows WHERE follower_id = ? AND following_id = ?",
+        (follower_id, following_id)
+    )
+    if cursor.fetchone():
+        return False
+    cursor.execute(
+        "INSERT INTO follows (follower_id, following_id) VALUES (?, ?)",
+        (follower_id, following_id)
+    )
+    return True
 
 @app.route("/follow", methods=["POST"])
 def follow_user():
     data = request.json
-    viewer_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    viewer_id = authenticate_request(data)
     if not viewer_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
     
@@ -612,65 +1049,50 @@ def follow_user():
         return jsonify({"ok": False, "error": "Cannot follow yourself"}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Проверка существования подписки
-        cursor.execute(
-            "SELECT 1 FROM follows WHERE follower_id = ? AND following_id = ?",
-            (viewer_id, target_user_id)
-        )
-        exists = cursor.fetchone()
-        
-        if exists:
-            conn.close()
+        if not db.write(insert_follow, viewer_id, target_user_id):
             return jsonify({"ok": False, "error": "Already following"}), 400
-        
-        # Создаём подписку
-        cursor.execute(
-            "INSERT INTO follows (follower_id, following_id) VALUES (?, ?)",
-            (viewer_id, target_user_id)
-        )
-        
-        conn.commit()
-        conn.close()
+        # Триггеры поменяли счётчики подписок у обоих
+        PROFILE_CACHE.invalidate(viewer_id, as_user_id(target_user_id))
         
         follower_name = get_user_name_for_bot(viewer_id)
         bot_handlers.notify_new_follower(target_user_id, viewer_id, follower_name)
-        
+    
         return jsonify({"ok": True})
-        
+    
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/unfollow", methods=["POST"])
 def unfollow_user():
     data = request.json
-    viewer_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    viewer_id = authenticate_request(data)
     if not viewer_id: return jsonify({"ok": False, "error": "Invalid viewer data"}), 403
     target_user_id = data.get("target_user_id")
     if not target_user_id or target_user_id == viewer_id:
         return jsonify({"ok": False, "error": "Invalid target user"}), 400
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
+        db.execute_write(
             "DELETE FROM follows WHERE follower_id = ? AND following_id = ?",
             (viewer_id, target_user_id)
         )
-        conn.commit()
-        conn.close()
+        PROFILE_CACHE.invalidate(viewer_id, as_user_id(target_user_id))
         return jsonify({"ok": True})
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
+def insert_post(conn, user_id, post_type, content, full_description, skill_tags_json, experience_years):
+    """Новый пост и его навыки в post_skills (в потоке-писателе). Возвращает post_id"""
+    post_id = conn.execute('''
+        INSERT INTO posts (user_id, post_type, content, full_description, skill_tags, experience_years)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, post_type, content, full_description, skill_tags_json, experience_years)).lastrowid
+    posts_search.sync_post_skills(conn, post_id, skill_tags_json)
+    return post_id
+
 @app.route("/api/create-post", methods=["POST"])
 def create_post():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
 
     post_type = data.get("post_type")
@@ -698,75 +1120,86 @@ def create_post():
         return jsonify({"ok": False, "error": "validation", "details": {"key": "error_post_experience_too_long", "limit": VALIDATION_LIMITS['post_experience']}}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO posts (user_id, post_type, content, full_description, skill_tags, experience_years)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, post_type, content, full_description, skill_tags_json, experience_years))
-
-        post_id = cursor.lastrowid
+        post_id = db.write(insert_post, user_id, post_type, content, full_description, skill_tags_json, experience_years)
 
-        cursor.execute("SELECT first_name FROM profiles WHERE user_id = ?", (user_id,))
-        author_row = cursor.fetchone()
-        author_name = author_row['first_name'] if author_row else "Пользователь"
-
-        conn.commit()
-        conn.close()
+        author_name = get_user_name_for_bot(user_id)
 
+        # Уведомления только ставятся в очередь (outbox.py), Telegram запрос не ждёт
         try:
-            import asyncio
             skill_tags = data.get('skill_tags', [])
-            
-            asyncio.run(bot_handlers.notify_followers_new_post(
+        
+            bot_handlers.notify_followers_new_post(
                 author_id=user_id,
                 author_name=author_name,
                 post_id=post_id,
                 post_content=content
-            ))
-            
+            )
+        
             if skill_tags:
-                asyncio.run(bot_handlers.notify_skill_match(
+                bot_handlers.notify_skill_match(
                     post_id=post_id,
                     author_name=author_name,
                     post_content=content,
                     skill_tags=skill_tags
-                ))
+                )
         except Exception as e:
             print(f"⚠️ Failed to send notifications: {e}")
 
         return jsonify(ok=True)
     except Exception as e:
         print(f"❌ ОШИБКА /api/create-post: {e}")
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/api/get-posts-feed", methods=["POST"])
 def get_posts_feed():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
+
+    try:
+        limit = min(max(int(data.get("limit") or FEED_PAGE_SIZE), 1), FEED_PAGE_SIZE_MAX)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid limit"}), 400
+
+    # Фильтры поиска (все необязательные)
+    post_type = data.get("post_type") or None
+    experience = data.get("experience") or None
+    text_query = (data.get("q") or "").strip()[:200] or None
+    skills = data.get("skills") or []
+    if not isinstance(skills, list):
+        return jsonify({"ok": False, "error": "Invalid skills"}), 400
+
+    # Keyset-пагинация по (created_at, post_id): каждая страница — один проход по индексу,
+    # без OFFSET, поэтому глубокая прокрутка стоит как первая страница (см. posts_search.py)
+    cursor_value = data.get("cursor")
+    after = None
+    if cursor_value:
+        try:
+            after = decode_feed_cursor(cursor_value)
+        except ValueError:
+            return jsonify({"ok": False, "error": "Invalid cursor"}), 400
     
+    sql, params = posts_search.build_feed_query(
+        post_type=post_type, skills=skills, experience=experience,
+        text=text_query, after=after, limit=limit
+    )
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                p.post_id, p.user_id, p.post_type, p.content, p.full_description, p.skill_tags, p.experience_years,
-                SUBSTR(STRFTIME('%Y-%m-%dT%H:%M:%f', p.created_at), 1, 23) || 'Z' as created_at,
-                pr.first_name as author_first_name,
-                pr.photo_path as author_photo_path
-            FROM posts p
-            JOIN profiles pr ON p.user_id = pr.user_id
-            WHERE p.is_deleted = 0
-            ORDER BY p.created_at DESC
-            LIMIT 50
-        ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with db.read_connection() as conn:
+            # Лента одинакова для всех зрителей: меняется только с постами и профилями авторов
+            etag = make_etag("feed", read_data_versions(conn, "posts", "profiles"), sql, params)
+            if etag_matches(etag):
+                return not_modified(etag)
+
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        # Лишняя строка говорит только о том, что есть следующая страница
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_feed_cursor(rows[-1]['created_at'], rows[-1]['post_id']) if has_more else None
         
         posts = []
         for row in rows:
@@ -775,15 +1208,17 @@ def get_posts_feed():
                 post['skill_tags'] = json.loads(post['skill_tags'])
             except:
                 post['skill_tags'] = []
-            
+            post['created_at'] = format_db_timestamp(post['created_at'])
+        
             post['author'] = {
                 'user_id': post['user_id'],
                 'first_name': post.pop('author_first_name'),
-                'photo_path': post.pop('author_photo_path')
+                'photo_path': post.pop('author_photo_path'),
+                'photo_thumb_path': post.pop('author_photo_thumb_path')
             }
             posts.append(post)
-        
-        return jsonify({"ok": True, "posts": posts})
+    
+        return with_etag(jsonify({"ok": True, "posts": posts, "next_cursor": next_cursor}), etag)
         
     except Exception as e:
         print(f"❌ Error in get_posts_feed: {e}")
@@ -791,47 +1226,61 @@ def get_posts_feed():
 
 @app.route("/api/get-my-posts", methods=["POST"])
 def get_my_posts():
-    init_data = request.json.get("initData")
-    user_id = validate_init_data(init_data, BOT_TOKEN)
+    user_id = authenticate_request(request.json)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # --- ОБНОВЛЕНО: Select experience_years ---
-        cursor.execute('''
-            SELECT 
-                p.post_id, p.user_id, p.post_type, p.content, p.full_description, p.skill_tags, p.experience_years,
-                SUBSTR(STRFTIME('%Y-%m-%dT%H:%M:%f', p.created_at), 1, 23) || 'Z' as created_at,
-                pr.first_name as author_first_name,
-                pr.photo_path as author_photo_path
-            FROM posts p
-            JOIN profiles pr ON p.user_id = pr.user_id
-            WHERE p.user_id = ?
-            ORDER BY p.created_at DESC
-        ''', (user_id,))
-        posts = []
-        for row in cursor.fetchall():
-            post = dict(row)
-            try:
-                post['skill_tags'] = json.loads(post['skill_tags'])
-            except:
-                post['skill_tags'] = []
-            post['author'] = {
-                'user_id': post['user_id'],
-                'first_name': post.pop('author_first_name'),
-                'photo_path': post.pop('author_photo_path')
-            }
-            posts.append(post)
-        conn.close()
-        return jsonify({"ok": True, "posts": posts})
+        with db.read_connection() as conn:
+            etag = make_etag("my-posts", user_id, read_data_versions(conn, f"posts:{user_id}", f"profile:{user_id}"))
+            if etag_matches(etag):
+                return not_modified(etag)
+
+            cursor = conn.cursor()
+            # --- ОБНОВЛЕНО: Select experience_years ---
+            cursor.execute('''
+                SELECT 
+                    p.post_id, p.user_id, p.post_type, p.content, p.full_description, p.skill_tags, p.experience_years,
+                    p.created_at,
+                    pr.first_name as author_first_name,
+                    pr.photo_path as author_photo_path,
+                    pr.photo_thumb_path as author_photo_thumb_path
+                FROM posts p
+                JOIN profiles pr ON p.user_id = pr.user_id
+                WHERE p.user_id = ?
+                ORDER BY p.created_at DESC
+            ''', (user_id,))
+            posts = []
+            for row in cursor.fetchall():
+                post = dict(row)
+                try:
+                    post['skill_tags'] = json.loads(post['skill_tags'])
+                except:
+                    post['skill_tags'] = []
+                post['created_at'] = format_db_timestamp(post['created_at'])
+                post['author'] = {
+                    'user_id': post['user_id'],
+                    'first_name': post.pop('author_first_name'),
+                    'photo_path': post.pop('author_photo_path'),
+                    'photo_thumb_path': post.pop('author_photo_thumb_path')
+                }
+                posts.append(post)
+            return with_etag(jsonify({"ok": True, "posts": posts}), etag)
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
+def write_post(conn, post_id, user_id, post_type, content, full_description, skill_tags_json, experience_years):
+    """Изменение поста автором и пересборка его навыков (в потоке-писателе)"""
+    updated = conn.execute(
+        "UPDATE posts SET post_type = ?, content = ?, full_description = ?, skill_tags = ?, experience_years = ? WHERE post_id = ? AND user_id = ?",
+        (post_type, content, full_description, skill_tags_json, experience_years, post_id, user_id)
+    ).rowcount
+    if updated:
+        posts_search.sync_post_skills(conn, post_id, skill_tags_json)
+    return updated
+
 @app.route("/api/update-post", methods=["POST"])
 def update_post():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
     
     post_id = data.get("post_id")
@@ -859,32 +1308,24 @@ def update_post():
         return jsonify({"ok": False, "error": "validation", "details": {"key": "error_post_experience_too_long", "limit": VALIDATION_LIMITS['post_experience']}}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("SELECT user_id FROM posts WHERE post_id = ?", (post_id,))
-        post = cursor.fetchone()
+            cursor.execute("SELECT user_id FROM posts WHERE post_id = ?", (post_id,))
+            post = cursor.fetchone()
         
-        if not post:
-            conn.close()
-            return jsonify({"ok": False, "error": "Post not found"}), 404
+            if not post:
+                return jsonify({"ok": False, "error": "Post not found"}), 404
         
-        if post['user_id'] != user_id:
-            conn.close()
-            return jsonify({"ok": False, "error": "Not authorized"}), 403
+            if post['user_id'] != user_id:
+                return jsonify({"ok": False, "error": "Not authorized"}), 403
         
         # --- ОБНОВЛЕНО: Update experience_years ---
-        cursor.execute(
-            "UPDATE posts SET post_type = ?, content = ?, full_description = ?, skill_tags = ?, experience_years = ? WHERE post_id = ?",
-            (post_type, content, full_description, skill_tags_json, experience_years, post_id)
-        )
-        conn.commit()
-        conn.close()
+        db.write(write_post, post_id, user_id, post_type, content, full_description, skill_tags_json, experience_years)
         
         return jsonify({"ok": True})
     except Exception as e:
         print(f"❌ ОШИБКА /api/update-post: {e}")
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 # ============ НОВЫЙ ENDPOINT: Проверка возможности отклика ============
@@ -892,7 +1333,7 @@ def update_post():
 def check_can_respond():
     """Проверяет, может ли пользователь откликнуться на пост"""
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
     
@@ -901,52 +1342,51 @@ def check_can_respond():
         return jsonify({"ok": False, "error": "Missing post_id"}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
         
-        # Проверяем последний запрос
-        cursor.execute("""
-            SELECT status, created_at 
-            FROM response_requests 
-            WHERE post_id = ? AND from_user_id = ?
-            ORDER BY created_at DESC LIMIT 1
-        """, (post_id, user_id))
+            # Проверяем последний запрос
+            cursor.execute("""
+                SELECT status, created_at 
+                FROM response_requests 
+                WHERE post_id = ? AND from_user_id = ?
+                ORDER BY created_at DESC LIMIT 1
+            """, (post_id, user_id))
         
-        last_request = cursor.fetchone()
-        conn.close()
+            last_request = cursor.fetchone()
         
-        if not last_request:
-            return jsonify({"ok": True, "can_respond": True})
-        
-        status = last_request['status']
-        created_at = last_request['created_at']
+            if not last_request:
+                return jsonify({"ok": True, "can_respond": True})
         
-        # Если отклонён — блокировка навсегда
-        if status == 'rejected':
-            return jsonify({
-                "ok": True, 
-                "can_respond": False,
-                "reason": "rejected",
-                "message": "Ваш запрос был отклонён"
-            })
+            status = last_request['status']
+            created_at = last_request['created_at']
         
-        # Проверяем таймаут 24 часа
-        from datetime import datetime, timedelta
-        created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-        now = datetime.now(timezone.utc)
+            # Если отклонён — блокировка навсегда
+            if status == 'rejected':
+                return jsonify({
+                    "ok": True, 
+                    "can_respond": False,
+                    "reason": "rejected",
+                    "message": "Ваш запрос был отклонён"
+                })
         
-        if (now - created_dt) < timedelta(hours=24):
-            hours_left = 24 - int((now - created_dt).total_seconds() / 3600)
-            return jsonify({
-                "ok": True,
-                "can_respond": False,
-                "reason": "timeout",
-                "message": f"Повторная отправка через {hours_left} ч",
-                "hours_left": hours_left
-            })
+            # Проверяем таймаут 24 часа
+            from datetime import datetime, timedelta
+            created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            now = datetime.now(timezone.utc)
         
-        # Можно откликнуться
-        return jsonify({"ok": True, "can_respond": True})
+            if (now - created_dt) < timedelta(hours=24):
+                hours_left = 24 - int((now - created_dt).total_seconds() / 3600)
+                return jsonify({
+                    "ok": True,
+                    "can_respond": False,
+                    "reason": "timeout",
+                    "message": f"Повторная отправка через {hours_left} ч",
+                    "hours_left": hours_left
+                })
+        
+            # Можно откликнуться
+            return jsonify({"ok": True, "can_respond": True})
         
     except Exception as e:
         print(f"❌ Error in check_can_respond: {e}")
@@ -958,7 +1398,7 @@ def check_can_respond():
 def respond_post():
     """Создание отклика на пост"""
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
     
@@ -973,83 +1413,73 @@ def respond_post():
         return jsonify({"ok": False, "error": "Message too long (max 200)"}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
         
-        # Получаем пост и автора
-        cursor.execute("""
-            SELECT p.user_id, p.content, p.is_deleted,
-                   pr.first_name as author_name,
-                   pr.is_posts_approval_required
-            FROM posts p
-            JOIN profiles pr ON p.user_id = pr.user_id
-            WHERE p.post_id = ?
-        """, (post_id,))
+            # Получаем пост и автора
+            cursor.execute("""
+                SELECT p.user_id, p.content, p.is_deleted,
+                       pr.first_name as author_name,
+                       pr.is_posts_approval_required
+                FROM posts p
+                JOIN profiles pr ON p.user_id = pr.user_id
+                WHERE p.post_id = ?
+            """, (post_id,))
         
-        post = cursor.fetchone()
+            post = cursor.fetchone()
         
-        if not post:
-            conn.close()
-            return jsonify({"ok": False, "error": "Post not found"}), 404
+            if not post:
+                return jsonify({"ok": False, "error": "Post not found"}), 404
         
-        if post['is_deleted']:
-            conn.close()
-            return jsonify({"ok": False, "error": "Post was deleted"}), 404
+            if post['is_deleted']:
+                return jsonify({"ok": False, "error": "Post was deleted"}), 404
         
-        author_id = post['user_id']
+            author_id = post['user_id']
         
-        # Нельзя откликнуться на свой пост
-        if author_id == user_id:
-            conn.close()
-            return jsonify({"ok": False, "error": "Cannot respond to your own post"}), 400
+            # Нельзя откликнуться на свой пост
+            if author_id == user_id:
+                return jsonify({"ok": False, "error": "Cannot respond to your own post"}), 400
         
-        # Проверяем дубликаты и таймауты
-        cursor.execute("""
-            SELECT status, created_at 
-            FROM response_requests 
-            WHERE post_id = ? AND from_user_id = ?
-            ORDER BY created_at DESC LIMIT 1
-        """, (post_id, user_id))
+            # Проверяем дубликаты и таймауты
+            cursor.execute("""
+                SELECT status, created_at 
+                FROM response_requests 
+                WHERE post_id = ? AND from_user_id = ?
+                ORDER BY created_at DESC LIMIT 1
+            """, (post_id, user_id))
         
-        last_request = cursor.fetchone()
+            last_request = cursor.fetchone()
         
-        if last_request:
-            status = last_request['status']
+            if last_request:
+                status = last_request['status']
             
-            if status == 'rejected':
-                conn.close()
-                return jsonify({"ok": False, "error": "Your request was rejected"}), 403
+                if status == 'rejected':
+                    return jsonify({"ok": False, "error": "Your request was rejected"}), 403
             
-            from datetime import datetime, timedelta
-            created_dt = datetime.fromisoformat(last_request['created_at'].replace('Z', '+00:00'))
-            now = datetime.now(timezone.utc)
+                from datetime import datetime, timedelta
+                created_dt = datetime.fromisoformat(last_request['created_at'].replace('Z', '+00:00'))
+                now = datetime.now(timezone.utc)
             
-            if (now - created_dt) < timedelta(hours=24):
-                conn.close()
-                hours_left = 24 - int((now - created_dt).total_seconds() / 3600)
-                return jsonify({
-                    "ok": False, 
-                    "error": f"Please wait {hours_left} hours before resending"
-                }), 429
+                if (now - created_dt) < timedelta(hours=24):
+                    hours_left = 24 - int((now - created_dt).total_seconds() / 3600)
+                    return jsonify({
+                        "ok": False, 
+                        "error": f"Please wait {hours_left} hours before resending"
+                    }), 429
         
-        # Создаём запрос
-        final_message = message if message else "Пользователь ничего не написал"
+            # Создаём запрос
+            final_message = message if message else "Пользователь ничего не написал"
         
-        cursor.execute("""
+        request_id = db.execute_write("""
             INSERT INTO response_requests (post_id, from_user_id, to_user_id, message, status)
             VALUES (?, ?, ?, ?, 'pending')
-        """, (post_id, user_id, author_id, final_message))
-        
-        request_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
+        """, (post_id, user_id, author_id, final_message)).lastrowid
         
         # Отправляем уведомление автору
         try:
             sender_name = get_user_name_for_bot(user_id)
             post_preview = post['content'][:50] + "..." if len(post['content']) > 50 else post['content']
-            
+        
             bot_handlers.notify_response_request(
                 author_id=author_id,
                 sender_id=user_id,
@@ -1060,13 +1490,11 @@ def respond_post():
             )
         except Exception as e:
             print(f"⚠️ Failed to send notification: {e}")
-        
+    
         return jsonify({"ok": True, "request_id": request_id})
-        
+    
     except Exception as e:
         print(f"❌ Error in respond_post: {e}")
-        if 'conn' in locals() and conn:
-            conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
@@ -1074,7 +1502,7 @@ def respond_post():
 @app.route("/api/delete-post", methods=["POST"])
 def delete_post():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
     
@@ -1083,37 +1511,30 @@ def delete_post():
         return jsonify({"ok": False, "error": "Missing post_id"}), 400
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("SELECT user_id FROM posts WHERE post_id = ?", (post_id,))
-        post = cursor.fetchone()
+            cursor.execute("SELECT user_id FROM posts WHERE post_id = ?", (post_id,))
+            post = cursor.fetchone()
         
-        if not post:
-            conn.close()
-            return jsonify({"ok": False, "error": "Post not found"}), 404
+            if not post:
+                return jsonify({"ok": False, "error": "Post not found"}), 404
         
-        if post['user_id'] != user_id:
-            conn.close()
-            return jsonify({"ok": False, "error": "Not authorized"}), 403
+            if post['user_id'] != user_id:
+                return jsonify({"ok": False, "error": "Not authorized"}), 403
         
         # ✅ ИЗМЕНЕНИЕ: Помечаем как удалённый вместо DELETE
-        cursor.execute("UPDATE posts SET is_deleted = 1 WHERE post_id = ?", (post_id,))
-        
-        conn.commit()
-        conn.close()
+        db.execute_write("UPDATE posts SET is_deleted = 1 WHERE post_id = ? AND user_id = ?", (post_id, user_id))
         
         return jsonify({"ok": True})
         
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/api/save-glass-preference", methods=["POST"])
 def save_glass_preference():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
 
@@ -1124,17 +1545,13 @@ def save_glass_preference():
     glass_value = 1 if is_enabled else 0
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
+        db.execute_write(
             "UPDATE profiles SET is_glass_enabled = ? WHERE user_id = ?",
             (glass_value, user_id)
         )
-        conn.commit()
-        conn.close()
+        PROFILE_CACHE.invalidate(user_id)
         return jsonify({"ok": True})
     except Exception as e:
-        if 'conn' in locals() and conn: conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 # ============ PRIVACY SETTINGS ============
@@ -1143,30 +1560,23 @@ def save_glass_preference():
 def save_direct_messages_privacy():
     """Сохранить настройку 'Закрыть прямые сообщения'"""
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
     
     is_disabled = 1 if data.get("is_disabled") else 0
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        db.execute_write("""
             UPDATE profiles 
             SET is_direct_messages_disabled = ?
             WHERE user_id = ?
         """, (is_disabled, user_id))
-        
-        conn.commit()
-        conn.close()
+        PROFILE_CACHE.invalidate(user_id)
         
         return jsonify({"ok": True})
         
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
@@ -1174,36 +1584,29 @@ def save_direct_messages_privacy():
 def save_posts_approval_privacy():
     """Сохранить настройку 'Требовать одобрение откликов'"""
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id:
         return jsonify({"ok": False, "error": "Invalid data"}), 403
     
     is_required = 1 if data.get("is_required") else 0
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        db.execute_write("""
             UPDATE profiles 
             SET is_posts_approval_required = ?
             WHERE user_id = ?
         """, (is_required, user_id))
-        
-        conn.commit()
-        conn.close()
+        PROFILE_CACHE.invalidate(user_id)
         
         return jsonify({"ok": True})
         
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @app.route("/api/set-status", methods=["POST"])
 def set_status():
     data = request.json
-    user_id = validate_init_data(data.get("initData"), BOT_TOKEN)
+    user_id = authenticate_request(data)
     if not user_id: return jsonify({"ok": False, "error": "Invalid data"}), 403
 
     new_status = data.get("status")
@@ -1213,11 +1616,39 @@ def set_status():
         return jsonify({"ok": False, "error": "Invalid status"}), 400
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE profiles SET status = ? WHERE user_id = ?", (new_status, user_id))
-        conn.commit()
-        conn.close()
+        db.execute_write("UPDATE profiles SET status = ? WHERE user_id = ?", (new_status, user_id))
+        PROFILE_CACHE.invalidate(user_id)
+        return jsonify({"ok": True})
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+# ============ NOTIFICATION SETTINGS ============
+
+@app.route("/api/save-notification-settings", methods=["POST"])
+def save_notification_settings():
+    """Режимы уведомлений в Telegram: follow_alerts / skill_match_alerts (см. digests.DIGEST_MODES)"""
+    data = request.json
+    user_id = authenticate_request(data)
+    if not user_id:
+        return jsonify({"ok": False, "error": "Invalid data"}), 403
+
+    updates = {}
+    for kind, column in digests.PREFERENCE_COLUMNS.items():
+        mode = data.get(column)
+        if mode is None:
+            continue
+        if mode not in digests.DIGEST_MODES:
+            return jsonify({"ok": False, "error": f"Invalid {column} value"}), 400
+        updates[column] = mode
+    if not updates:
+        return jsonify({"ok": False, "error": "No settings provided"}), 400
+
+    try:
+        db.execute_write(
+            "UPDATE profiles SET " + ", ".join(f"{column} = ?" for column in updates) + " WHERE user_id = ?",
+            (*updates.values(), user_id)
+        )
+        PROFILE_CACHE.invalidate(user_id)
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
@@ -1227,6 +1658,12 @@ if __name__ == '__main__':
     print("🚀 ЗАПУСК СЕРВЕРА + БОТА")
     print("="*50)
 
+    # Доводим схему БД до актуальной версии до первого запроса
+    migrations.migrate(db.DB_NAME)
+
+    # Отправка уведомлений — после миграций (таблица notification_outbox)
+    start_background_workers()
+
     def run_bot():
         import asyncio
         
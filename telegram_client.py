@@ -0,0 +1,159 @@
+# telegram_client.py
+#
+# Единый клиент Bot API для HTTP-вызовов бэкенда (getChat, отправка из outbox).
+# Один requests.Session на процесс: keep-alive пул соединений вместо нового
+# TCP+TLS на каждый вызов. Таймауты по умолчанию, повторы при обрыве
+# соединения и 5xx, ожидание retry_after на 429 (если оно короткое) и
+# счётчики по методам (вызовы, ошибки, повторы, задержка).
+#
+# Адрес API задаётся TELEGRAM_API_URL — для проверки на локальной заглушке.
+# aiogram-бот (команды, callback'и) ходит в API своим клиентом.
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import db
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", 16))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", 3.05))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", 10.0))
+TELEGRAM_RETRIES = int(os.getenv("TELEGRAM_RETRIES", 2))
+# Дольше этого на 429 не ждём внутри вызова — ошибка уходит вызывающему
+TELEGRAM_MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", 5.0))
+
+
+class TelegramError(Exception):
+    """Ошибка Bot API: HTTP-статус, описание и retry_after (для 429)"""
+
+    def __init__(self, status, description, retry_after=None):
+        super().__init__(f"{status}: {description}")
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status == 429 or self.status >= 500
+
+
+class _MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.latency = db.LatencyStats()
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "latency": self.latency.stats(),
+        }
+
+
+class TelegramClient:
+    """
+    call(method, payload) -> result из ответа Bot API.
+    Бросает TelegramError (ответ API с ok=false) или requests.RequestException (сеть).
+    retries=0 — без повторов внутри вызова (outbox повторяет сам, со своей очередью).
+    """
+
+    def __init__(self, bot_token, base_url: str = TELEGRAM_API_URL, pool_size: int = TELEGRAM_POOL_SIZE,
+                 timeout=(TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT), retries: int = TELEGRAM_RETRIES,
+                 max_retry_after: float = TELEGRAM_MAX_RETRY_AFTER):
+        self._base_url = f"{base_url.rstrip('/')}/bot{bot_token}"
+        self._timeout = timeout
+        self._retries = retries
+        self._max_retry_after = max_retry_after
+        self._pool_size = pool_size
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def _stats_for(self, method):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = _MethodStats()
+            return stats
+
+    def call(self, method, payload=None, timeout=None, retries=None):
+        stats = self._stats_for(method)
+        retries = self._retries if retries is None else retries
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                return self._request(method, payload, timeout or self._timeout)
+            except TelegramError as e:
+                if e.status == 429:
+                    with self._lock:
+                        stats.rate_limited += 1
+                delay = self._retry_delay(e, attempt, retries)
+                if delay is None:
+                    with self._lock:
+                        stats.errors += 1
+                    raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # ReadTimeout не повторяем: запрос мог дойти, и сообщение ушло бы дважды
+                if attempt >= retries or isinstance(e, requests.ReadTimeout):
+                    with self._lock:
+                        stats.errors += 1
+                    raise
+                delay = self._backoff(attempt)
+            finally:
+                stats.latency.add(time.perf_counter() - started)
+                with self._lock:
+                    stats.calls += 1
+            with self._lock:
+                stats.retries += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def _request(self, method, payload, timeout):
+        response = self._session.post(f"{self._base_url}/{method}", json=payload or {}, timeout=timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.ok and body.get("ok"):
+            return body.get("result")
+        raise TelegramError(
+            response.status_code,
+            body.get("description") or response.text[:200],
+            (body.get("parameters") or {}).get("retry_after"),
+        )
+
+    def _retry_delay(self, error, attempt, retries):
+        """Сколько ждать перед повтором; None — не повторять"""
+        if attempt >= retries or not error.retryable:
+            return None
+        if error.status == 429:
+            if error.retry_after and error.retry_after > self._max_retry_after:
+                return None
+            return error.retry_after or self._backoff(attempt)
+        return self._backoff(attempt)
+
+    @staticmethod
+    def _backoff(attempt):
+        return random.uniform(0.25, 0.5) * 2 ** attempt
+
+    def stats(self):
+        with self._lock:
+            methods = dict(self._methods)
+            return {
+                "pool_size": self._pool_size,
+                "methods": {name: stats.as_dict() for name, stats in methods.items()},
+            }
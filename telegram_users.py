@@ -0,0 +1,114 @@
+# telegram_users.py
+#
+# Данные чатов Telegram (username, first_name) для /get-telegram-user-info.
+# Источники по порядку: этот кэш -> profiles.telegram_username (обновляется из
+# initData при входе пользователя) -> getChat. Одновременные запросы про одного
+# пользователя ждут один общий вызов загрузчика; неудачи тоже кэшируются,
+# но на короткий срок.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+TELEGRAM_USER_CACHE_SIZE = int(os.getenv("TELEGRAM_USER_CACHE_SIZE", 10000))
+TELEGRAM_USER_CACHE_TTL = int(os.getenv("TELEGRAM_USER_CACHE_TTL", 3600))
+TELEGRAM_USER_NEGATIVE_TTL = int(os.getenv("TELEGRAM_USER_NEGATIVE_TTL", 300))
+# Сколько ждущий запрос ждёт чужую загрузку
+TELEGRAM_USER_WAIT_TIMEOUT = float(os.getenv("TELEGRAM_USER_WAIT_TIMEOUT", 10.0))
+
+
+class ChatInfoCache:
+    """
+    get_or_load(user_id, loader) — {"username", "first_name"} или None (неизвестно / ошибка).
+    Исключение из loader() кэшируется как None на negative_ttl.
+    prime(user_id, info) — свежие данные без загрузки (из проверенной initData).
+    """
+
+    def __init__(self, max_size: int = TELEGRAM_USER_CACHE_SIZE, ttl: int = TELEGRAM_USER_CACHE_TTL,
+                 negative_ttl: int = TELEGRAM_USER_NEGATIVE_TTL, wait_timeout: float = TELEGRAM_USER_WAIT_TIMEOUT):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._wait_timeout = wait_timeout
+        self._cache = OrderedDict()  # user_id -> (info | None, expires_at)
+        self._loading = {}  # user_id -> Future загрузки, которую ждут остальные
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.primed = 0
+
+    def _store(self, user_id, info, now):
+        if self._max_size <= 0:
+            return
+        self._cache[user_id] = (info, now + (self._ttl if info is not None else self._negative_ttl))
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+    def get_or_load(self, user_id, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None:
+                info, expires_at = entry
+                if expires_at > now:
+                    self._cache.move_to_end(user_id)
+                    if info is None:
+                        self.negative_hits += 1
+                        return None
+                    self.hits += 1
+                    return dict(info)
+                del self._cache[user_id]
+            future = self._loading.get(user_id)
+            leader = future is None
+            if leader:
+                future = self._loading[user_id] = Future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                info = future.result(timeout=self._wait_timeout)
+            except Exception:
+                return None
+            return dict(info) if info is not None else None
+
+        info = None
+        try:
+            info = loader()
+        except Exception as e:
+            print(f"⚠️ Не удалось получить данные чата {user_id}: {e}")
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._loading.pop(user_id, None)
+                self._store(user_id, info, time.monotonic())
+            future.set_result(info)
+        return dict(info) if info is not None else None
+
+    def prime(self, user_id, info):
+        with self._lock:
+            self._store(user_id, dict(info), time.monotonic())
+            self.primed += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.negative_hits + self.misses + self.coalesced
+            return {
+                "size": len(self._cache),
+                "max_size": self._max_size,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "primed": self.primed,
+                "hit_rate": round((self.hits + self.negative_hits) / total, 4) if total else 0.0,
+            }
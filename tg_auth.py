@@ -0,0 +1,190 @@
+# tg_auth.py
+#
+# Проверка initData от Telegram WebApp.
+# Секретный ключ WebAppData вычисляется один раз при старте,
+# а уже проверенные initData кэшируются по полученному hash (LRU + TTL от auth_date).
+# После /api/auth клиент ходит с коротким подписанным токеном сессии (SessionTokenSigner).
+
+import base64
+import hmac
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote
+
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", 10000))
+# Сколько секунд после auth_date запись считается валидной в кэше
+INIT_DATA_CACHE_TTL = int(os.getenv("INIT_DATA_CACHE_TTL", 24 * 3600))
+
+
+def derive_secret_key(bot_token: str) -> bytes:
+    return hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
+
+
+def parse_init_data(init_data: str):
+    """Разбирает initData: возвращает (hash, данные без hash, user dict)"""
+    parsed_data = dict(item.split("=", 1) for item in init_data.split("&"))
+    received_hash = parsed_data.pop("hash")
+    user_data = json.loads(unquote(parsed_data.get("user", "{}")))
+    return received_hash, parsed_data, user_data
+
+
+def extract_hash(init_data: str):
+    """Быстро достаёт значение hash, не разбирая всю строку"""
+    if init_data.startswith("hash="):
+        start = 5
+    else:
+        idx = init_data.find("&hash=")
+        if idx < 0:
+            return None
+        start = idx + 6
+    end = init_data.find("&", start)
+    return init_data[start:] if end < 0 else init_data[start:end]
+
+
+class InitDataVerifier:
+    """
+    Проверяет подпись initData и кэширует результат.
+    Ключ кэша — hash из initData; сама строка initData хранится рядом
+    и сравнивается целиком, так что подменить user при известном hash нельзя.
+    on_verified(user) вызывается один раз на каждую новую проверенную initData.
+    """
+
+    def __init__(self, bot_token: str, max_size: int = INIT_DATA_CACHE_SIZE, ttl: int = INIT_DATA_CACHE_TTL,
+                 on_verified=None):
+        self._secret_key = derive_secret_key(bot_token)
+        self._on_verified = on_verified
+        self._max_size = max_size
+        self._ttl = ttl
+        self._cache = OrderedDict()  # hash -> (init_data, user, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, init_data: str, now: float):
+        received_hash = extract_hash(init_data)
+        if not received_hash:
+            return None
+        with self._lock:
+            entry = self._cache.get(received_hash)
+            if entry is None:
+                return None
+            cached_init_data, user, expires_at = entry
+            if expires_at <= now:
+                del self._cache[received_hash]
+                return None
+            if cached_init_data != init_data:
+                return None
+            self._cache.move_to_end(received_hash)
+            self.hits += 1
+            return user
+
+    def _store(self, received_hash: str, init_data: str, user: dict, auth_date, now: float):
+        try:
+            expires_at = int(auth_date) + self._ttl
+        except (TypeError, ValueError):
+            expires_at = now + self._ttl
+        if expires_at <= now or self._max_size <= 0:
+            return
+        with self._lock:
+            self._cache[received_hash] = (init_data, user, expires_at)
+            self._cache.move_to_end(received_hash)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def verify(self, init_data: str):
+        """Возвращает user dict из initData, если подпись верна, иначе None"""
+        if not init_data:
+            return None
+        now = time.time()
+        user = self._lookup(init_data, now)
+        if user is not None:
+            return user
+        try:
+            received_hash, parsed_data, user = parse_init_data(init_data)
+            data_check_string = "\n".join(f"{key}={unquote(value)}" for key, value in sorted(parsed_data.items()))
+            calculated_hash = hmac.new(self._secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(calculated_hash, received_hash):
+                return None
+        except Exception:
+            return None
+        with self._lock:
+            self.misses += 1
+        self._store(received_hash, init_data, user, parsed_data.get("auth_date"), now)
+        if self._on_verified is not None:
+            try:
+                self._on_verified(user)
+            except Exception as e:
+                print(f"⚠️ Ошибка обработки initData пользователя {user.get('id')}: {e}")
+        return user
+
+    def get_user_id(self, init_data: str):
+        user = self.verify(init_data)
+        return user.get("id") if user else None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "max_size": self._max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+# ============ SESSION TOKENS ============
+
+SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", 3600))
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+class SessionTokenSigner:
+    """
+    Короткоживущий токен сессии вида "<user_id>.<exp>.<sig>".
+    Подпись — HMAC-SHA256 (первые 16 байт) на ключе, выведенном из токена бота,
+    поэтому проверка — один HMAC над строкой фиксированной длины.
+    """
+
+    def __init__(self, bot_token: str, ttl: int = SESSION_TOKEN_TTL):
+        self._key = hmac.new("SessionToken".encode(), bot_token.encode(), hashlib.sha256).digest()
+        self.ttl = ttl
+
+    def _sign(self, body: str) -> str:
+        return _b64(hmac.new(self._key, body.encode(), hashlib.sha256).digest()[:16])
+
+    def issue(self, user_id: int):
+        """Возвращает (token, expires_at)"""
+        expires_at = int(time.time()) + self.ttl
+        body = f"{int(user_id)}.{expires_at}"
+        return f"{body}.{self._sign(body)}", expires_at
+
+    def verify(self, token: str):
+        """Возвращает user_id, если токен подписан нами и не истёк, иначе None"""
+        if not token or len(token) > 128:
+            return None
+        try:
+            user_id, expires_at, signature = token.split(".")
+            if not hmac.compare_digest(signature, self._sign(f"{user_id}.{expires_at}")):
+                return None
+            if int(expires_at) <= time.time():
+                return None
+            return int(user_id)
+        except ValueError:
+            return None
+
+
+def extract_bearer(header_value: str):
+    if header_value and header_value.startswith("Bearer "):
+        return header_value[7:].strip()
+    return None
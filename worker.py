@@ -0,0 +1,37 @@
+# worker.py
+#
+# Фоновые отправщики уведомлений (outbox, рассылки, дайджесты) отдельным
+# процессом — для запуска приложения под WSGI-сервером:
+#
+#   gunicorn server:app ...   # HTTP; воркеры при импорте server.py не стартуют
+#   python worker.py          # ОБЯЗАТЕЛЬНО рядом и ровно один на базу
+#
+# При `python server.py` (Flask + бот в одном процессе) отправщики запускаются
+# там же, worker.py не нужен. Сообщения из HTTP-процесса подхватываются по
+# таймеру опроса (OUTBOX_POLL_INTERVAL, BROADCAST_POLL_INTERVAL): wake()
+# будит только потоки своего процесса.
+
+import signal
+import threading
+
+import db
+import migrations
+import server
+
+
+def main():
+    print("🚀 Запуск фоновых отправщиков")
+    migrations.migrate(db.DB_NAME)
+    server.start_background_workers()
+
+    stopping = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.set())
+    stopping.wait()
+
+    print("🛑 Остановка фоновых отправщиков")
+    server.stop_background_workers()
+
+
+if __name__ == '__main__':
+    main()